@@ -1,29 +1,47 @@
 from flask import Blueprint, jsonify, request
-from auth import token_required, admin_required
+from auth import token_required, admin_required, user_cache
 from app import get_db_connection
+from products import (image_etag_cache, image_product_cache, invalidate_listing,
+                      product_status_cache, set_cached_product_status)
+from messaging import sender_username_cache, unread_count_cache
+from categories import adjust_category_counts, category_cache
+from jobs import queue as job_queue
+from mailer import outbox
+from passwords import hasher
+from response_cache import response_cache
+from query_profiler import profiler
+from pagination import InvalidCursor, Keyset, apply_page, page_request, page_response, split_page
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+PENDING_KEYSET = Keyset(('p.created_at', 'created_at'), ('p.product_id', 'product_id'))
+REPORTS_KEYSET = Keyset(('r.report_id', 'report_id'))
+
 # Get pending products for approval
 @admin_bp.route('/products/pending', methods=['GET'])
 @admin_required
 def get_pending_products(current_user):
+    try:
+        limit, cursor_values = page_request(request.args, PENDING_KEYSET)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     
-    cursor.execute("""
+    query, params = apply_page("""
         SELECT p.*, u.username as seller_username
         FROM products p
         JOIN users u ON p.user_id = u.user_id
         WHERE p.approval_status = 'pending'
-        ORDER BY p.created_at DESC
-    """)
+    """, (), PENDING_KEYSET, cursor_values, limit)
+    cursor.execute(query, params)
     
-    products = cursor.fetchall()
+    products, next_cursor = split_page(cursor.fetchall(), PENDING_KEYSET, limit)
     cursor.close()
     conn.close()
     
-    return jsonify(products)
+    return page_response(products, next_cursor)
 
 # Approve or reject a product
 @admin_bp.route('/products/<int:product_id>/moderate', methods=['PUT'])
@@ -40,9 +58,11 @@ def moderate_product(current_user, product_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Update the product approval status
+    # Update the product approval status, moving it in or out of its category's count
+    adjust_category_counts(cursor, -1, 'product_id = %s', (product_id,))
     cursor.execute("UPDATE products SET approval_status = %s WHERE product_id = %s", 
                (data['status'], product_id))
+    adjust_category_counts(cursor, 1, 'product_id = %s', (product_id,))
     
     # Log the admin action
     cursor.execute("""
@@ -58,6 +78,8 @@ def moderate_product(current_user, product_id):
     conn.commit()
     cursor.close()
     conn.close()
+    set_cached_product_status(product_id, data['status'])
+    invalidate_listing(product_id)
     
     return jsonify({'message': f'Product {data["status"]} successfully'})
 
@@ -66,6 +88,10 @@ def moderate_product(current_user, product_id):
 @admin_required
 def get_reports(current_user):
     status = request.args.get('status', 'all')
+    try:
+        limit, cursor_values = page_request(request.args, REPORTS_KEYSET)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
@@ -76,18 +102,20 @@ def get_reports(current_user):
         JOIN users u ON r.reporter_id = u.user_id
         JOIN products p ON r.product_id = p.product_id
     """
+    params = ()
     
     if status != 'all':
         query += " WHERE r.status = %s"
-        cursor.execute(query, (status,))
-    else:
-        cursor.execute(query)
+        params = (status,)
+    
+    query, params = apply_page(query, params, REPORTS_KEYSET, cursor_values, limit, has_where=bool(params))
+    cursor.execute(query, params)
     
-    reports = cursor.fetchall()
+    reports, next_cursor = split_page(cursor.fetchall(), REPORTS_KEYSET, limit)
     cursor.close()
     conn.close()
     
-    return jsonify(reports)
+    return page_response(reports, next_cursor)
 
 # Update report status
 @admin_bp.route('/reports/<int:report_id>', methods=['PUT'])
@@ -172,4 +200,54 @@ def get_dashboard_stats(current_user):
     cursor.close()
     conn.close()
     
-    return jsonify(stats)
\ No newline at end of file
+    return jsonify(stats)
+
+# Background job queue visibility
+@admin_bp.route('/jobs', methods=['GET'])
+@admin_required
+def get_job_stats(current_user):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    # Persisted totals across all workers; live counters are for this worker only
+    cursor.execute("""
+        SELECT job_type, status, COUNT(*) as count, MIN(created_at) as oldest
+        FROM background_jobs
+        GROUP BY job_type, status
+    """)
+    persisted = cursor.fetchall()
+
+    cursor.close()
+    conn.close()
+
+    return jsonify({'persisted': persisted, 'worker': job_queue.stats(), 'mail': outbox.stats(),
+                    'passwords': hasher.stats()})
+
+
+# Cache hit ratios for this worker
+@admin_bp.route('/cache', methods=['GET'])
+@admin_required
+def get_cache_stats(current_user):
+    return jsonify({
+        'responses': response_cache.stats(),
+        'auth_users': user_cache.stats(),
+        'image_products': image_product_cache.stats(),
+        'product_status': product_status_cache.stats(),
+        'image_etags': image_etag_cache.stats(),
+        'categories': category_cache.stats(),
+        'unread_counts': unread_count_cache.stats(),
+        'sender_usernames': sender_username_cache.stats(),
+    })
+
+
+# Request and query timings per route for this worker
+@admin_bp.route('/perf', methods=['GET'])
+@admin_required
+def get_perf_stats(current_user):
+    return jsonify(profiler.stats(top=request.args.get('top', 20, type=int)))
+
+@admin_bp.route('/perf', methods=['DELETE'])
+@admin_required
+def reset_perf_stats(current_user):
+    profiler.reset()
+    return jsonify({'message': 'Performance stats reset'})
@@ -1,11 +1,15 @@
-from flask import Flask
+from flask import Flask, g, has_request_context
 from flask_cors import CORS
 from flask import send_from_directory
 from dotenv import load_dotenv
 import mysql.connector
 import os
+from functools import partial
 from flask_apscheduler import APScheduler
 from flask import jsonify
+from db_pool import ConnectionPool, PoolTimeout
+from query_profiler import profiler
+from metrics import metrics
 
 
 load_dotenv()
@@ -18,7 +22,7 @@ CORS(app,
          "origins": ["http://localhost:5173", "https://csc648g1.me"],
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
          "allow_headers": ["Authorization", "Content-Type"],
-         "expose_headers": ["Content-Type", "Authorization"],
+         "expose_headers": ["Content-Type", "Authorization", "X-Next-Cursor", "X-Original-Content-Length"],
          "supports_credentials": True,
          "max_age": 3600
      }})
@@ -27,18 +31,87 @@ from flask_jwt_extended import JWTManager
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'your-secret-key')
 jwt = JWTManager(app)
 
+# Cap whole request bodies. Werkzeug spools multipart files over 500 KB to
+# temporary files, so uploads up to this size never sit in worker memory.
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': 'Upload too large'}), 413
+
+# One pool per gunicorn worker process. Keep DB_POOL_SIZE * workers below
+# MySQL's max_connections (10 in compose.yaml).
+db_pool = ConnectionPool(
+    partial(
+        mysql.connector.connect,
+        host=os.getenv('MYSQL_HOST'),
+        user=os.getenv('MYSQL_USER'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DATABASE')
+    ),
+    size=int(os.getenv('DB_POOL_SIZE', 4)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', 30)),
+    recycle=float(os.getenv('DB_POOL_RECYCLE', 3600))
+)
+
 def get_db_connection():
+    """Borrow a pooled connection.
+
+    Inside a request the same connection is handed out on every call
+    (token_required and the handler share it) and goes back to the pool
+    when the request ends. Outside a request the caller owns it and
+    close() returns it to the pool. Either way its cursors are timed by
+    query_profiler.
+    """
     try:
-        return mysql.connector.connect(
-            host=os.getenv('MYSQL_HOST'),  
-            user=os.getenv('MYSQL_USER'),
-            password=os.getenv('MYSQL_PASSWORD'),
-            database=os.getenv('MYSQL_DATABASE')
-        )
-    except mysql.connector.Error as err:
+        if not has_request_context():
+            return profiler.wrap(db_pool.acquire())
+        if 'db_conn' not in g:
+            g.db_conn = profiler.wrap(db_pool.acquire(request_scoped=True))
+        return g.db_conn
+    except (mysql.connector.Error, PoolTimeout) as err:
         print(f"Database connection error: {err}")
         return None
 
+# Query counts, DB time and Server-Timing per request; see /admin/perf
+profiler.init_app(app)
+
+# Latency histograms, in-flight requests and app stats for Prometheus at /metrics
+metrics.init_app(app)
+
+@app.teardown_request
+def release_db_connection(exc=None):
+    """Return the request's connection to the pool; long-running handlers may call it early"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+# Background jobs register themselves with @scheduler.task(...) in their
+# blueprint modules; the scheduler is started once all blueprints are imported
+scheduler = APScheduler()
+
+def start_scheduler():
+    """Start APScheduler in a single process per host.
+
+    Every gunicorn worker imports this module, so an exclusive lock file
+    decides which one runs the jobs; the others skip starting it.
+    """
+    if os.getenv('SCHEDULER_ENABLED', '1') != '1':
+        return False
+    try:
+        import fcntl
+        lock = open(os.getenv('SCHEDULER_LOCK_FILE', '/tmp/gator-market-scheduler.lock'), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        app.scheduler_lock = lock  # held for the life of the process
+    except ImportError:
+        pass  # no fcntl (Windows dev machines): single process anyway
+    except OSError:
+        return False
+    scheduler.init_app(app)
+    scheduler.start()
+    return True
+
 # Register product routes
 from products import products_bp
 app.register_blueprint(products_bp)
@@ -78,5 +151,10 @@ app.register_blueprint(wishlist_bp)
 from report import report_bp
 app.register_blueprint(report_bp)
 
+# A preloading gunicorn (gunicorn.conf.py) imports this module once in the
+# master; its post_fork hook starts the scheduler in a worker instead
+if os.getenv('GUNICORN_PRELOAD') != '1':
+    start_scheduler()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -1,17 +1,42 @@
 from flask import Blueprint, jsonify, request
-import bcrypt
 import jwt
 import datetime
 from functools import wraps
 import os
 import uuid
-from app import get_db_connection
+from app import get_db_connection, release_db_connection
+from batch_loaders import attach_seller_ratings, seller_rating
+from cache import TTLCache
+from jobs import enqueue
+from pagination import InvalidCursor, Keyset, apply_page, page_request, page_response, split_page
+from passwords import HasherBusy, hasher
+from response_cache import cached_response, invalidate_responses
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 
+USERS_KEYSET = Keyset(('user_id', 'user_id'), descending=False)
+
+# Columns protected handlers read from current_user; never the password hash
+AUTH_USER_COLUMNS = (
+    'user_id', 'username', 'email', 'first_name', 'last_name', 'user_role',
+    'account_status', 'verification_status', 'profile_picture_url',
+    'date_joined', 'last_login'
+)
+
+# Per-worker cache of AUTH_USER_COLUMNS rows by user_id. Writes that change
+# these columns call invalidate_auth_user(); the TTL bounds staleness in the
+# other workers.
+user_cache = TTLCache(
+    maxsize=int(os.getenv('AUTH_USER_CACHE_SIZE', 2048)),
+    ttl=float(os.getenv('AUTH_USER_CACHE_TTL', 30))
+)
+
+# Public profiles are served from response_cache, dropped by invalidate_auth_user()
+USER_RESPONSE_TTL = float(os.getenv('USER_RESPONSE_TTL', 60))
+
 def generate_token(user_id, username, user_role):
     """Generate a JWT token with unique identifier"""
     payload = {
@@ -24,6 +49,30 @@ def generate_token(user_id, username, user_role):
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def load_auth_user(user_id):
+    """Return the auth columns for user_id, from user_cache when possible"""
+    user = user_cache.get(user_id)
+    if user is None:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            f"SELECT {', '.join(AUTH_USER_COLUMNS)} FROM users WHERE user_id = %s", (user_id,)
+        )
+        user = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if not user:
+            return None
+        user_cache.set(user_id, user)
+    return dict(user)
+
+def invalidate_auth_user(*user_ids):
+    """Drop cached auth rows and public profiles after a write to those users"""
+    for user_id in user_ids:
+        user_cache.delete(user_id)
+    if user_ids:
+        invalidate_responses(*(f'user:{user_id}' for user_id in user_ids))
+
 def token_required(f):
     """Decorator to require valid JWT token"""
     @wraps(f)
@@ -46,13 +95,8 @@ def token_required(f):
             # Decode the token
             data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
             
-            # Get user from database
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE user_id = %s", (data['sub'],))
-            current_user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            # Get user from cache or database
+            current_user = load_auth_user(data['sub'])
             
             if not current_user:
                 return jsonify({'error': 'User not found', 'code': 'USER_NOT_FOUND'}), 401
@@ -125,7 +169,10 @@ def register():
             return jsonify({'errors': validation_errors}), 400
         
         # Hash password
-        password_hash = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        try:
+            password_hash = hasher.hash_password(data['password'])
+        except HasherBusy:
+            return hasher_busy_response()
         
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -136,7 +183,7 @@ def register():
                 VALUES (%s, %s, %s, %s, %s)
             """, (
                 data['username'],
-                password_hash.decode('utf-8'),
+                password_hash,
                 data['email'],
                 data['first_name'],
                 data['last_name']
@@ -166,6 +213,21 @@ def register():
     except Exception as e:
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
 
+def hasher_busy_response():
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def rehashed_password(user, password):
+    """New hash for a password stored at an old work factor, while we have the plaintext"""
+    if not hasher.needs_rehash(user['password_hash']):
+        return None
+    try:
+        return hasher.hash_password(password)
+    except HasherBusy:
+        return None  # not worth failing a login over; try again next time
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     """Login user and return JWT token"""
@@ -180,60 +242,75 @@ def login():
         
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        
         try:
             # Get user by username
             cursor.execute("SELECT * FROM users WHERE username = %s", (data['username'],))
             user = cursor.fetchone()
+        finally:
+            cursor.close()
+        # bcrypt can take up to HASH_TIMEOUT; don't keep one of the worker's
+        # few pooled connections checked out meanwhile
+        release_db_connection()
             
-            if not user:
-                return jsonify({'error': 'Invalid credentials'}), 401
-            
-            # Check account status
-            if user.get('account_status') != 'active':
-                return jsonify({'error': 'Account is not active'}), 401
-            
-            # Verify password
-            if not bcrypt.checkpw(data['password'].encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if not user:
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        # Check account status
+        if user.get('account_status') != 'active':
+            return jsonify({'error': 'Account is not active'}), 401
+        
+        # Verify password
+        try:
+            if not hasher.check_password(data['password'], user['password_hash']):
                 return jsonify({'error': 'Invalid credentials'}), 401
-            
-            # Check verification status AFTER password verification
-            # This ensures we don't reveal if an account exists when providing verification errors
-            if user.get('verification_status') != 'verified':
-                return jsonify({
-                    'error': 'Your email is not verified. Please check your email for verification link.',
-                    'unverified_email': user['email']
-                }), 403
-            
-            # Update last login
-            update_cursor = conn.cursor()
-            update_cursor.execute(
+        except HasherBusy:
+            return hasher_busy_response()
+        
+        # Check verification status AFTER password verification
+        # This ensures we don't reveal if an account exists when providing verification errors
+        if user.get('verification_status') != 'verified':
+            return jsonify({
+                'error': 'Your email is not verified. Please check your email for verification link.',
+                'unverified_email': user['email']
+            }), 403
+        
+        password_hash = rehashed_password(user, data['password'])
+
+        # Update last login
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
                 "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s", 
                 (user['user_id'],)
             )
+            if password_hash:
+                cursor.execute(
+                    "UPDATE users SET password_hash = %s WHERE user_id = %s",
+                    (password_hash, user['user_id'])
+                )
             conn.commit()
-            update_cursor.close()
-            
-            # Generate token
-            token = generate_token(user['user_id'], user['username'], user['user_role'])
-            
-            return jsonify({
-                'message': 'Login successful',
-                'user': {
-                    'user_id': user['user_id'],
-                    'username': user['username'],
-                    'email': user['email'],
-                    'first_name': user['first_name'],
-                    'last_name': user['last_name'],
-                    'role': user['user_role'],
-                    'verification_status': 'verified'
-                },
-                'token': token
-            }), 200
-            
         finally:
             cursor.close()
             conn.close()
+        invalidate_auth_user(user['user_id'])
+        
+        # Generate token
+        token = generate_token(user['user_id'], user['username'], user['user_role'])
+        
+        return jsonify({
+            'message': 'Login successful',
+            'user': {
+                'user_id': user['user_id'],
+                'username': user['username'],
+                'email': user['email'],
+                'first_name': user['first_name'],
+                'last_name': user['last_name'],
+                'role': user['user_role'],
+                'verification_status': 'verified'
+            },
+            'token': token
+        }), 200
             
     except Exception as e:
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
@@ -367,10 +444,18 @@ def logout(current_user):
 @auth_bp.route('/users', methods=['GET'])
 @admin_required
 def get_all_users(current_user):
+    try:
+        limit, cursor_values = page_request(request.args, USERS_KEYSET)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT user_id, username, email, first_name, last_name, verification_status, date_joined, last_login, user_role, account_status FROM users")
-    users = cursor.fetchall()
+    query, params = apply_page(
+        "SELECT user_id, username, email, first_name, last_name, verification_status, date_joined, last_login, user_role, account_status FROM users",
+        (), USERS_KEYSET, cursor_values, limit, has_where=False
+    )
+    cursor.execute(query, params)
+    users, next_cursor = split_page(cursor.fetchall(), USERS_KEYSET, limit)
     for user in users:
         if isinstance(user['date_joined'], datetime.datetime):
             user['date_joined'] = user['date_joined'].isoformat()
@@ -378,7 +463,7 @@ def get_all_users(current_user):
             user['last_login'] = user['last_login'].isoformat()
     cursor.close()
     conn.close()
-    return jsonify(users)
+    return page_response(users, next_cursor)
 
 @auth_bp.route('/users/<int:user_id>/role', methods=['PUT'])
 @admin_required
@@ -394,6 +479,7 @@ def update_user_role(current_user, user_id):
         VALUES (%s, %s, %s, %s)
     """, (current_user['user_id'], "update_user_role", f"user_{user_id}", f"Changed user role to {data['role']}"))
     conn.commit()
+    invalidate_auth_user(user_id)
     cursor.close()
     conn.close()
     return jsonify({'message': 'User role updated successfully'})
@@ -412,16 +498,24 @@ def update_user_status(current_user, user_id):
         VALUES (%s, %s, %s, %s)
     """, (current_user['user_id'], "update_user_status", f"user_{user_id}", f"Changed user status to {data['status']}"))
     conn.commit()
+    invalidate_auth_user(user_id)
     cursor.close()
     conn.close()
     return jsonify({'message': 'User status updated successfully'})
 
 @auth_bp.route('/users/<int:user_id>', methods=['GET'])
+@cached_response('user_profile', ttl=USER_RESPONSE_TTL,
+                 tags=lambda user_id: [f'user:{user_id}', f'seller:{user_id}'])
 def get_user_by_id(user_id):
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+    cursor.execute("""
+        SELECT u.*, s.rating_sum, s.rating_count
+        FROM users u
+        LEFT JOIN seller_stats s ON s.seller_id = u.user_id
+        WHERE u.user_id = %s
+    """, (user_id,))
     user = cursor.fetchone()
 
     cursor.close()
@@ -441,7 +535,7 @@ def get_user_by_id(user_id):
         'date_joined': user['date_joined'].isoformat() if user['date_joined'] else None,
         'last_login': user['last_login'].isoformat() if user['last_login'] else None,
         'user_role': user['user_role'],
-        'rating': float(user.get('rating', 0.0))
+        'rating': seller_rating(user['rating_sum'], user['rating_count'])
     }
 
     return jsonify(profile)
@@ -548,8 +642,7 @@ def get_bookmarks(current_user):
         
         # Get bookmarked products with details
         cursor.execute("""
-            SELECT p.*, u.username,
-                   (SELECT AVG(rating) FROM reviews WHERE seller_id = p.user_id) as seller_rating
+            SELECT p.*, u.username
             FROM products p
             JOIN users u ON p.user_id = u.user_id
             WHERE JSON_CONTAINS(
@@ -562,12 +655,7 @@ def get_bookmarks(current_user):
         
         products = cursor.fetchall()
         
-        # Format ratings for each product
-        for product in products:
-            if product['seller_rating'] is not None:
-                product['seller_rating'] = float(product['seller_rating'])
-            else:
-                product['seller_rating'] = 0.0
+        attach_seller_ratings(cursor, products)
         
         cursor.close()
         conn.close()
@@ -619,48 +707,27 @@ def verified_user_required(f):
 @auth_bp.route('/cleanup-unverified', methods=['POST'])
 @admin_required
 def cleanup_unverified_users(current_user):
-    """Delete unverified users older than 24 hours"""
+    """Queue the purge of unverified users older than 24 hours"""
     try:
+        # The purge itself runs in batches on the job queue (see email_verification)
+        enqueue('purge_expired_accounts')
+
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Find unverified users older than 24 hours
+        cursor = conn.cursor()
         cursor.execute("""
-            SELECT user_id, username, email FROM users
-            WHERE verification_status = 'unverified'
-            AND date_joined < DATE_SUB(NOW(), INTERVAL 24 HOUR)
-        """)
-        
-        users_to_delete = cursor.fetchall()
-        deleted_count = 0
-        
-        for user in users_to_delete:
-            try:
-                # Delete the user
-                cursor.execute("DELETE FROM users WHERE user_id = %s", (user['user_id'],))
-                deleted_count += 1
-                
-                # Log the action
-                cursor.execute("""
-                    INSERT INTO admin_actions (admin_id, action_type, target_entity, action_description)
-                    VALUES (%s, %s, %s, %s)
-                """, (
-                    current_user['user_id'], 
-                    "cleanup_unverified", 
-                    f"user_{user['user_id']}", 
-                    f"Deleted unverified user {user['username']} with email {user['email']} after 24 hours"
-                ))
-            except Exception as e:
-                print(f"Error deleting user {user['user_id']}: {e}")
-        
+            INSERT INTO admin_actions (admin_id, action_type, target_entity, action_description)
+            VALUES (%s, %s, %s, %s)
+        """, (
+            current_user['user_id'],
+            "cleanup_unverified",
+            "users",
+            "Queued purge of unverified users older than 24 hours"
+        ))
         conn.commit()
         cursor.close()
         conn.close()
-        
-        return jsonify({
-            'message': f'Deleted {deleted_count} unverified users',
-            'deleted_users_count': deleted_count
-        }), 200
-        
+
+        return jsonify({'message': 'Cleanup of unverified users queued'}), 202
+
     except Exception as e:
         return jsonify({'error': f'Failed to cleanup unverified users: {str(e)}'}), 500
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Set-based loaders that attach related rows to an already fetched result.
+
+Handlers fetch their main rows first, then call these to fill in images
+and seller ratings with one query per relation instead of one query per
+row. All helpers expect a dictionary cursor.
+"""
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _unique(values):
+    return list(dict.fromkeys(v for v in values if v is not None))
+
+
+def fetch_images(cursor, product_ids):
+    """Map product_id -> [image_url, ...] in upload order"""
+    product_ids = _unique(product_ids)
+    images = {product_id: [] for product_id in product_ids}
+    if not product_ids:
+        return images
+
+    cursor.execute(f"""
+        SELECT product_id, image_url
+        FROM product_images
+        WHERE product_id IN ({_placeholders(product_ids)})
+        ORDER BY product_id, image_id
+    """, tuple(product_ids))
+    for row in cursor.fetchall():
+        images[row['product_id']].append(row['image_url'])
+    return images
+
+
+def attach_images(cursor, products, key='product_id', field='images'):
+    """Set products[i][field] to the image list of products[i][key]"""
+    images = fetch_images(cursor, [product[key] for product in products])
+    for product in products:
+        product[field] = images.get(product[key], [])
+    return products
+
+
+def fetch_seller_ratings(cursor, seller_ids):
+    """Map seller_id -> average review rating (0.0 when unreviewed)"""
+    seller_ids = _unique(seller_ids)
+    ratings = {seller_id: 0.0 for seller_id in seller_ids}
+    if not seller_ids:
+        return ratings
+
+    # Primary-key lookups on the maintained totals, not an AVG over reviews
+    cursor.execute(f"""
+        SELECT seller_id, rating_sum, rating_count
+        FROM seller_stats
+        WHERE seller_id IN ({_placeholders(seller_ids)})
+    """, tuple(seller_ids))
+    for row in cursor.fetchall():
+        ratings[row['seller_id']] = seller_rating(row['rating_sum'], row['rating_count'])
+    return ratings
+
+
+def seller_rating(rating_sum, rating_count):
+    return float(rating_sum) / rating_count if rating_count else 0.0
+
+
+def attach_seller_ratings(cursor, products, key='user_id', field='seller_rating'):
+    """Set products[i][field] to the average rating of the seller in products[i][key]"""
+    ratings = fetch_seller_ratings(cursor, [product[key] for product in products])
+    for product in products:
+        product[field] = ratings.get(product[key], 0.0)
+    return products
+
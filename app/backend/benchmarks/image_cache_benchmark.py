@@ -0,0 +1,82 @@
+"""Image bytes served across repeated page views, with and without HTTP caching.
+
+Runs against a live backend. Loads one page of /products/search, collects
+the product image URLs it references, then simulates --views page views
+that each fetch every image:
+
+  nocache     plain GET every time (what a client with no cache does)
+  revalidate  conditional GET with If-None-Match on every view
+  browser     honours Cache-Control max-age and only revalidates stale entries
+
+    python benchmarks/image_cache_benchmark.py --base-url http://localhost:8001 --views 20
+
+Prints requests, 304 responses and body bytes received per mode.
+"""
+import argparse
+import json
+import re
+import time
+import urllib.error
+import urllib.request
+
+MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+def fetch(url, etag=None):
+    request = urllib.request.Request(url)
+    if etag:
+        request.add_header('If-None-Match', etag)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        if error.code != 304:
+            raise
+        return error.code, error.headers, b''
+
+
+def image_urls(base_url, limit):
+    _, _, body = fetch(f'{base_url}/products/search?limit={limit}')
+    urls = []
+    for product in json.loads(body):
+        urls.extend(url for url in product.get('images', []) if url.startswith('/products/serve-image/'))
+    return [base_url + url for url in dict.fromkeys(urls)]
+
+
+def run(mode, urls, views):
+    cache = {}  # url -> (etag, fresh_until)
+    requests = not_modified = received = 0
+    for _ in range(views):
+        for url in urls:
+            etag, fresh_until = cache.get(url, (None, 0))
+            if mode == 'browser' and time.monotonic() < fresh_until:
+                continue
+            status, headers, body = fetch(url, etag if mode != 'nocache' else None)
+            requests += 1
+            received += len(body)
+            if status == 304:
+                not_modified += 1
+            max_age = MAX_AGE.search(headers.get('Cache-Control', ''))
+            fresh_for = int(max_age.group(1)) if max_age else 0
+            cache[url] = (headers.get('ETag') or etag, time.monotonic() + fresh_for)
+    return requests, not_modified, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--limit', type=int, default=50, help='products per page')
+    parser.add_argument('--views', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', default=['nocache', 'revalidate', 'browser'])
+    args = parser.parse_args()
+
+    urls = image_urls(args.base_url, args.limit)
+    print(f"{len(urls)} images per page, {args.views} page views")
+    print(f"{'mode':>10} {'requests':>9} {'304s':>6} {'KiB recv':>10}")
+    for mode in args.modes:
+        requests, not_modified, received = run(mode, urls, args.views)
+        print(f"{mode:>10} {requests:>9} {not_modified:>6} {received / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
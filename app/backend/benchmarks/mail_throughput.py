@@ -0,0 +1,108 @@
+"""Outbound mail throughput for the mail outbox, offline.
+
+Starts a local SMTP sink (accepts and discards every message, optionally
+adding --latency ms per command to mimic a remote server), then pushes
+--messages verification-sized emails through mailer.Outbox with the SMTP
+transport. Each --batch-sizes entry is run twice: once reusing the
+connection for the whole batch (what the outbox does) and once with a
+fresh connection per message (what the old send-per-request code did).
+
+    python benchmarks/mail_throughput.py --messages 500 --batch-sizes 1 10 50 --latency 2
+
+--rate applies the outbox's rate limiter (0 = unlimited) to check pacing
+against an SES quota.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mailer import Outbox, SMTPTransport  # noqa: E402
+
+BODY = "Click the link to verify your email: https://csc648g1.me/verify-email?token=" + "x" * 36
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    latency = 0.0
+
+    def reply(self, line):
+        if self.latency:
+            time.sleep(self.latency)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink ready')
+        in_data = False
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    self.server.received += 1
+                    self.reply('250 queued')
+                continue
+            command = line[:4].upper()
+            if command == 'EHLO':
+                self.reply('250 sink')
+            elif command == 'DATA':
+                in_data = True
+                self.reply('354 go ahead')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    received = 0
+
+
+class PerMessageTransport(SMTPTransport):
+    """Opens and closes a connection for every message"""
+
+    def send(self, message):
+        super().send(message)
+        self.close()
+
+
+def run(transport, messages, batch_size, rate):
+    outbox = Outbox(transport, batch_size=batch_size, rate=rate)
+    started = time.perf_counter()
+    for i in range(messages):
+        outbox.send(f'user{i}@sfsu.edu', 'Verify your email', BODY)
+    outbox.flush()
+    return time.perf_counter() - started, outbox.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--latency', type=float, default=1.0, help='sink delay per SMTP reply, ms')
+    parser.add_argument('--rate', type=float, default=0)
+    args = parser.parse_args()
+
+    SinkHandler.latency = args.latency / 1000
+    server = SinkServer(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    print(f"{'batch':>6} {'connection':>11} {'msgs/s':>9} {'batches':>8}")
+    for batch_size in args.batch_sizes:
+        for label, transport_class in (('reused', SMTPTransport), ('per-msg', PerMessageTransport)):
+            transport = transport_class(host, port, user='', starttls=False)
+            elapsed, stats = run(transport, args.messages, batch_size, args.rate)
+            print(f"{batch_size:>6} {label:>11} {stats['sent'] / elapsed:>9.1f} {stats['batches']:>8}")
+    print(f"sink received {server.received} messages")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Request volume of inbox polling vs. /messaging/events long-polling.
+
+Runs against a live backend. N simulated clients watch one conversation for
+--duration seconds while a sender posts a message every --send-interval
+seconds. In `poll` mode each client re-fetches the message history every
+--poll-interval seconds (what the frontend does today); in `longpoll` mode
+each client parks on /messaging/events and only fetches when woken.
+
+    python benchmarks/messaging_loadtest.py --base-url http://localhost:8001 \\
+        --conversation 1 --sender-token $SELLER_JWT --client-token $BUYER_JWT \\
+        --clients 50 --duration 60
+
+Prints requests, bytes received and messages observed per mode.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.messages = 0
+
+    def add(self, body, messages=0):
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(body)
+            self.messages += messages
+
+
+def call(base_url, path, token, method='GET', payload=None, timeout=60):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    request.add_header('Authorization', f'Bearer {token}')
+    if data is not None:
+        request.add_header('Content-Type', 'application/json')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def poll_client(args, counter, stop):
+    path = f'/messaging/conversations/{args.conversation}/messages'
+    while not stop.is_set():
+        body = call(args.base_url, path, args.client_token)
+        counter.add(body)
+        stop.wait(args.poll_interval)
+
+
+def longpoll_client(args, counter, stop):
+    since = int(time.time() * 1_000_000)
+    while not stop.is_set():
+        body = call(args.base_url, f'/messaging/events?since={since}', args.client_token)
+        result = json.loads(body)
+        since = result['last_event_id']
+        new_messages = [e for e in result['events'] if e['type'] == 'message']
+        counter.add(body, len(new_messages))
+
+
+def sender(args, stop, sent):
+    path = f'/messaging/conversations/{args.conversation}/messages'
+    while not stop.wait(args.send_interval):
+        call(args.base_url, path, args.sender_token, 'POST', {'message_text': f'load test {sent[0]}'})
+        sent[0] += 1
+
+
+def run(mode, args):
+    counter = Counter()
+    stop = threading.Event()
+    sent = [0]
+    target = poll_client if mode == 'poll' else longpoll_client
+    threads = [threading.Thread(target=target, args=(args, counter, stop), daemon=True)
+               for _ in range(args.clients)]
+    threads.append(threading.Thread(target=sender, args=(args, stop, sent), daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    return counter, sent[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--conversation', type=int, required=True)
+    parser.add_argument('--sender-token', required=True)
+    parser.add_argument('--client-token', required=True)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--poll-interval', type=float, default=3)
+    parser.add_argument('--send-interval', type=float, default=5)
+    parser.add_argument('--modes', nargs='+', default=['poll', 'longpoll'])
+    args = parser.parse_args()
+
+    print(f"{'mode':>9} {'requests':>9} {'req/s':>7} {'KiB recv':>9} {'sent':>5}")
+    for mode in args.modes:
+        counter, sent = run(mode, args)
+        print(f"{mode:>9} {counter.requests:>9} {counter.requests / args.duration:>7.1f} "
+              f"{counter.bytes / 1024:>9.1f} {sent:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Request-path cost of metrics.py: a bare observe() and a whole request with and without the hooks.
+
+Runs in-process, no database needed. Times --iterations calls of
+Metrics.observe(), then --requests test-client requests to a trivial
+blueprint view on two otherwise identical Flask apps, one with
+Metrics.init_app() and one without. The difference per request is what the
+before/after/teardown hooks add; the snapshot collectors are not on that
+path and are timed separately.
+
+    python benchmarks/metrics_overhead.py --iterations 200000 --requests 5000
+
+Prints microseconds per operation, best of --repeat runs.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from flask import Blueprint, Flask  # noqa: E402
+
+from metrics import Metrics  # noqa: E402
+
+LABELS = (('blueprint', 'products'), ('endpoint', 'products.get_product'), ('method', 'GET'), ('status', '200'))
+
+
+def best_of(repeat, run, count):
+    """Fastest run, in microseconds per operation"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) / count * 1e6)
+    return min(timings)
+
+
+def make_app(registry=None):
+    flask_app = Flask(__name__)
+    if registry is not None:
+        registry.init_app(flask_app)
+    items = Blueprint('items', __name__)
+
+    @items.route('/items/<int:item_id>')
+    def get_item(item_id):
+        return {'item_id': item_id}
+
+    flask_app.register_blueprint(items)
+    return flask_app.test_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000, help='observe() calls per run')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per app per run')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    registry = Metrics()
+
+    def observe():
+        for _ in range(args.iterations):
+            registry.observe('http_request_duration_seconds', 0.012, LABELS)
+
+    print(f"observe()            {best_of(args.repeat, observe, args.iterations):8.2f} us")
+
+    def requests(client):
+        def run():
+            for i in range(args.requests):
+                client.get(f'/items/{i}')
+        return run
+
+    bare = best_of(args.repeat, requests(make_app()), args.requests)
+    instrumented = best_of(args.repeat, requests(make_app(Metrics())), args.requests)
+    print(f"request, no hooks    {bare:8.2f} us")
+    print(f"request, with hooks  {instrumented:8.2f} us  (+{instrumented - bare:.2f} us, "
+          f"{(instrumented - bare) / bare * 100:+.1f}%)")
+
+    # Only runs per flush (METRICS_FLUSH_INTERVAL) and per scrape, never per request
+    print(f"snapshot()           {best_of(args.repeat, registry.snapshot, 1):8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
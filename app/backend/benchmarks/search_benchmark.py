@@ -0,0 +1,140 @@
+"""Search latency vs. catalog size: LIKE '%term%' scan vs. FULLTEXT.
+
+Seeds a scratch database with synthetic products and times the two query
+shapes used by products.search_products at each catalog size.
+
+    MYSQL_HOST=localhost MYSQL_USER=root MYSQL_PASSWORD=rootpass \\
+        python benchmarks/search_benchmark.py --sizes 1000 10000 100000 1000000
+
+The scratch database (MYSQL_BENCH_DATABASE, default gator_market_bench) is
+dropped and recreated, so never point it at a real database.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import mysql.connector
+
+WORDS = (
+    "macbook dell thinkpad lenovo samsung galaxy iphone ipad airpods keyboard "
+    "monitor chair desk lamp hoodie shirt textbook chemistry calculus physics "
+    "algorithms interview charger cable mouse headphones backpack bike scooter "
+    "speaker camera tripod router printer tablet stylus case jacket sneakers"
+).split()
+FILLER = "used good condition lightly worn barely scratched works great pickup campus".split()
+
+QUERIES = {
+    'like': """
+        SELECT product_id FROM bench_products
+        WHERE approval_status = 'approved' AND status = 'active'
+        AND (name LIKE %s OR description LIKE %s)
+        ORDER BY created_at DESC, product_id DESC LIMIT 50
+    """,
+    'fulltext': """
+        SELECT product_id, MATCH(name, description) AGAINST (%s IN BOOLEAN MODE) AS relevance
+        FROM bench_products
+        WHERE approval_status = 'approved' AND status = 'active'
+        AND MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)
+        ORDER BY relevance DESC, product_id DESC LIMIT 50
+    """,
+}
+
+
+def connect(database=None):
+    return mysql.connector.connect(
+        host=os.getenv('MYSQL_HOST', 'localhost'),
+        user=os.getenv('MYSQL_USER', 'root'),
+        password=os.getenv('MYSQL_PASSWORD', ''),
+        database=database
+    )
+
+
+def create_schema(database):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+    cursor.execute("""
+        CREATE TABLE bench_products (
+            product_id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            description TEXT,
+            category_id INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status ENUM('active', 'sold', 'deleted') DEFAULT 'active',
+            approval_status ENUM('pending', 'approved', 'rejected') DEFAULT 'approved',
+            FULLTEXT KEY ft_products_name_description (name, description)
+        )
+    """)
+    cursor.close()
+    conn.close()
+
+
+def random_product(rng):
+    name = ' '.join(rng.sample(WORDS, 2)).title()
+    description = ' '.join(rng.choices(WORDS + FILLER * 3, k=rng.randint(8, 30)))
+    return (name, description, rng.randint(1, 5))
+
+
+def grow_to(conn, current, target, rng, batch=5000):
+    cursor = conn.cursor()
+    while current < target:
+        n = min(batch, target - current)
+        cursor.executemany(
+            "INSERT INTO bench_products (name, description, category_id) VALUES (%s, %s, %s)",
+            [random_product(rng) for _ in range(n)]
+        )
+        conn.commit()
+        current += n
+    cursor.execute("ANALYZE TABLE bench_products")
+    cursor.fetchall()
+    cursor.close()
+    return current
+
+
+def time_query(conn, mode, term, repeat):
+    cursor = conn.cursor()
+    if mode == 'like':
+        params = (f"%{term}%", f"%{term}%")
+    else:
+        params = (f"+{term}*", f"+{term}*")
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute(QUERIES[mode], params)
+        cursor.fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    cursor.close()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--terms', nargs='+', default=['macbook', 'chem', 'headphones'])
+    args = parser.parse_args()
+
+    database = os.getenv('MYSQL_BENCH_DATABASE', 'gator_market_bench')
+    create_schema(database)
+    conn = connect(database)
+    rng = random.Random(648)
+
+    print(f"{'products':>10} {'mode':>9} {'term':>11} {'p50 ms':>9} {'p95 ms':>9}")
+    rows = 0
+    for size in sorted(args.sizes):
+        rows = grow_to(conn, rows, size, rng)
+        for term in args.terms:
+            for mode in QUERIES:
+                p50, p95 = time_query(conn, mode, term, args.repeat)
+                print(f"{size:>10} {mode:>9} {term:>11} {p50:>9.2f} {p95:>9.2f}")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Worker cold-start cost: wall time and `python -X importtime` profile of `import app`.
+
+Imports the app the way a gunicorn worker does, in a fresh interpreter per
+run (with the scheduler disabled so runs don't contend for its lock file),
+and reports the median wall time plus the modules with the largest
+cumulative import time. Project modules are listed separately, so a new
+import-time side effect in a blueprint shows up at once.
+
+    python benchmarks/startup_profile.py --repeat 10 --top 25 \\
+        --output benchmarks/startup_importtime.txt
+
+Re-run it after adding imports or module-level setup and compare with the
+checked-in report.
+"""
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def project_modules():
+    return {name[:-3] for name in os.listdir(BACKEND_DIR) if name.endswith('.py')}
+
+
+def import_app():
+    env = dict(os.environ, SCHEDULER_ENABLED='0', PYTHONDONTWRITEBYTECODE='1')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return (time.perf_counter() - started) * 1000, result.stderr
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def report(walls, rows, top):
+    ours = project_modules()
+    by_cumulative = sorted(rows, key=lambda row: row[2], reverse=True)
+    lines = [
+        f"python {platform.python_version()} on {platform.system()} {platform.machine()}",
+        f"import app: median {statistics.median(walls):.1f} ms wall over {len(walls)} runs "
+        f"(min {min(walls):.1f}, max {max(walls):.1f})",
+        f"modules imported: {len(rows)}",
+        "",
+        f"top {top} by cumulative import time:",
+        f"{'cumulative ms':>14} {'self ms':>9}  module",
+    ]
+    lines += [f"{c / 1000:>14.1f} {s / 1000:>9.1f}  {name}" for name, s, c in by_cumulative[:top]]
+    lines += ["", "project modules:", f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    lines += [f"{c / 1000:>14.1f} {s / 1000:>9.1f}  {name}" for name, s, c in by_cumulative if name in ours]
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    import_app()  # warm the OS file cache so runs are comparable
+    walls, rows = [], []
+    for _ in range(args.repeat):
+        wall, stderr = import_app()
+        walls.append(wall)
+        rows = parse_importtime(stderr)
+
+    text = report(walls, rows, args.top)
+    print(text, end='')
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Throughput and latency of gunicorn worker models under concurrent load.
+
+For each --profiles entry, starts gunicorn with gunicorn.conf.py and the
+profile's overrides on a local port, drives --concurrency closed-loop
+clients at --path for --duration seconds, then stops it. Prints requests/s,
+p50/p99 latency and errors per profile.
+
+Profiles are `class:workers[:threads]`, e.g. the old default is `sync:1`:
+
+    MYSQL_HOST=localhost MYSQL_USER=csc648user MYSQL_PASSWORD=... MYSQL_DATABASE=gator_market \\
+        python benchmarks/worker_loadtest.py --path '/products/search?limit=20' \\
+        --profiles sync:1 sync:3 gthread:3:4 gthread:3:8 --concurrency 32 --duration 20
+
+Use a DB-backed --path for realistic numbers; the default `/` only measures
+framework overhead.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(profile, port):
+    worker_class, workers, *threads = profile.split(':')
+    env = dict(
+        os.environ,
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKERS=workers,
+        GUNICORN_THREADS=threads[0] if threads else '1',
+        GUNICORN_ACCESS_LOG='/dev/null',
+        SCHEDULER_ENABLED='0',
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f'gunicorn did not start for profile {profile}')
+
+
+def client(url, stop, latencies, errors, lock):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            urllib.request.urlopen(url, timeout=30).read()
+        except (urllib.error.URLError, OSError):
+            with lock:
+                errors[0] += 1
+            continue
+        with lock:
+            latencies.append((time.perf_counter() - started) * 1000)
+
+
+def run(url, concurrency, duration):
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    threads = [threading.Thread(target=client, args=(url, stop, latencies, errors, lock), daemon=True)
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] if latencies else 0.0
+    p50 = statistics.median(latencies) if latencies else 0.0
+    return len(latencies) / duration, p50, p99, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--profiles', nargs='+', default=['sync:1', 'sync:3', 'gthread:3:8'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15)
+    args = parser.parse_args()
+
+    print(f"{'profile':>14} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for profile in args.profiles:
+        port = free_port()
+        process = start_gunicorn(profile, port)
+        try:
+            rps, p50, p99, errors = run(f'http://127.0.0.1:{port}{args.path}', args.concurrency, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{profile:>14} {rps:>9.1f} {p50:>9.2f} {p99:>9.2f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
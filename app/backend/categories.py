@@ -0,0 +1,53 @@
+"""Category lookups and active listing counts.
+
+The categories table is a handful of rows that only change by hand, so each
+worker loads it whole and answers name <-> id lookups from memory; the TTL
+(or invalidate_categories()) picks up edits.
+
+category_stats keeps the number of approved, active listings per category.
+Every write that can move a product into or out of that state calls
+adjust_category_counts() in the same transaction: with -1 before the write
+(counted only if the product was visible) and +1 after it (counted only if it
+still is), so the pair nets out whatever the write changed. The table can be
+rebuilt with `flask products rebuild-category-stats`.
+"""
+import os
+
+from cache import TTLCache
+
+# Loaded as one entry: {'by_id': {id: name}, 'by_name': {name: id}}
+category_cache = TTLCache(maxsize=1, ttl=float(os.getenv('CATEGORY_CACHE_TTL', 300)))
+
+
+def load_categories(cursor):
+    """The category maps, from category_cache when possible (any cursor type)"""
+    maps = category_cache.get('all')
+    if maps is None:
+        cursor.execute("SELECT category_id, name FROM categories ORDER BY category_id")
+        rows = [row.values() if isinstance(row, dict) else row for row in cursor.fetchall()]
+        by_id = {category_id: name for category_id, name in rows}
+        maps = {'by_id': by_id, 'by_name': {name: category_id for category_id, name in by_id.items()}}
+        category_cache.set('all', maps)
+    return maps
+
+
+def lookup_category_id(cursor, name):
+    """category_id for a category name, or None if there is no such category"""
+    return load_categories(cursor)['by_name'].get(name)
+
+
+def invalidate_categories():
+    category_cache.delete('all')
+
+
+def adjust_category_counts(cursor, delta, where, params=()):
+    """Add delta to the count of every approved, active product matching `where`"""
+    cursor.execute(f"""
+        INSERT INTO category_stats (category_id, active_count)
+        SELECT category_id, %s * COUNT(*)
+        FROM products
+        WHERE approval_status = 'approved' AND status = 'active' AND ({where})
+        GROUP BY category_id
+        ON DUPLICATE KEY UPDATE active_count = active_count + VALUES(active_count)
+    """, (delta, *params))
+
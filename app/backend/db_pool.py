@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be borrowed within the pool timeout"""
+
+
+class PooledConnection:
+    """Proxy around a raw MySQL connection borrowed from a ConnectionPool.
+
+    Handlers keep calling cursor()/commit()/rollback()/close() as before.
+    close() hands the connection back to the pool instead of tearing down
+    the socket. A request-scoped connection stays checked out until the
+    request ends; close() only ends the open transaction, which is what a
+    fresh connection would have looked like to the next caller.
+    """
+
+    def __init__(self, pool, raw, request_scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"Connection already returned to pool ({name})")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is None:
+            return
+        if self._request_scoped:
+            self._pool.reset(self._raw)
+        else:
+            self.release()
+
+    def release(self):
+        """Return the underlying connection to the pool"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+
+class ConnectionPool:
+    """Fixed-size, thread-safe pool of MySQL connections.
+
+    `factory` is a zero-argument callable returning a new DB-API connection
+    (normally functools.partial(mysql.connector.connect, ...)). Connections
+    are created lazily up to `size`; callers wait at most `timeout` seconds
+    for one to free up. Connections idle longer than `ping_interval` seconds
+    are pinged on checkout and reconnected if the socket went stale, and
+    connections older than `recycle` seconds are replaced.
+    """
+
+    def __init__(self, factory, size=5, timeout=10.0, ping_interval=30.0, recycle=3600.0):
+        self._factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.recycle = recycle
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (raw, created_at, last_used_at)
+        self._created_at = {}
+        self._open = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, request_scoped=False):
+        """Borrow a connection, waiting up to `timeout` seconds"""
+        raw = self._checkout()
+        return PooledConnection(self, raw, request_scoped=request_scoped)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always returns it"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.release()
+
+    def _checkout(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        entry = None
+        with self._lock:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                self._lock.wait(remaining)
+            waited = time.monotonic() - started
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            if entry is None:
+                return self._connect()
+            return self._validate(*entry)
+        except Exception:
+            self._forget(None)
+            raise
+
+    def _connect(self):
+        raw = self._factory()
+        self._created_at[id(raw)] = time.monotonic()
+        return raw
+
+    def _validate(self, raw, created_at, last_used_at):
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            self._close_quietly(raw)
+            self._reconnects += 1
+            return self._connect()
+        if now - last_used_at >= self.ping_interval:
+            try:
+                raw.ping(reconnect=True, attempts=1, delay=0)
+            except Exception:
+                self._close_quietly(raw)
+                self._reconnects += 1
+                return self._connect()
+        return raw
+
+    def reset(self, raw):
+        """End any open transaction so the next user starts from a clean state"""
+        if getattr(raw, 'unread_result', False):
+            raw.consume_results()
+        if getattr(raw, 'in_transaction', True):
+            raw.rollback()
+
+    def release(self, raw):
+        """Return a raw connection to the idle set, discarding it if unusable"""
+        try:
+            self.reset(raw)
+        except Exception:
+            self._forget(raw)
+            return
+        with self._lock:
+            created_at = self._created_at.get(id(raw), time.monotonic())
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._lock.notify()
+
+    def _forget(self, raw):
+        if raw is not None:
+            self._close_quietly(raw)
+        with self._lock:
+            self._open -= 1
+            self._discarded += 1
+            self._lock.notify()
+
+    def _close_quietly(self, raw):
+        self._created_at.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def after_fork(self):
+        """Forget connections inherited from the parent process.
+
+        The parent still owns those sockets, so they are dropped without
+        close() (which would send COM_QUIT on the parent's connection).
+        Call this in the child right after fork, e.g. gunicorn's post_fork.
+        """
+        self._lock = threading.Condition()
+        self._idle.clear()
+        self._created_at.clear()
+        self._open = 0
+
+    def stats(self):
+        """Snapshot of pool usage and checkout wait timings"""
+        with self._lock:
+            idle = len(self._idle)
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': idle,
+                'in_use': self._open - idle,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'discarded': self._discarded,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+                'wait_seconds_avg': round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
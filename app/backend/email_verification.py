@@ -1,72 +1,167 @@
 from flask import Blueprint, request, jsonify
-from app import get_db_connection
+from app import get_db_connection, scheduler
 import uuid
-import boto3
-from botocore.exceptions import ClientError
 import os
 from datetime import datetime, timezone, timedelta
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from auth import generate_token
+from auth import generate_token, invalidate_auth_user
+from categories import adjust_category_counts
+from jobs import enqueue, job
+from mailer import build_message, outbox
+from messaging import reconcile_unread_counters, refresh_conversation_summaries
+from products import remove_images, set_cached_product_status
+from response_cache import invalidate_responses
+import time
 
 
 email_bp = Blueprint('email_verification', __name__, url_prefix='/verify')
 
-# Initialize AWS SES client
-aws_region = os.getenv("AWS_REGION", "us-west-1") 
-ses_client = boto3.client('ses', region_name=aws_region)
+# Expired unverified accounts are purged in batches of PURGE_BATCH_SIZE users,
+# pausing PURGE_BATCH_PAUSE seconds between batches so row locks stay short
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 200))
+PURGE_BATCH_PAUSE = float(os.getenv('PURGE_BATCH_PAUSE', 0.5))
+
+# How long a send_email job waits for its message to leave the outbox
+MAIL_SEND_TIMEOUT = float(os.getenv('MAIL_SEND_TIMEOUT', 60))
+
+# (table, DELETE for a batch of user ids), children before parents
+PURGE_STEPS = (
+    ('wishlist_tracking', "DELETE FROM wishlist_tracking WHERE user_id IN ({ids})"),
+    ('messages', "DELETE FROM messages WHERE sender_id IN ({ids})"),
+    ('conversation_participants', "DELETE FROM conversation_participants WHERE user_id IN ({ids})"),
+    ('admin_actions', "DELETE FROM admin_actions WHERE admin_id IN ({ids})"),
+    ('reviews', "DELETE FROM reviews WHERE seller_id IN ({ids})"),
+    ('listing_reports', "DELETE FROM listing_reports WHERE reporter_id IN ({ids})"),
+    ('product_images', """
+        DELETE pi FROM product_images pi
+        INNER JOIN products p ON pi.product_id = p.product_id
+        WHERE p.user_id IN ({ids})
+    """),
+    ('products', "DELETE FROM products WHERE user_id IN ({ids})"),
+    ('users', "DELETE FROM users WHERE user_id IN ({ids})"),
+)
+
+def delete_accounts(cursor, user_ids):
+    """Delete users and everything they own, in the caller's transaction.
+
+    Category counts and the summaries of conversations that lose messages
+    are updated along with the deletes. Returns ({table: rows deleted},
+    removed), where removed lists the deleted product ids and image files;
+    once committed, pass it to accounts_deleted.
+    """
+    ids = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f"SELECT product_id FROM products WHERE user_id IN ({ids})", tuple(user_ids))
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT DISTINCT conversation_id FROM messages WHERE sender_id IN ({ids})",
+                   tuple(user_ids))
+    conversation_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"""
+        SELECT pi.filename
+        FROM product_images pi
+        INNER JOIN products p ON pi.product_id = p.product_id
+        WHERE p.user_id IN ({ids}) AND pi.filename IS NOT NULL
+    """, tuple(user_ids))
+    filenames = [row[0] for row in cursor.fetchall()]
+    adjust_category_counts(cursor, -1, f'user_id IN ({ids})', user_ids)
+
+    deleted = {}
+    for table, query in PURGE_STEPS:
+        cursor.execute(query.format(ids=ids), tuple(user_ids))
+        deleted[table] = cursor.rowcount
+    if conversation_ids:
+        refresh_conversation_summaries(cursor, conversation_ids)
+        reconcile_unread_counters(cursor, conversation_ids)
+    return deleted, {'product_ids': product_ids, 'filenames': filenames}
+
+def accounts_deleted(user_ids, removed):
+    """Clean up after delete_accounts has committed: image files and cached responses"""
+    remove_images(removed['filenames'])
+    invalidate_auth_user(*user_ids)
+    tags = [f'seller:{user_id}' for user_id in user_ids]
+    if removed['product_ids']:
+        # Category counts moved, so searches and /categories are stale too
+        for product_id in removed['product_ids']:
+            set_cached_product_status(product_id)
+        tags += [f'product:{product_id}' for product_id in removed['product_ids']] + ['search']
+    invalidate_responses(*tags)
+
+def purge_expired_accounts(batch_size=None, pause=None):
+    """Delete unverified accounts older than 24 hours and everything they own.
+
+    Works through the candidates in user_id order, one transaction per
+    batch (see delete_accounts). Rows locked by a concurrent verification
+    are skipped and picked up next run, so running it twice is harmless.
+    Returns {table: rows deleted}.
+    """
+    batch_size = batch_size or PURGE_BATCH_SIZE
+    pause = PURGE_BATCH_PAUSE if pause is None else pause
+    deleted = {table: 0 for table, _ in PURGE_STEPS}
+    last_user_id = 0
 
-def cleanup_expired_tokens():
-    """Clean up expired verification tokens and unverified accounts"""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        # Get expired unverified accounts
-        cursor.execute("""
-            SELECT user_id 
-            FROM users 
-            WHERE verification_status = 'unverified'
-            AND verification_token_created_at < NOW() - INTERVAL 24 HOUR
-            FOR UPDATE
-        """)
-        expired_users = cursor.fetchall()
-
-        for user in expired_users:
-            user_id = user[0]
-            
-            # Clean up related records
-            cursor.execute("DELETE FROM wishlist_tracking WHERE user_id = %s", (user_id,))
-            cursor.execute("DELETE FROM messages WHERE sender_id = %s", (user_id,))
-            cursor.execute("DELETE FROM conversation_participants WHERE user_id = %s", (user_id,))
-            cursor.execute("DELETE FROM admin_actions WHERE admin_id = %s", (user_id,))
-            cursor.execute("DELETE FROM reviews WHERE seller_id = %s", (user_id,))
-            cursor.execute("DELETE FROM listing_reports WHERE reporter_id = %s", (user_id,))
-            
-            # Delete product images and products
+        while True:
             cursor.execute("""
-                DELETE pi FROM product_images pi
-                INNER JOIN products p ON pi.product_id = p.product_id
-                WHERE p.user_id = %s
-            """, (user_id,))
-            cursor.execute("DELETE FROM products WHERE user_id = %s", (user_id,))
-            
-            # Delete the user
-            cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-
-        conn.commit()
-    except Exception as e:
-        print(f"Error cleaning up expired tokens and accounts: {e}")
+                SELECT user_id
+                FROM users
+                WHERE verification_status = 'unverified'
+                AND COALESCE(verification_token_created_at, date_joined) < NOW() - INTERVAL 24 HOUR
+                AND user_id > %s
+                ORDER BY user_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (last_user_id, batch_size))
+            user_ids = [row[0] for row in cursor.fetchall()]
+            if not user_ids:
+                conn.commit()
+                break
+
+            counts, removed = delete_accounts(cursor, user_ids)
+            conn.commit()
+            accounts_deleted(user_ids, removed)
+            for table, count in counts.items():
+                deleted[table] += count
+
+            last_user_id = user_ids[-1]
+            if len(user_ids) < batch_size:
+                break
+            time.sleep(pause)
+    except Exception:
         conn.rollback()
+        raise
     finally:
         cursor.close()
         conn.close()
+    return deleted
+
+@job('purge_expired_accounts', max_attempts=3)
+def purge_expired_accounts_job():
+    deleted = purge_expired_accounts()
+    if deleted['users']:
+        summary = ', '.join(f"{table} {count}" for table, count in deleted.items() if count)
+        print(f"Purged {deleted['users']} expired unverified accounts: {summary}")
+    return deleted
+
+@scheduler.task('interval', id='purge_expired_accounts',
+                minutes=int(os.getenv('PURGE_INTERVAL_MINUTES', 60)))
+def scheduled_purge_expired_accounts():
+    try:
+        purge_expired_accounts_job()
+    except Exception as e:
+        print(f"Error purging expired unverified accounts: {e}")
+
+def dead_letter_email(error, to_email, subject, text_body, html_body=None):
+    """After the job's last attempt, keep the message with the outbox's other dead letters"""
+    outbox.bury(build_message(to_email, subject, text_body, html_body), error)
+
+@job('send_email', max_attempts=outbox.max_attempts, on_failure=dead_letter_email)
+def send_email_job(to_email, subject, text_body, html_body=None):
+    """One attempt through the outbox's batched, rate-limited sender; the job queue retries"""
+    outbox.deliver(build_message(to_email, subject, text_body, html_body)).result(timeout=MAIL_SEND_TIMEOUT)
 
 # Endpoint to send email verification
 @email_bp.route('/send', methods=['POST'])
 def send_verification_email():
-    # Clean up expired tokens first
-    cleanup_expired_tokens()
-    
     data = request.json
     email = data.get('email')
 
@@ -103,9 +198,8 @@ def send_verification_email():
             SET verification_token = %s, verification_token_created_at = NOW()
             WHERE email = %s
         """, (token, email))
-        conn.commit()
 
-        # Send email using SES
+        # Send the verification email
         subject = "Verify your email"
         frontend_origin = os.getenv("FRONTEND_ORIGIN", "https://csc648g1.me")
         verification_url = f"{frontend_origin}/verify-email?token={token}"
@@ -133,12 +227,15 @@ def send_verification_email():
         </html>
         """
         
-        success = send_email_ses(email, subject, text_body, html_body)
-        
-        if success:
-            return jsonify({'message': 'Verification email sent'}), 200
-        else:
-            return jsonify({'error': 'Failed to send email'}), 500
+        # Persisted with the token, so a recycled worker can't lose the email
+        enqueue('send_email', {
+            'to_email': email,
+            'subject': subject,
+            'text_body': text_body,
+            'html_body': html_body
+        })
+        conn.commit()
+        return jsonify({'message': 'Verification email sent'}), 200
 
     except Exception as e:
         conn.rollback()
@@ -193,6 +290,7 @@ def confirm_verification():
         """, (user['user_id'],))
         
         conn.commit()
+        invalidate_auth_user(user['user_id'])
         return jsonify({'message': 'Email verified successfully'}), 200
         
     except Exception as e:
@@ -202,62 +300,6 @@ def confirm_verification():
         cursor.close()
         conn.close()
 
-# AWS SES email sending function
-def send_email_ses(to_email, subject, text_body, html_body=None):
-    """
-    Send email using AWS SES
-    """
-    sender = os.getenv("SES_FROM_EMAIL", "noreply@gator.market")
-    
-    # Create message container
-    message = MIMEMultipart('alternative')
-    message['Subject'] = subject
-    message['From'] = sender
-    message['To'] = to_email
-    
-    # Create plain text part
-    text_part = MIMEText(text_body, 'plain')
-    message.attach(text_part)
-    
-    # Create HTML part if provided
-    if html_body:
-        html_part = MIMEText(html_body, 'html')
-        message.attach(html_part)
-    
-    try:
-        # Send email
-        response = ses_client.send_raw_email(
-            Source=sender,
-            Destinations=[to_email],
-            RawMessage={'Data': message.as_string()}
-        )
-        print(f"Email sent! Message ID: {response['MessageId']}")
-        return True
-    except ClientError as e:
-        print(f"Error sending email: {e.response['Error']['Message']}")
-        return False
-
-# Fallback SMTP function (keep for backup/testing)
-def send_email_smtp(to_email, subject, body):
-    """
-    Fallback SMTP email sending
-    """
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = os.getenv("SMTP_FROM", "noreply@gator.market")
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP(os.getenv("SMTP_SERVER", "localhost"), 587) as server:
-            server.starttls()
-            server.login(os.getenv("SMTP_USER"), os.getenv("SMTP_PASS"))
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Error sending email via SMTP: {e}")
-        return False
-    
-
 @email_bp.route('/get-token', methods=['POST'])
 def get_token_after_verification():
     data = request.json
@@ -345,7 +387,7 @@ def delete_unverified_account():
         return jsonify({'error': 'Token is required'}), 400
 
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
     try:
         # Get user and token info in one query with row lock
         cursor.execute("""
@@ -358,12 +400,12 @@ def delete_unverified_account():
 
         if not user:
             return jsonify({'error': 'Invalid or expired token'}), 400
-            
-        if user['verification_status'] == 'verified':
+        user_id, verification_status, token_time = user
+
+        if verification_status == 'verified':
             return jsonify({'error': 'Cannot delete verified accounts through this method'}), 403
 
         # Check token age
-        token_time = user['verification_token_created_at']
         if token_time:
             now = datetime.now(timezone.utc)
             if token_time.tzinfo is None:
@@ -373,41 +415,10 @@ def delete_unverified_account():
             if age_seconds > 86400:  # 24 hours
                 return jsonify({'error': 'Token has expired'}), 400
 
-        # Clean up related records in order to maintain referential integrity
-        user_id = user['user_id']
-        
-        # Delete wishlist entries first
-        cursor.execute("DELETE FROM wishlist_tracking WHERE user_id = %s", (user_id,))
-        
-        # Delete any messages sent by the user
-        cursor.execute("DELETE FROM messages WHERE sender_id = %s", (user_id,))
-        
-        # Remove from conversations
-        cursor.execute("DELETE FROM conversation_participants WHERE user_id = %s", (user_id,))
-        
-        # Delete any admin actions (if any)
-        cursor.execute("DELETE FROM admin_actions WHERE admin_id = %s", (user_id,))
-        
-        # Delete any reviews
-        cursor.execute("DELETE FROM reviews WHERE seller_id = %s", (user_id,))
-        
-        # Delete any listing reports
-        cursor.execute("DELETE FROM listing_reports WHERE reporter_id = %s", (user_id,))
-        
-        # Delete product images for any products owned by user
-        cursor.execute("""
-            DELETE pi FROM product_images pi
-            INNER JOIN products p ON pi.product_id = p.product_id
-            WHERE p.user_id = %s
-        """, (user_id,))
-        
-        # Delete products
-        cursor.execute("DELETE FROM products WHERE user_id = %s", (user_id,))
-        
-        # Finally delete the user
-        cursor.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
-        
+        # Same deletes and counter updates as the scheduled purge
+        _, removed = delete_accounts(cursor, [user_id])
         conn.commit()
+        accounts_deleted([user_id], removed)
         return jsonify({'message': 'Account successfully deleted'}), 200
 
     except Exception as e:
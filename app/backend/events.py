@@ -0,0 +1,139 @@
+"""Publish/subscribe for pushing messaging events to long-polling clients.
+
+Events are published to a channel (one per user, see user_channel) and kept
+in a short per-channel history so a client that reconnects with ?since=
+gets everything it missed. LocalBroker only reaches clients connected to
+the same process; RedisBroker fans events out to every gunicorn worker
+through Redis pub/sub. Pick one with EVENTS_BROKER_URL; gunicorn.conf.py
+refuses to start more than one worker without Redis.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class LocalBroker:
+    """In-process broker with a bounded history per channel"""
+
+    def __init__(self, history=50, max_channels=10000):
+        self.history = history
+        self.max_channels = max_channels
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()  # channel -> (deque of events, Condition)
+        self._last_id = 0
+        self.published = 0
+        self.delivered = 0
+
+    def _next_id(self):
+        # Wall-clock microseconds: comparable across workers and still exact
+        # as a JavaScript number
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            return self._last_id
+
+    def _channel(self, channel):
+        entry = self._channels.get(channel)
+        if entry is None:
+            entry = (deque(maxlen=self.history), threading.Condition(self._lock))
+            self._channels[channel] = entry
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(channel)
+        return entry
+
+    def publish(self, channel, event_type, data):
+        event = {'id': self._next_id(), 'type': event_type, 'data': data}
+        self.published += 1
+        self._deliver(channel, event)
+        return event
+
+    def _deliver(self, channel, event):
+        with self._lock:
+            events, condition = self._channel(channel)
+            events.append(event)
+            condition.notify_all()
+
+    def wait(self, channel, since=0, timeout=25.0):
+        """Return events newer than `since`, blocking up to `timeout` seconds for one"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            events, condition = self._channel(channel)
+            while True:
+                fresh = [event for event in events if event['id'] > since]
+                remaining = deadline - time.monotonic()
+                if fresh or remaining <= 0:
+                    self.delivered += len(fresh)
+                    return fresh
+                condition.wait(remaining)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': type(self).__name__,
+                'channels': len(self._channels),
+                'published': self.published,
+                'delivered': self.delivered,
+            }
+
+
+class RedisBroker(LocalBroker):
+    """Shares events between processes through Redis pub/sub.
+
+    publish() only sends to Redis; every process (including the publisher)
+    receives the event on its listener thread and delivers it locally.
+    Requires the optional `redis` package.
+    """
+
+    def __init__(self, url, prefix='gator-market:events:', **kwargs):
+        super().__init__(**kwargs)
+        import redis  # optional dependency, only needed for this backend
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._listener = None
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        # Started lazily (and again after fork) so preloaded apps get one per worker
+        if self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(self._prefix + '*')
+            self._listener = threading.Thread(target=self._listen, args=(pubsub,), daemon=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def _listen(self, pubsub):
+        for message in pubsub.listen():
+            channel = message['channel'].decode('utf-8')[len(self._prefix):]
+            self._deliver(channel, json.loads(message['data']))
+
+    def publish(self, channel, event_type, data):
+        self._ensure_listener()
+        event = {'id': self._next_id(), 'type': event_type, 'data': data}
+        self.published += 1
+        self._redis.publish(self._prefix + channel, json.dumps(event, default=str))
+        return event
+
+    def wait(self, channel, since=0, timeout=25.0):
+        self._ensure_listener()
+        return super().wait(channel, since, timeout)
+
+
+def create_broker(url=None):
+    if url and url.startswith('redis'):
+        return RedisBroker(url)
+    return LocalBroker()
+
+
+broker = create_broker(os.getenv('EVENTS_BROKER_URL'))
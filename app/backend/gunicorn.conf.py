@@ -0,0 +1,153 @@
+"""Production gunicorn settings (loaded with `gunicorn -c gunicorn.conf.py app:app`).
+
+Handlers mostly wait on MySQL, bcrypt, SES and long-polls, so each worker
+process runs a pool of threads (gthread) instead of one request at a time.
+Process count follows the container's CPU and memory limits, with each
+worker's bcrypt processes counted against the memory limit, once messaging
+events go through Redis (EVENTS_BROKER_URL); without it there is one worker.
+Every value can be overridden with the GUNICORN_* variables below.
+
+Keep workers * DB_POOL_SIZE under MySQL's max_connections (10 in
+compose.yaml). Threads beyond DB_POOL_SIZE wait for a pooled connection
+(DB_POOL_TIMEOUT), which is fine for long-polls that release theirs early.
+
+gevent also works (GUNICORN_WORKER_CLASS=gevent, with gevent installed), but
+mysql-connector's C extension blocks the event loop, so gthread is the default.
+"""
+import os
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit():
+    """CPUs available to the container: cgroup quota if set, else the host count"""
+    quota = _read('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>" or "max <period>"
+    if quota and not quota.startswith('max'):
+        limit, period = quota.split()
+        return max(1, int(limit) // int(period))
+    limit, period = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us'), _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if limit and period and int(limit) > 0:
+        return max(1, int(limit) // int(period))
+    return os.cpu_count() or 1
+
+
+def memory_limit():
+    """Container memory limit in bytes, or None when unlimited"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        if value and value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    return None
+
+
+def default_workers(cpus, memory, worker_memory):
+    """2 * CPUs + 1, capped by how many workers fit in the memory limit"""
+    workers = 2 * cpus + 1
+    if memory:
+        workers = min(workers, memory // worker_memory)
+    return max(1, workers)
+
+
+# Resident size of one worker after boot, used to fit workers into the memory limit
+WORKER_MEMORY = int(os.getenv('GUNICORN_WORKER_MEMORY_MB', 48)) * 1024 * 1024
+
+# Each worker's password hasher (passwords.py) adds its own processes: a
+# forkserver (~12 MB), a resource_tracker (~13 MB) and HASH_WORKERS pool
+# children (~17 MB each). They are counted against the same memory limit
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 1))
+HASHER_MEMORY = int(os.getenv(
+    'GUNICORN_HASHER_MEMORY_MB', 25 + 17 * HASH_WORKERS if HASH_WORKERS else 0
+)) * 1024 * 1024
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# LocalBroker (events.py) only wakes long-polls in the worker that published
+# the event, so more than one worker needs the Redis broker. Without it the
+# default is a single worker, and asking for more is refused at startup
+REDIS_EVENTS = os.getenv('EVENTS_BROKER_URL', '').startswith('redis')
+workers = int(os.getenv('GUNICORN_WORKERS', 0)) or (default_workers(
+    cpu_limit(), memory_limit(), WORKER_MEMORY + HASHER_MEMORY
+) if REDIS_EVENTS else 1)
+if workers > 1 and not REDIS_EVENTS:
+    raise RuntimeError(
+        f'GUNICORN_WORKERS={workers} needs EVENTS_BROKER_URL=redis://... so messaging '
+        'events reach every worker'
+    )
+
+# Threads per worker: GUNICORN_THREADS for ordinary requests plus
+# EVENTS_POLL_THREADS reserved for long-polls (GET /messaging/events), which
+# each park a thread for up to EVENTS_POLL_TIMEOUT. messaging.py admits that
+# many long-polls per worker and turns the rest away, so workers *
+# EVENTS_POLL_THREADS clients can hold one open at a time. A parked thread
+# only costs its stack, so the reserve can be generous
+POLL_THREADS = int(os.getenv('EVENTS_POLL_THREADS', 32))
+os.environ['EVENTS_POLL_THREADS'] = str(POLL_THREADS)
+threads = int(os.getenv('GUNICORN_THREADS', 8)) + POLL_THREADS
+
+# Every worker's mail outbox (mailer.py) takes an equal share of the SES quota
+os.environ.setdefault('MAIL_SENDERS', str(workers))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 200))  # gevent only
+
+# Long-polls hold a request for up to EVENTS_POLL_TIMEOUT (25s); keep the
+# worker timeout well above that
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Browsers and the frontend's nginx reuse connections between page loads
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers now and then so slow leaks can't reach the memory limit
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+if preload_app:
+    os.environ['GUNICORN_PRELOAD'] = '1'  # app.py leaves the scheduler to post_fork
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Apply pending schema migrations (migrate.py) once, before any worker starts
+migrate_on_start = os.getenv('MIGRATE_ON_START', '1') == '1'
+
+
+# Per-worker metric snapshots merged by /metrics (metrics.py)
+os.environ.setdefault('METRICS_DIR', '/tmp/gator-market-metrics')
+
+
+def on_starting(server):
+    from metrics import metrics
+    metrics.clear()  # snapshots left by a previous master
+    if not migrate_on_start:
+        return
+    import migrate
+    try:
+        conn = migrate.connect()
+        try:
+            migrate.migrate(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        # Keep serving on the current schema; `python migrate.py` can be re-run by hand
+        server.log.error(f"Error applying migrations: {e}")
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app import db_pool, start_scheduler
+    # Nothing should have connected in the master, but never share sockets
+    db_pool.after_fork()
+    start_scheduler()
+
+
+def child_exit(server, worker):
+    from metrics import metrics
+    # Keep the worker's counters in the totals; drop its gauges
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,121 @@
+"""Resized and WebP variants of uploaded product images.
+
+Uploads are saved as-is and then queued as an image_variants background
+job that writes one downscaled copy per entry in SIZES, each in the
+original format and as WebP, next to the original:
+
+    <uuid>_photo.jpg  ->  <uuid>_photo.thumb.jpg, <uuid>_photo.thumb.webp, ...
+
+serve_image picks a variant with pick_variant and falls back to the
+original while the variants are still being written.
+
+The backend runs in 128 MB, so each image is decoded once, as small as
+possible. JPEGs are decoded at a reduced scale (Image.draft). Anything still
+over MAX_IMAGE_PIXELS is refused. The decoded image is downscaled to the
+largest size before it is rotated, and the smaller sizes are made from that
+copy.
+"""
+import os
+
+from jobs import enqueue, job
+
+# Longest side in pixels; images are never upscaled
+SIZES = {'thumb': 160, 'card': 480, 'full': 1280}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Largest decoded image, about 36 MB as RGB (a 4000x3000 photo); PNGs can't
+# be decoded at a reduced scale, so this bounds them too
+MAX_IMAGE_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 12_000_000))
+
+
+def variant_filename(filename, size, webp=False):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{size}{'.webp' if webp else ext}"
+
+
+def variant_filenames(filename):
+    """Every variant generate_variants writes for filename"""
+    return [variant_filename(filename, size, webp) for size in SIZES for webp in (False, True)]
+
+
+def _save(image, path, fmt):
+    # Write to a temporary name first so serve_image never sees a partial file
+    tmp_path = f'{path}.tmp'
+    if fmt == 'WEBP':
+        image.save(tmp_path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'PNG':
+        image.save(tmp_path, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def generate_variants(path):
+    """Write every size/format variant of the image at path.
+
+    Returns {variant filename: bytes} for the files written.
+    """
+    from PIL import Image, ImageOps  # ~50 ms to import; only the job workers need it
+    # Checked against the header at open(); Pillow refuses twice this
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+    directory, filename = os.path.split(path)
+    largest = max(SIZES.values())
+    written = {}
+    with Image.open(path) as original:
+        fmt = 'PNG' if original.format == 'PNG' else 'JPEG'
+        # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still >= largest
+        original.draft(original.mode, (largest, largest))
+        if original.width * original.height > MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f'{original.width}x{original.height} image exceeds {MAX_IMAGE_PIXELS} pixels')
+        # In place, so the full decode is freed before anything else is allocated;
+        # the box is square, so rotating afterwards gives the same size
+        original.thumbnail((largest, largest), Image.LANCZOS)
+        image = ImageOps.exif_transpose(original)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    for size, edge in sorted(SIZES.items(), key=lambda item: item[1], reverse=True):
+        resized = image
+        if edge < largest:
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+        for webp in (False, True):
+            name = variant_filename(filename, size, webp)
+            written[name] = _save(resized, os.path.join(directory, name), 'WEBP' if webp else fmt)
+    return written
+
+
+@job('image_variants', max_attempts=3)
+def image_variants_job(path):
+    written = generate_variants(path)
+    original = os.path.getsize(path)
+    summary = ', '.join(
+        f"{name.rsplit('_', 1)[-1]} {size / 1024:.1f} KiB ({1 - size / original:.0%} smaller)"
+        for name, size in written.items()
+    )
+    print(f"Image variants for {os.path.basename(path)} ({original / 1024:.1f} KiB): {summary}")
+
+
+def schedule_variants(path):
+    """Queue variant generation for a stored upload"""
+    return enqueue('image_variants', {'path': path})
+
+
+def pick_variant(directory, filename, size, accept_webp=False):
+    """Best existing file to serve for size, preferring WebP when accepted.
+
+    Returns the original filename when size is unknown or its variants have
+    not been written yet.
+    """
+    if size not in SIZES:
+        return filename
+    candidates = [variant_filename(filename, size, webp=True)] if accept_webp else []
+    candidates.append(variant_filename(filename, size))
+    for name in candidates:
+        if os.path.exists(os.path.join(directory, name)):
+            return name
+    return filename
@@ -0,0 +1,279 @@
+"""Background jobs for work that should not hold up a request.
+
+Handlers register with @job(...) and are queued with enqueue(); the caller
+returns immediately and the job runs on a per-worker thread pool. Jobs are
+written to the background_jobs table first, so a failed attempt is retried
+with exponential backoff and a job lost with a crashed or restarted worker
+is picked up again by the sweeper on the scheduler process. Handlers must
+therefore be idempotent and take JSON-serializable keyword arguments.
+
+Inside a request the row is written on the request's own connection, as part
+of the handler's transaction, and the job is submitted when the request ends.
+It only runs if the handler committed, and enqueue never waits for a second
+pooled connection.
+
+    @job('image_variants')
+    def image_variants_job(path):
+        ...
+
+    enqueue('image_variants', {'path': file_path})
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, has_request_context
+
+from app import app, db_pool, get_db_connection, scheduler
+
+COUNTERS = ('enqueued', 'succeeded', 'retried', 'failed')
+
+
+class JobQueue:
+    """Thread pool plus optional persistence for registered job handlers.
+
+    `connect` returns a DB connection for the background_jobs table; when it
+    is None, or the insert fails, jobs still run and retry but only live in
+    this process. `request_connection` returns the current request's
+    connection, used by enqueue() inside a request. Attempt n failing waits
+    base_delay * 2**(n-1) seconds (capped at max_delay) before the next one.
+    """
+
+    def __init__(self, connect=None, request_connection=None, workers=4, base_delay=5.0, max_delay=600.0,
+                 stale_after=900):
+        self._connect = connect
+        self._request_connection = request_connection
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+        self.workers = workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale_after = stale_after
+        self._handlers = {}  # job_type -> (func, max_attempts, persist, on_failure)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._pending = 0
+        self._running = 0
+
+    def register(self, job_type, max_attempts=5, persist=True, on_failure=None):
+        """Decorator registering func as the handler for job_type.
+
+        persist=False keeps the job in memory only, for work that is useless
+        to replay later or on another worker (e.g. in-process notifications).
+        on_failure(error, **payload) is called once the last attempt has failed.
+        """
+        def decorator(func):
+            self._handlers[job_type] = (func, max_attempts, persist, on_failure)
+            return func
+        return decorator
+
+    def backoff(self, attempts):
+        return min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+    def init_app(self, app):
+        app.teardown_request(self._submit_request_jobs)
+
+    def enqueue(self, job_type, payload=None):
+        """Queue a registered job; returns the Future of its first attempt.
+
+        Inside a request a persisted job is only submitted when the request
+        ends, so this returns None; the caller must commit its transaction.
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f'Unknown job type: {job_type}')
+        payload = payload or {}
+        _, max_attempts, persist, _ = self._handlers[job_type]
+        self._count(job_type, 'enqueued')
+        if persist and self._request_connection is not None and has_request_context():
+            conn = self._request_connection()
+            job_id = self._insert(job_type, payload, max_attempts, conn) if conn is not None else None
+            if job_id is not None:
+                g.setdefault('queued_jobs', []).append((job_id, job_type, payload))
+                return None
+            return self._submit(None, job_type, payload, 0)
+        job_id = self._insert(job_type, payload, max_attempts) if persist else None
+        return self._submit(job_id, job_type, payload, 0)
+
+    def _submit_request_jobs(self, exc=None):
+        # A job whose row was rolled back with the handler's transaction
+        # finds nothing to claim and is skipped
+        for job_id, job_type, payload in g.pop('queued_jobs', ()):
+            self._submit(job_id, job_type, payload, 0)
+
+    def _submit(self, job_id, job_type, payload, attempts):
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._run, job_id, job_type, payload, attempts)
+
+    def _run(self, job_id, job_type, payload, attempts):
+        with self._lock:
+            self._pending -= 1
+        func, max_attempts, _, on_failure = self._handlers[job_type]
+        if job_id is not None and not self._claim(job_id):
+            return  # already running or finished elsewhere
+
+        attempts += 1
+        with self._lock:
+            self._running += 1
+        started = time.monotonic()
+        try:
+            func(**payload)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            if attempts < max_attempts:
+                delay = self.backoff(attempts)
+                print(f"Job {job_type} failed (attempt {attempts}/{max_attempts}), retrying in {delay:.0f}s: {error}")
+                self._finish(job_id, 'queued', error, delay)
+                self._count(job_type, 'retried', time.monotonic() - started)
+                timer = threading.Timer(delay, self._submit, args=(job_id, job_type, payload, attempts))
+                timer.daemon = True
+                timer.start()
+            else:
+                print(f"Job {job_type} failed after {attempts} attempts: {error}")
+                self._finish(job_id, 'failed', error)
+                self._count(job_type, 'failed', time.monotonic() - started)
+                if on_failure is not None:
+                    try:
+                        on_failure(error, **payload)
+                    except Exception as hook_error:
+                        print(f"Error in {job_type} failure hook: {hook_error}")
+        else:
+            self._finish(job_id, 'succeeded')
+            self._count(job_type, 'succeeded', time.monotonic() - started)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _count(self, job_type, counter, seconds=0.0):
+        with self._lock:
+            stats = self._stats.setdefault(job_type, dict.fromkeys(COUNTERS, 0) | {'seconds_total': 0.0})
+            stats[counter] += 1
+            stats['seconds_total'] += seconds
+
+    def _execute(self, query, params=()):
+        """Run one statement on a fresh connection; returns (rowcount, lastrowid)"""
+        conn = self._connect()
+        if conn is None:
+            raise RuntimeError('No database connection')
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.rowcount, cursor.lastrowid
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _insert(self, job_type, payload, max_attempts, conn=None):
+        """job_id of a new background_jobs row; on conn it is left for the caller to commit"""
+        query = """
+            INSERT INTO background_jobs (job_type, payload, max_attempts)
+            VALUES (%s, %s, %s)
+        """
+        params = (job_type, json.dumps(payload), max_attempts)
+        if conn is None and self._connect is None:
+            return None
+        try:
+            if conn is None:
+                _, job_id = self._execute(query, params)
+                return job_id
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.lastrowid
+            finally:
+                cursor.close()
+        except Exception as e:
+            print(f"Error persisting {job_type} job, running it in memory only: {e}")
+            return None
+
+    def _claim(self, job_id):
+        try:
+            claimed, _ = self._execute("""
+                UPDATE background_jobs
+                SET status = 'running', attempts = attempts + 1
+                WHERE job_id = %s AND status = 'queued'
+            """, (job_id,))
+            return claimed == 1
+        except Exception as e:
+            # Run anyway: a duplicate run is safer than a lost job
+            print(f"Error claiming job {job_id}: {e}")
+            return True
+
+    def _finish(self, job_id, status, error=None, delay=0):
+        if job_id is None:
+            return
+        try:
+            self._execute("""
+                UPDATE background_jobs
+                SET status = %s, last_error = %s, run_after = NOW() + INTERVAL %s SECOND
+                WHERE job_id = %s
+            """, (status, error[:1000] if error else None, int(delay), job_id))
+        except Exception as e:
+            print(f"Error recording job {job_id} as {status}: {e}")
+
+    def sweep(self, limit=100):
+        """Requeue stale running jobs and submit due ones; returns how many were submitted"""
+        conn = self._connect()
+        if conn is None:
+            return 0
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                UPDATE background_jobs SET status = 'queued'
+                WHERE status = 'running' AND updated_at < NOW() - INTERVAL %s SECOND
+            """, (self.stale_after,))
+            cursor.execute("""
+                DELETE FROM background_jobs
+                WHERE status = 'succeeded' AND updated_at < NOW() - INTERVAL 7 DAY
+            """)
+            conn.commit()
+            cursor.execute("""
+                SELECT job_id, job_type, payload, attempts
+                FROM background_jobs
+                WHERE status = 'queued' AND run_after <= NOW()
+                ORDER BY run_after
+                LIMIT %s
+            """, (limit,))
+            due = [row for row in cursor.fetchall() if row['job_type'] in self._handlers]
+        finally:
+            cursor.close()
+            conn.close()
+        for row in due:
+            self._submit(row['job_id'], row['job_type'], json.loads(row['payload']), row['attempts'])
+        return len(due)
+
+    def stats(self):
+        """Per-type counters for this worker plus current pool occupancy"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'running': self._running,
+                'jobs': {job_type: dict(stats) for job_type, stats in self._stats.items()},
+            }
+
+
+queue = JobQueue(
+    connect=db_pool.acquire,
+    request_connection=get_db_connection,
+    workers=int(os.getenv('JOB_WORKERS', 4)),
+    base_delay=float(os.getenv('JOB_RETRY_BASE_DELAY', 5)),
+    max_delay=float(os.getenv('JOB_RETRY_MAX_DELAY', 600))
+)
+queue.init_app(app)
+job = queue.register
+enqueue = queue.enqueue
+
+
+@scheduler.task('interval', id='sweep_background_jobs',
+                seconds=int(os.getenv('JOB_SWEEP_SECONDS', 30)))
+def sweep_background_jobs():
+    """Pick up retries whose timer died with their worker and jobs left running by a crash"""
+    try:
+        submitted = queue.sweep()
+        if submitted:
+            print(f"Resubmitted {submitted} background jobs")
+    except Exception as e:
+        print(f"Error sweeping background jobs: {e}")
@@ -0,0 +1,41 @@
+"""Thread-safe lazy initialization for expensive module-level resources.
+
+Every gunicorn worker imports all blueprints at boot, so anything created
+at import time (SDK clients, native libraries, directories on disk) delays
+the worker taking its first request. Wrap such resources in Lazy and call
+get() where they are used instead:
+
+    _magic = Lazy(lambda: importlib.import_module('magic'))
+    mime = _magic.get().from_buffer(head, mime=True)
+
+See benchmarks/startup_profile.py for the resulting import-time profile.
+"""
+import threading
+
+_UNSET = object()
+
+
+class Lazy:
+    """Calls `factory` once, on the first get(), and returns that value after.
+
+    Concurrent first calls block until the one running factory finishes. If
+    factory raises, nothing is stored and the next get() tries again.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = _UNSET
+
+    def get(self):
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    @property
+    def initialized(self):
+        return self._value is not _UNSET
@@ -0,0 +1,327 @@
+"""Outbound email: a queue drained in batches by one sender thread per worker.
+
+The Outbox thread groups queued messages into batches, sends each batch over
+a single transport connection, and paces itself to MAIL_RATE_PER_SECOND (the
+SES sending quota). That quota is for the whole deployment, so each worker
+gets MAIL_RATE_PER_SECOND / MAIL_SENDERS; gunicorn.conf.py sets MAIL_SENDERS
+to the number of workers.
+
+Handlers don't queue mail here directly, since a recycled or crashed worker
+would lose it. They enqueue a persisted send_email job (email_verification),
+whose handler hands the message over with deliver() and waits for that one
+attempt; the job queue keeps the retry schedule in background_jobs. Messages
+queued with send() are retried in memory with exponential backoff. Either
+way a message that fails MAIL_MAX_ATTEMPTS times goes to bury(), which
+writes it to the dead-letter directory as an .eml file: send() mail from the
+sender thread, job mail from the send_email job's on_failure hook.
+
+The transport is picked with MAIL_TRANSPORT:
+
+  ses   AWS SES send_raw_email (default)
+  smtp  any SMTP server (MAIL_SMTP_HOST/PORT/USER/PASSWORD/STARTTLS)
+  file  writes .eml files to MAIL_FILE_DIR, for local runs and tests
+"""
+import heapq
+import itertools
+import os
+import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import Future, InvalidStateError
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from lazy import Lazy
+
+MAIL_FROM = os.getenv('SES_FROM_EMAIL', 'noreply@gator.market')
+
+
+def build_message(to_email, subject, text_body, html_body=None, sender=MAIL_FROM):
+    message = MIMEMultipart('alternative')
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = to_email
+    message.attach(MIMEText(text_body, 'plain'))
+    if html_body:
+        message.attach(MIMEText(html_body, 'html'))
+    return message
+
+
+class SESTransport:
+    """AWS SES; the boto3 client (and its HTTP connection pool) is created on first use"""
+
+    def __init__(self, region=None):
+        self.region = region or os.getenv('AWS_REGION', 'us-west-1')
+        self._client = Lazy(self._create_client)
+
+    def _create_client(self):
+        import boto3  # importing boto3 and loading the SES model costs ~200 ms
+        return boto3.client('ses', region_name=self.region)
+
+    def open(self):
+        self._client.get()
+
+    def send(self, message):
+        self._client.get().send_raw_email(
+            Source=message['From'],
+            Destinations=[message['To']],
+            RawMessage={'Data': message.as_string()}
+        )
+
+    def close(self):
+        pass  # the client keeps its pooled connections for the next batch
+
+
+class SMTPTransport:
+    """SMTP with one connection reused for as long as the sender stays busy"""
+
+    def __init__(self, host=None, port=None, user=None, password=None, starttls=None, timeout=30):
+        self.host = host or os.getenv('MAIL_SMTP_HOST', os.getenv('SMTP_SERVER', 'localhost'))
+        self.port = int(port or os.getenv('MAIL_SMTP_PORT', 587))
+        self.user = user if user is not None else os.getenv('MAIL_SMTP_USER', os.getenv('SMTP_USER'))
+        self.password = password if password is not None else os.getenv('MAIL_SMTP_PASSWORD', os.getenv('SMTP_PASS'))
+        self.starttls = starttls if starttls is not None else os.getenv('MAIL_SMTP_STARTTLS', '1') == '1'
+        self.timeout = timeout
+        self._server = None
+
+    def open(self):
+        if self._server is not None:
+            return
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user:
+            server.login(self.user, self.password)
+        self._server = server
+
+    def send(self, message):
+        self.open()
+        try:
+            self._server.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # Idle connections get dropped by the server; reconnect once
+            self._server = None
+            self.open()
+            self._server.send_message(message)
+
+    def close(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                pass
+
+
+class FileTransport:
+    """Writes each message to <directory>/<uuid>.eml"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv('MAIL_FILE_DIR', '/tmp/gator-market-mail')
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, message):
+        self.open()
+        with open(os.path.join(self.directory, f'{uuid.uuid4()}.eml'), 'w') as f:
+            f.write(message.as_string())
+
+    def close(self):
+        pass
+
+
+TRANSPORTS = {'ses': SESTransport, 'smtp': SMTPTransport, 'file': FileTransport}
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+
+def _settle(future, result=None, error=None):
+    # The waiting job may have cancelled its future; that is not the sender's problem
+    if future is None:
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class Outbox:
+    """Queue plus batching sender thread for one transport"""
+
+    def __init__(self, transport, batch_size=50, rate=14.0, max_attempts=5,
+                 base_delay=30.0, dead_letter=None):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.dead_letter = dead_letter
+        self._queue = []  # heap of (not_before, seq, attempts, message, future or None)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+        self._in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.batches = 0
+
+    def send(self, to_email, subject, text_body, html_body=None):
+        """Queue a message; returns immediately"""
+        self.put(build_message(to_email, subject, text_body, html_body))
+
+    def deliver(self, message):
+        """Queue one attempt at message; the Future fails with its error instead of retrying"""
+        future = Future()
+        self.put(message, future=future)
+        return future
+
+    def put(self, message, attempts=0, delay=0.0, future=None):
+        self._ensure_thread()
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), attempts, message, future))
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        # Started lazily (and again after fork) so each gunicorn worker has its own
+        if self._thread_pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='mail-outbox', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _next_batch(self):
+        """Block until messages are due; returns up to batch_size of them"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._queue and self._queue[0][0] <= now:
+                    batch = []
+                    while self._queue and self._queue[0][0] <= now and len(batch) < self.batch_size:
+                        batch.append(heapq.heappop(self._queue))
+                    self._in_flight = len(batch)
+                    return batch
+                self._in_flight = 0
+                self._cond.notify_all()  # wakes flush()
+                self._cond.wait(self._queue[0][0] - now if self._queue else None)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # This is the worker's only sender; it must outlive any bug below
+            try:
+                self._send_batch(batch)
+            except Exception as e:
+                print(f"Error in mail sender: {e}")
+
+    def _send_batch(self, batch):
+        self.batches += 1
+        try:
+            self.transport.open()
+        except Exception as e:
+            for _, _, attempts, message, future in batch:
+                self._failed(message, attempts + 1, e, future)
+            return
+        for _, _, attempts, message, future in batch:
+            self.limiter.acquire()
+            try:
+                self.transport.send(message)
+                self.sent += 1
+            except Exception as e:
+                self._failed(message, attempts + 1, e, future)
+            else:
+                _settle(future, True)
+        with self._cond:
+            idle = not self._queue or self._queue[0][0] > time.monotonic()
+        if idle:
+            self.transport.close()
+
+    def _failed(self, message, attempts, error, future=None):
+        if future is not None:
+            _settle(future, error=error)  # the caller decides whether to retry
+            return
+        if attempts < self.max_attempts:
+            delay = self.base_delay * 2 ** (attempts - 1)
+            print(f"Error sending email to {message['To']} (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+            self.retried += 1
+            self.put(message, attempts, delay)
+            return
+        print(f"Giving up on email to {message['To']} after {attempts} attempts: {error}")
+        self.bury(message, error)
+
+    def bury(self, message, error):
+        """Count a message as given up on and keep it in the dead-letter sink"""
+        self.dead_lettered += 1
+        if self.dead_letter is not None:
+            try:
+                message['X-Dead-Letter-Reason'] = str(error)[:200]
+                self.dead_letter.send(message)
+            except Exception as e:
+                print(f"Error writing dead letter: {e}")
+
+    def flush(self, timeout=None):
+        """Wait until every due message has been handled; True if the queue drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight or (self._queue and self._queue[0][0] <= time.monotonic()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            'queued': queued,
+            'sent': self.sent,
+            'retried': self.retried,
+            'dead_lettered': self.dead_lettered,
+            'batches': self.batches,
+        }
+
+
+def create_outbox(transport=None):
+    name = transport or os.getenv('MAIL_TRANSPORT', 'ses')
+    return Outbox(
+        TRANSPORTS[name](),
+        batch_size=int(os.getenv('MAIL_BATCH_SIZE', 50)),
+        # Each worker's share of the deployment-wide sending quota
+        rate=float(os.getenv('MAIL_RATE_PER_SECOND', 14)) / max(1, int(os.getenv('MAIL_SENDERS', 1))),
+        max_attempts=int(os.getenv('MAIL_MAX_ATTEMPTS', 5)),
+        base_delay=float(os.getenv('MAIL_RETRY_BASE_DELAY', 30)),
+        dead_letter=FileTransport(os.getenv('MAIL_DEAD_LETTER_DIR', '/tmp/gator-market-mail/dead'))
+    )
+
+
+outbox = create_outbox()
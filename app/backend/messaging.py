@@ -1,32 +1,204 @@
 from flask import Blueprint, jsonify, request
-from app import get_db_connection
+from app import get_db_connection, release_db_connection, scheduler
 from auth import token_required
-from datetime import datetime
+from cache import TTLCache
+from events import broker, user_channel
+from jobs import enqueue, job
+from batch_loaders import fetch_images
+from pagination import InvalidCursor, Keyset, apply_page, get_page_size, page_request, page_response, split_page
+from datetime import datetime, timezone
 import json
+import math
+import os
+import threading
 import mysql.connector
 
 messaging_bp = Blueprint('messaging', __name__, url_prefix='/messaging')
 
+# /unread-count is polled by every client; per-worker totals live this long
+unread_count_cache = TTLCache(
+    maxsize=4096,
+    ttl=float(os.getenv('UNREAD_COUNT_CACHE_TTL', 5))
+)
+
+# Usernames never change, so senders can be cached for a long time
+sender_username_cache = TTLCache(
+    maxsize=4096,
+    ttl=float(os.getenv('SENDER_USERNAME_CACHE_TTL', 600))
+)
+
+# Upper bound for one /messaging/events long-poll, in seconds
+EVENTS_POLL_TIMEOUT = float(os.getenv('EVENTS_POLL_TIMEOUT', 25))
+# Parked long-polls per worker: the threads gunicorn.conf.py reserves for them
+EVENTS_POLL_THREADS = int(os.getenv('EVENTS_POLL_THREADS', 32))
+poll_slots = threading.BoundedSemaphore(EVENTS_POLL_THREADS)
+# A turned-away client waits longer than a long-poll would have held it, so
+# retries can't add more load than the polls they replace
+EVENTS_BUSY_RETRY_AFTER = math.ceil(2 * EVENTS_POLL_TIMEOUT)
+
+INBOX_KEYSET = Keyset(
+    ('COALESCE(c.last_message_at, c.created_at)', 'last_message_time'),
+    ('c.conversation_id', 'conversation_id')
+)
+
+def record_message(cursor, conversation_id, sender_id, message_text):
+    """Insert a message and update the conversation summary and unread counters"""
+    cursor.execute("""
+        INSERT INTO messages (conversation_id, sender_id, message_text)
+        VALUES (%s, %s, %s)
+    """, (conversation_id, sender_id, message_text))
+    message_id = cursor.lastrowid
+
+    cursor.execute("""
+        UPDATE conversations
+        SET last_message_id = %s,
+            last_message_at = CURRENT_TIMESTAMP,
+            message_count = message_count + 1,
+            last_updated_at = CURRENT_TIMESTAMP
+        WHERE conversation_id = %s
+    """, (message_id, conversation_id))
+
+    cursor.execute("""
+        UPDATE conversation_participants
+        SET unread_count = unread_count + 1
+        WHERE conversation_id = %s AND user_id != %s
+    """, (conversation_id, sender_id))
+    return message_id
+
+def attach_sender_usernames(cursor, messages):
+    """Set sender_username on each message, querying only senders not in the cache"""
+    usernames = {}
+    missing = []
+    for sender_id in dict.fromkeys(message['sender_id'] for message in messages):
+        username = sender_username_cache.get(sender_id)
+        if username is None:
+            missing.append(sender_id)
+        else:
+            usernames[sender_id] = username
+
+    if missing:
+        cursor.execute(f"""
+            SELECT user_id, username
+            FROM users
+            WHERE user_id IN ({', '.join(['%s'] * len(missing))})
+        """, tuple(missing))
+        for row in cursor.fetchall():
+            usernames[row['user_id']] = row['username']
+            sender_username_cache.set(row['user_id'], row['username'])
+
+    for message in messages:
+        message['sender_username'] = usernames.get(message['sender_id'])
+    return messages
+
+def _optional_int(value):
+    return None if value in (None, '') else int(value)
+
+def publish_new_message(conn, conversation_id, sender_id, message_id, message_text):
+    """Push a committed message and the recipients' new unread totals to their event channels"""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT cp.user_id, SUM(all_cp.unread_count) AS unread_count
+            FROM conversation_participants cp
+            JOIN conversation_participants all_cp ON all_cp.user_id = cp.user_id
+            WHERE cp.conversation_id = %s AND cp.user_id != %s
+            GROUP BY cp.user_id
+        """, (conversation_id, sender_id))
+        recipients = cursor.fetchall()
+    except Exception as e:
+        # The message is already committed; clients fall back to polling
+        print(f"Error publishing message event: {e}")
+        return
+    finally:
+        cursor.close()
+
+    message = {
+        'message_id': message_id,
+        'conversation_id': conversation_id,
+        'sender_id': sender_id,
+        'message_text': message_text,
+        'sent_at': datetime.now(timezone.utc).isoformat()
+    }
+    for recipient in recipients:
+        unread = int(recipient['unread_count'] or 0)
+        unread_count_cache.set(recipient['user_id'], unread)
+        channel = user_channel(recipient['user_id'])
+        broker.publish(channel, 'message', message)
+        broker.publish(channel, 'unread_count', {'count': unread})
+
+# Fan-out only reaches clients of this worker's broker, so it is not persisted
+@job('publish_message', max_attempts=2, persist=False)
+def publish_message_job(conversation_id, sender_id, message_id, message_text):
+    conn = get_db_connection()
+    if conn is None:
+        raise RuntimeError('No database connection')
+    try:
+        publish_new_message(conn, conversation_id, sender_id, message_id, message_text)
+    finally:
+        conn.close()
+
+def queue_new_message(conversation_id, sender_id, message_id, message_text):
+    enqueue('publish_message', {
+        'conversation_id': conversation_id,
+        'sender_id': sender_id,
+        'message_id': message_id,
+        'message_text': message_text
+    })
+
+# Long-poll for new messages and unread-count changes
+@messaging_bp.route('/events', methods=['GET'])
+@token_required
+def poll_events(current_user):
+    try:
+        since = int(request.args.get('since', 0))
+        timeout = float(request.args.get('timeout', EVENTS_POLL_TIMEOUT))
+    except ValueError:
+        return jsonify({'error': 'since must be an event id and timeout a number of seconds'}), 400
+    timeout = min(max(timeout, 0), EVENTS_POLL_TIMEOUT)
+
+    # Don't hold a pooled DB connection while parked waiting for events
+    release_db_connection()
+
+    # Past the reserved poll threads, parking would take threads from ordinary
+    # requests; send the client back to retry instead
+    if not poll_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open event streams, please retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(EVENTS_BUSY_RETRY_AFTER)
+        return response
+    try:
+        events = broker.wait(user_channel(current_user['user_id']), since=since, timeout=timeout)
+    finally:
+        poll_slots.release()
+    return jsonify({
+        'events': events,
+        'last_event_id': events[-1]['id'] if events else since
+    })
+
 # Get unread message count
 @messaging_bp.route('/unread-count', methods=['GET'])
 @token_required
 def get_unread_count(current_user):
+    count = unread_count_cache.get(current_user['user_id'])
+    if count is not None:
+        return jsonify({'count': count})
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
         try:
+            # Sum of the stored per-conversation counters, not a scan of messages
             cursor.execute("""
-                SELECT COUNT(*) as count 
-                FROM messages m
-                JOIN conversation_participants cp ON m.conversation_id = cp.conversation_id
-                WHERE cp.user_id = %s 
-                AND m.sender_id != %s
-                AND (m.sent_at > cp.last_read_at OR cp.last_read_at IS NULL)
-            """, (current_user['user_id'], current_user['user_id']))
+                SELECT COALESCE(SUM(unread_count), 0) as count 
+                FROM conversation_participants
+                WHERE user_id = %s
+            """, (current_user['user_id'],))
             
             result = cursor.fetchone()
-            return jsonify({'count': result['count'] if result else 0})
+            count = int(result['count']) if result else 0
+            unread_count_cache.set(current_user['user_id'], count)
+            return jsonify({'count': count})
         except mysql.connector.Error as e:
             # Handle table not found errors
             if "Table 'gator_market.conversation_participants' doesn't exist" in str(e):
@@ -50,89 +222,70 @@ def get_conversations(current_user):
     user_id = current_user['user_id']
     conn = None
     cursor = None
+
+    try:
+        limit, cursor_values = page_request(request.args, INBOX_KEYSET)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
         try:
-            # Get conversations where user is a participant
-            cursor.execute("""
+            # Inbox rows come from the per-conversation summary columns and
+            # the caller's unread counter; images are fetched in one batch
+            query, params = apply_page("""
                 SELECT 
                     c.*,
-                    (
-                        SELECT COUNT(*) 
-                        FROM messages m 
-                        WHERE m.conversation_id = c.conversation_id AND 
-                              m.sender_id != %s AND 
-                              (m.sent_at > cp.last_read_at OR cp.last_read_at IS NULL)
-                    ) as unread_count,
-                    (
-                        SELECT COUNT(*) 
-                        FROM messages m 
-                        WHERE m.conversation_id = c.conversation_id
-                    ) as message_count,
-                    (
-                        SELECT MAX(m.sent_at) 
-                        FROM messages m 
-                        WHERE m.conversation_id = c.conversation_id
-                    ) as last_message_time,
-                    (
-                        SELECT m.message_text 
-                        FROM messages m 
-                        WHERE m.conversation_id = c.conversation_id 
-                        ORDER BY m.sent_at DESC LIMIT 1
-                    ) as last_message_text,
+                    cp.unread_count,
+                    COALESCE(c.last_message_at, c.created_at) as last_message_time,
+                    m.message_text as last_message_text,
                     p.name as product_name,
                     p.price as product_price,
-                    p.product_id
-                FROM conversations c
-                JOIN conversation_participants cp ON c.conversation_id = cp.conversation_id
+                    p.product_id,
+                    ocp.user_id as other_user_id,
+                    ocp.role as other_role,
+                    ou.username as other_username,
+                    ou.profile_picture_url as other_profile_picture_url
+                FROM conversation_participants cp
+                JOIN conversations c ON c.conversation_id = cp.conversation_id
                 JOIN products p ON c.product_id = p.product_id
+                LEFT JOIN messages m ON m.message_id = c.last_message_id
+                LEFT JOIN conversation_participants ocp
+                    ON ocp.conversation_id = c.conversation_id AND ocp.user_id != cp.user_id
+                LEFT JOIN users ou ON ou.user_id = ocp.user_id
                 WHERE cp.user_id = %s
-                ORDER BY last_message_time DESC
-            """, (user_id, user_id))
-            
-            conversations = cursor.fetchall()
+            """, (user_id,), INBOX_KEYSET, cursor_values, limit)
+            cursor.execute(query, params)
             
-            # Get images and other participant for each conversation
+            conversations, next_cursor = split_page(cursor.fetchall(), INBOX_KEYSET, limit)
+            images = fetch_images(cursor, [convo['product_id'] for convo in conversations])
+
             for convo in conversations:
-                # Fetch product images
-                cursor.execute("""
-                    SELECT image_url 
-                    FROM product_images 
-                    WHERE product_id = %s 
-                    ORDER BY image_id ASC
-                """, (convo['product_id'],))
-                images = cursor.fetchall()
-                
-                # Get other participant for each conversation
-                cursor.execute("""
-                    SELECT cp.user_id, cp.role, u.username, u.profile_picture_url
-                    FROM conversation_participants cp
-                    JOIN users u ON cp.user_id = u.user_id
-                    WHERE cp.conversation_id = %s AND cp.user_id != %s
-                """, (convo['conversation_id'], user_id))
-                
-                other_participant = cursor.fetchone()
-                
                 # Format the conversation data
                 convo['product'] = {
                     'product_id': convo['product_id'],
                     'name': convo['product_name'],
-                    'images': [img['image_url'] for img in images],
-                    'price': float(convo['price']) if convo.get('price') else None
+                    'images': images.get(convo['product_id'], []),
+                    'price': float(convo['product_price']) if convo.get('product_price') else None
                 }
                 
-                convo['other_participant'] = other_participant
+                convo['other_participant'] = None
+                if convo['other_user_id'] is not None:
+                    convo['other_participant'] = {
+                        'user_id': convo['other_user_id'],
+                        'role': convo['other_role'],
+                        'username': convo['other_username'],
+                        'profile_picture_url': convo['other_profile_picture_url']
+                    }
                 
                 # Clean up duplicate fields
-                del convo['product_id']
-                del convo['product_name']
-                if 'price' in convo:
-                    del convo['price']
+                for field in ('product_id', 'product_name', 'other_user_id', 'other_role',
+                              'other_username', 'other_profile_picture_url'):
+                    del convo[field]
             
-            return jsonify(conversations)
+            return page_response(conversations, next_cursor)
             
         except mysql.connector.Error as e:
             # Check for missing tables error
@@ -205,18 +358,10 @@ def create_conversation(current_user):
                 conversation_id = existing_conversation[0]
                 
                 # Add the new message
-                cursor.execute("""
-                    INSERT INTO messages (conversation_id, sender_id, message_text)
-                    VALUES (%s, %s, %s)
-                """, (conversation_id, user_id, data['initial_message']))
-                
-                cursor.execute("""
-                    UPDATE conversations
-                    SET last_updated_at = CURRENT_TIMESTAMP
-                    WHERE conversation_id = %s
-                """, (conversation_id,))
+                message_id = record_message(cursor, conversation_id, user_id, data['initial_message'])
                 
                 conn.commit()
+                queue_new_message(conversation_id, user_id, message_id, data['initial_message'])
                 
                 return jsonify({
                     'message': 'Message added to existing conversation',
@@ -243,12 +388,10 @@ def create_conversation(current_user):
             """, (conversation_id, data['recipient_id']))
             
             # Add initial message
-            cursor.execute("""
-                INSERT INTO messages (conversation_id, sender_id, message_text)
-                VALUES (%s, %s, %s)
-            """, (conversation_id, user_id, data['initial_message']))
+            message_id = record_message(cursor, conversation_id, user_id, data['initial_message'])
             
             conn.commit()
+            queue_new_message(conversation_id, user_id, message_id, data['initial_message'])
             
             return jsonify({
                 'message': 'Conversation created successfully',
@@ -361,6 +504,13 @@ def get_conversation(current_user, conversation_id):
 @token_required
 def get_messages(current_user, conversation_id):
     user_id = current_user['user_id']
+    try:
+        since_message_id = _optional_int(request.args.get('since_message_id'))
+        before_message_id = _optional_int(request.args.get('before_message_id'))
+    except ValueError:
+        return jsonify({'error': 'since_message_id and before_message_id must be message ids'}), 400
+    # Only a page when asked for one; the chat view loads the whole thread
+    limit = get_page_size(request.args) if 'limit' in request.args else None
     conn = None
     cursor = None
     
@@ -379,16 +529,32 @@ def get_messages(current_user, conversation_id):
         if not participant:
             return jsonify({'error': 'You are not a participant in this conversation'}), 403
         
-        # Get messages for this conversation
-        cursor.execute("""
-            SELECT m.*, u.username as sender_username
+        # ?since_message_id= fetches newer messages, ?before_message_id= older
+        # ones; without either the latest ones are returned. Always oldest first.
+        query = """
+            SELECT m.*
             FROM messages m
-            JOIN users u ON m.sender_id = u.user_id
             WHERE m.conversation_id = %s
-            ORDER BY m.sent_at ASC
-        """, (conversation_id,))
-        
+        """
+        params = [conversation_id]
+        if since_message_id is not None:
+            query += " AND m.message_id > %s"
+            params.append(since_message_id)
+        if before_message_id is not None:
+            query += " AND m.message_id < %s"
+            params.append(before_message_id)
+        # Walks idx_messages_conversation (conversation_id, message_id)
+        order = 'ASC' if since_message_id is not None else 'DESC'
+        query += f" ORDER BY m.message_id {order}"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+
+        cursor.execute(query, tuple(params))
         messages = cursor.fetchall()
+        if order == 'DESC':
+            messages.reverse()
+        attach_sender_usernames(cursor, messages)
         
         return jsonify(messages)
     except Exception as e:
@@ -431,20 +597,11 @@ def send_message(current_user, conversation_id):
         if not participant:
             return jsonify({'error': 'You are not a participant in this conversation'}), 403
         
-        # Insert the new message
-        cursor.execute("""
-            INSERT INTO messages (conversation_id, sender_id, message_text)
-            VALUES (%s, %s, %s)
-        """, (conversation_id, user_id, data['message_text']))
-        
-        # Update the conversation's last_updated_at timestamp
-        cursor.execute("""
-            UPDATE conversations
-            SET last_updated_at = CURRENT_TIMESTAMP
-            WHERE conversation_id = %s
-        """, (conversation_id,))
+        # Insert the new message and update the conversation summary
+        message_id = record_message(cursor, conversation_id, user_id, data['message_text'])
         
         conn.commit()
+        queue_new_message(conversation_id, user_id, message_id, data['message_text'])
         
         return jsonify({'message': 'Message sent successfully'}), 201
     except Exception as e:
@@ -473,11 +630,13 @@ def mark_as_read(current_user, conversation_id):
         # Update the last_read_at timestamp for this user in this conversation
         cursor.execute("""
             UPDATE conversation_participants
-            SET last_read_at = CURRENT_TIMESTAMP
+            SET last_read_at = CURRENT_TIMESTAMP,
+                unread_count = 0
             WHERE conversation_id = %s AND user_id = %s
         """, (conversation_id, user_id))
         
         conn.commit()
+        unread_count_cache.delete(user_id)
         
         return jsonify({'message': 'Messages marked as read'}), 200
     except Exception as e:
@@ -489,4 +648,98 @@ def mark_as_read(current_user, conversation_id):
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+def _in_conversations(column, conversation_ids):
+    # SQL condition and params limiting a query to conversation_ids (None: all)
+    if conversation_ids is None:
+        return 'TRUE', ()
+    return f"{column} IN ({', '.join(['%s'] * len(conversation_ids))})", tuple(conversation_ids)
+
+def reconcile_unread_counters(cursor, conversation_ids=None):
+    """Reset unread counters that drifted from the messages table; returns rows fixed.
+
+    Covers every conversation, or only conversation_ids when given.
+    """
+    inner, inner_params = _in_conversations('cp2.conversation_id', conversation_ids)
+    outer, outer_params = _in_conversations('cp.conversation_id', conversation_ids)
+    cursor.execute(f"""
+        UPDATE conversation_participants cp
+        LEFT JOIN (
+            SELECT cp2.id, COUNT(m.message_id) AS unread
+            FROM conversation_participants cp2
+            JOIN messages m ON m.conversation_id = cp2.conversation_id
+                AND m.sender_id != cp2.user_id
+                AND (cp2.last_read_at IS NULL OR m.sent_at > cp2.last_read_at)
+            WHERE {inner}
+            GROUP BY cp2.id
+        ) u ON u.id = cp.id
+        SET cp.unread_count = COALESCE(u.unread, 0)
+        WHERE cp.unread_count != COALESCE(u.unread, 0) AND {outer}
+    """, inner_params + outer_params)
+    return cursor.rowcount
+
+def refresh_conversation_summaries(cursor, conversation_ids=None):
+    """Recompute message_count and the last message of conversations from messages.
+
+    Covers every conversation, or only conversation_ids when given; returns rows updated.
+    """
+    inner, inner_params = _in_conversations('conversation_id', conversation_ids)
+    outer, outer_params = _in_conversations('c.conversation_id', conversation_ids)
+    cursor.execute(f"""
+        UPDATE conversations c
+        LEFT JOIN (
+            SELECT conversation_id, COUNT(*) AS message_count, MAX(message_id) AS last_message_id
+            FROM messages
+            WHERE {inner}
+            GROUP BY conversation_id
+        ) s ON s.conversation_id = c.conversation_id
+        LEFT JOIN messages m ON m.message_id = s.last_message_id
+        SET c.message_count = COALESCE(s.message_count, 0),
+            c.last_message_id = s.last_message_id,
+            c.last_message_at = m.sent_at
+        WHERE {outer}
+    """, inner_params + outer_params)
+    return cursor.rowcount
+
+def rebuild_inbox_summaries():
+    """Recompute conversation summaries and unread counters from messages"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        conversations = refresh_conversation_summaries(cursor)
+        participants = reconcile_unread_counters(cursor)
+        conn.commit()
+        return conversations, participants
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+@scheduler.task('interval', id='reconcile_unread_counters',
+                minutes=int(os.getenv('UNREAD_RECONCILE_MINUTES', 60)))
+def reconcile_unread_counters_job():
+    """Periodic repair of counters that missed an update (e.g. a crash mid-request)"""
+    conn = get_db_connection()
+    if conn is None:
+        return
+    cursor = conn.cursor()
+    try:
+        fixed = reconcile_unread_counters(cursor)
+        conn.commit()
+        if fixed:
+            print(f"Reconciled {fixed} unread counters")
+    except Exception as e:
+        conn.rollback()
+        print(f"Error reconciling unread counters: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+@messaging_bp.cli.command('rebuild-inbox')
+def rebuild_inbox_command():
+    """Backfill or repair conversation summaries and unread counters"""
+    conversations, participants = rebuild_inbox_summaries()
+    print(f"Updated {conversations} conversations and {participants} unread counters")
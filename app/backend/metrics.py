@@ -0,0 +1,350 @@
+"""Prometheus text exposition at /metrics, aggregated across gunicorn workers.
+
+Request hooks record a latency histogram per blueprint, endpoint, method and
+status, plus the number of requests in flight. That is a bisect and a few
+list updates under one lock per request (benchmarks/metrics_overhead.py
+measures it). Everything else is read from the objects that already keep
+stats, such as the DB pool, caches, password hasher and mail outbox. Those
+collectors run only when a snapshot is taken, never on the request path.
+
+Each worker writes its snapshot to METRICS_DIR/<pid>.json every
+METRICS_FLUSH_INTERVAL seconds, and /metrics in any worker merges all the
+files. Counters and histograms are summed. Gauges are summed over live
+workers only. When gunicorn reaps a worker, its child_exit hook calls
+mark_process_dead(pid), which folds the worker's counters into dead.json so
+totals never go backwards. Without METRICS_DIR (dev server, tests) only
+the current process is reported.
+
+Every `<x>_hits_total` family with a matching `<x>_misses_total` also gets
+a `<x>_hit_ratio` gauge, computed from the merged totals.
+
+Set METRICS_TOKEN to require `Authorization: Bearer <token>` on /metrics.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+# Request latency buckets in seconds; long-polls land in the top ones
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ARCHIVE = 'dead.json'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms for one process"""
+
+    def __init__(self, directory=None, flush_interval=5.0, buckets=BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._families = {}  # name -> (type, help)
+        self._values = {}  # (name, labels) -> counter or gauge value
+        self._histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._collectors = []
+        self._in_flight = 0
+        self._flusher_pid = None
+
+        self.describe('http_requests_in_flight', 'gauge', 'Requests being handled')
+        self.describe('http_request_duration_seconds', 'histogram',
+                      'Request latency by blueprint, endpoint, method and status')
+
+    def describe(self, name, kind, help_text):
+        self._families[name] = (kind, help_text)
+
+    def register(self, collector):
+        """collector() yields (name, labels, value); it runs at snapshot time"""
+        self._collectors.append(collector)
+
+    def inc(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        key = (name, labels)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    # Flask hooks
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+    def _before_request(self):
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        g.metrics_started = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+
+    def _after_request(self, response):
+        started = g.get('metrics_started')
+        if started is not None:
+            self.observe('http_request_duration_seconds', time.perf_counter() - started, (
+                ('blueprint', request.blueprint or ''),
+                ('endpoint', request.endpoint or 'unmatched'),
+                ('method', request.method),
+                ('status', str(response.status_code)),
+            ))
+        return response
+
+    def _teardown_request(self, exc=None):
+        if g.pop('metrics_started', None) is not None:
+            with self._lock:
+                self._in_flight -= 1
+
+    def view(self):
+        token = os.getenv('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', 401, mimetype='text/plain')
+        return Response(self.render(self.collect()), mimetype='text/plain; version=0.0.4')
+
+    # Snapshots and aggregation
+
+    def snapshot(self):
+        values = []
+        for collector in self._collectors:
+            try:
+                values.extend([name, list(labels), value] for name, labels, value in collector())
+            except Exception as e:
+                print(f"Error collecting metrics from {getattr(collector, '__name__', collector)}: {e}")
+        with self._lock:
+            values.append(['http_requests_in_flight', [], self._in_flight])
+            values.extend([name, list(labels), value] for (name, labels), value in self._values.items())
+            histograms = [[name, list(labels), list(entry)] for (name, labels), entry in self._histograms.items()]
+        return {'pid': os.getpid(), 'values': values, 'histograms': histograms}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(f'.{name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _read(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self):
+        if self.directory:
+            self._write(f'{os.getpid()}.json', self.snapshot())
+
+    def _start_flusher(self):
+        # One per worker, started on its first request (and again after fork)
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+
+    def _dir_lock(self):
+        import fcntl
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self._path('.lock'), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock  # closing it releases the lock
+
+    def collect(self):
+        """Merged families from every worker: {name: {(labels): value or histogram entry}}"""
+        if not self.directory:
+            return self.merge([self.snapshot()])
+        self.flush()
+        with self._dir_lock():
+            snapshots = [self._read(name) for name in os.listdir(self.directory) if name.endswith('.json')]
+        return self.merge([snapshot for snapshot in snapshots if snapshot])
+
+    def merge(self, snapshots):
+        merged = {}
+        for snapshot in snapshots:
+            dead = snapshot.get('pid') is None
+            for name, labels, value in snapshot['values']:
+                if dead and self._families.get(name, ('gauge',))[0] == 'gauge':
+                    continue
+                family = merged.setdefault(name, {})
+                key = tuple(tuple(pair) for pair in labels)
+                family[key] = family.get(key, 0) + value
+            for name, labels, entry in snapshot['histograms']:
+                family = merged.setdefault(name, {})
+                key = tuple(tuple(pair) for pair in labels)
+                total = family.get(key)
+                family[key] = entry if total is None else [a + b for a, b in zip(total, entry)]
+        self._derive_ratios(merged)
+        return merged
+
+    def _derive_ratios(self, merged):
+        for name in list(merged):
+            if not name.endswith('_hits_total'):
+                continue
+            prefix = name[:-len('_hits_total')]
+            misses = merged.get(f'{prefix}_misses_total')
+            if misses is None:
+                continue
+            ratios = merged.setdefault(f'{prefix}_hit_ratio', {})
+            for labels, hits in merged[name].items():
+                lookups = hits + misses.get(labels, 0)
+                ratios[labels] = round(hits / lookups, 4) if lookups else 0.0
+            if f'{prefix}_hit_ratio' not in self._families:
+                self.describe(f'{prefix}_hit_ratio', 'gauge', f'Hit ratio derived from {name}')
+
+    def mark_process_dead(self, pid):
+        """Fold a dead worker's counters and histograms into the archive"""
+        if not self.directory:
+            return
+        with self._dir_lock():
+            snapshot = self._read(f'{pid}.json')
+            if snapshot is None:
+                return
+            archive = self._read(ARCHIVE) or {'pid': None, 'values': [], 'histograms': []}
+            snapshot['pid'] = None
+            merged = self.merge([archive, snapshot])
+            self._write(ARCHIVE, {
+                'pid': None,
+                'values': [[name, list(labels), value] for name, family in merged.items()
+                           if self._families.get(name, ('gauge',))[0] == 'counter'
+                           for labels, value in family.items()],
+                'histograms': [[name, list(labels), entry] for name, family in merged.items()
+                               if self._families.get(name, ('gauge',))[0] == 'histogram'
+                               for labels, entry in family.items()],
+            })
+            os.remove(self._path(f'{pid}.json'))
+
+    def clear(self):
+        """Remove every snapshot, e.g. when the gunicorn master starts"""
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(self._path(name))
+
+    # Exposition
+
+    def render(self, merged):
+        lines = []
+        for name in sorted(merged):
+            kind, help_text = self._families.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(merged[name].items()):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float('inf')), value[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(
+    directory=os.getenv('METRICS_DIR') or None,
+    flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+)
+
+for _name, _kind, _help in (
+    ('upload_bytes_total', 'counter', 'Image bytes stored by uploads'),
+    ('uploads_total', 'counter', 'Images stored by uploads'),
+    ('db_pool_connections', 'gauge', 'Pooled MySQL connections by state'),
+    ('db_pool_checkouts_total', 'counter', 'Connections handed out by the pool'),
+    ('db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection'),
+    ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection'),
+    ('response_cache_hits_total', 'counter', 'Response cache hits by endpoint'),
+    ('response_cache_misses_total', 'counter', 'Response cache misses by endpoint'),
+    ('cache_hits_total', 'counter', 'In-process cache hits by cache'),
+    ('cache_misses_total', 'counter', 'In-process cache misses by cache'),
+    ('password_hash_pending', 'gauge', 'bcrypt operations queued or running'),
+    ('password_hash_rejected_total', 'counter', 'bcrypt operations refused because the queue was full'),
+    ('password_hash_operations_total', 'counter', 'bcrypt hashes and checks completed'),
+    ('mail_queued', 'gauge', 'Emails waiting in the outbox'),
+    ('mail_sent_total', 'counter', 'Emails sent'),
+    ('mail_dead_lettered_total', 'counter', 'Emails given up on after retries'),
+):
+    metrics.describe(_name, _kind, _help)
+
+
+def app_stats():
+    """Read the stats the app already keeps; imported lazily so app.py can import this module"""
+    from app import db_pool
+    from auth import user_cache
+    from categories import category_cache
+    from messaging import sender_username_cache, unread_count_cache
+    from products import image_etag_cache, image_product_cache, product_status_cache
+    from mailer import outbox
+    from passwords import hasher
+    from response_cache import response_cache
+
+    pool = db_pool.stats()
+    yield 'db_pool_connections', (('state', 'idle'),), pool['idle']
+    yield 'db_pool_connections', (('state', 'in_use'),), pool['in_use']
+    yield 'db_pool_checkouts_total', (), pool['checkouts']
+    yield 'db_pool_timeouts_total', (), pool['timeouts']
+    yield 'db_pool_wait_seconds_total', (), pool['wait_seconds_total']
+
+    for endpoint, stats in response_cache.stats()['endpoints'].items():
+        yield 'response_cache_hits_total', (('endpoint', endpoint),), stats['hits']
+        yield 'response_cache_misses_total', (('endpoint', endpoint),), stats['misses']
+    for name, cache in (('auth_users', user_cache), ('image_products', image_product_cache),
+                        ('product_status', product_status_cache), ('image_etags', image_etag_cache),
+                        ('categories', category_cache), ('unread_counts', unread_count_cache),
+                        ('sender_usernames', sender_username_cache)):
+        stats = cache.stats()
+        yield 'cache_hits_total', (('cache', name),), stats['hits']
+        yield 'cache_misses_total', (('cache', name),), stats['misses']
+
+    hashing = hasher.stats()
+    yield 'password_hash_pending', (), hashing['pending']
+    yield 'password_hash_rejected_total', (), hashing['rejected']
+    yield 'password_hash_operations_total', (), hashing['hashes'] + hashing['checks']
+
+    mail = outbox.stats()
+    yield 'mail_queued', (), mail['queued']
+    yield 'mail_sent_total', (), mail['sent']
+    # Includes send_email jobs, which bury() their message after the last attempt
+    yield 'mail_dead_lettered_total', (), mail['dead_lettered']
+
+
+metrics.register(app_stats)
@@ -0,0 +1,142 @@
+"""Versioned schema migrations.
+
+init.sql only creates the baseline schema when the MySQL volume is first
+initialised. Every schema change after that is a file in migrations/ named
+<version>_<description>.sql. Files are applied in version order, and each
+applied version is recorded in schema_migrations, so every database
+(existing volumes, fresh ones and the test database) converges on the same
+schema. gunicorn applies pending migrations in the master before forking
+workers (MIGRATE_ON_START, on by default). To run them by hand:
+
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending versions
+
+MySQL DDL is not transactional, so a migration that fails halfway stays
+partly applied. Statements that fail only because their change is already
+in place are skipped, which means fixing and re-running the file is safe.
+"""
+import argparse
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Table exists, duplicate column, duplicate key name
+ALREADY_APPLIED = {1050, 1060, 1061}
+
+# Only one runner at a time, across every process and host
+LOCK_NAME = 'gator_market_migrations'
+LOCK_TIMEOUT = 60
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] for every migration file, in version order"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f'Duplicate migration versions in {directory}')
+    return migrations
+
+
+def split_statements(sql):
+    """Statements of a migration file; `--` comment lines are dropped"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending(cursor, directory=MIGRATIONS_DIR):
+    applied = applied_versions(cursor)
+    return [migration for migration in discover(directory) if migration[0] not in applied]
+
+
+def apply(cursor, path):
+    with open(path) as f:
+        statements = split_statements(f.read())
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+        except Exception as e:
+            if getattr(e, 'errno', None) not in ALREADY_APPLIED:
+                raise
+            print(f"Skipping already applied statement in {os.path.basename(path)}: {e}")
+
+
+def migrate(conn, directory=MIGRATIONS_DIR):
+    """Apply every pending migration in order; returns the versions applied"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError('Timed out waiting for another migration run')
+        try:
+            done = []
+            for version, name, path in pending(cursor, directory):
+                print(f"Applying migration {version:04d}_{name}")
+                apply(cursor, path)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+                done.append(version)
+            return done
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def connect():
+    import mysql.connector
+    return mysql.connector.connect(
+        host=os.getenv('MYSQL_HOST'),
+        user=os.getenv('MYSQL_USER'),
+        password=os.getenv('MYSQL_PASSWORD'),
+        database=os.getenv('MYSQL_DATABASE')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    conn = connect()
+    try:
+        if args.status:
+            cursor = conn.cursor()
+            applied = applied_versions(cursor)
+            cursor.close()
+            for version, name, _ in discover():
+                print(f"{version:04d}_{name}: {'applied' if version in applied else 'pending'}")
+            return
+        done = migrate(conn)
+        print(f"Applied {len(done)} migration(s)" if done else "Schema is up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+-- Indexes for the filters and orderings of the hot read paths. Each comment
+-- names the handler query the index serves.
+
+-- products.search_products: approved, active listings newest first, optionally
+-- by category; admin.get_pending_products uses the approval_status prefix.
+-- products.create_product's active listing count and search by seller.
+ALTER TABLE products
+    ADD INDEX idx_products_visible_created (approval_status, status, created_at),
+    ADD INDEX idx_products_visible_category (approval_status, status, category_id, created_at),
+    ADD INDEX idx_products_user_status (user_id, status);
+
+-- reviews.get_reviews_for_seller pages by (created_at, review_id)
+ALTER TABLE reviews
+    ADD INDEX idx_reviews_seller_created (seller_id, created_at);
+
+-- messaging.reconcile_unread_counters: messages after a participant's last read
+ALTER TABLE messages
+    ADD INDEX idx_messages_conversation_sent (conversation_id, sent_at);
+
+-- wishlist.get_wishlist and get_archived_wishlist
+ALTER TABLE wishlist_tracking
+    ADD INDEX idx_wishlist_user_archived (user_id, archived);
+
+-- email_verification.purge_expired_accounts candidates, and the token
+-- lookups in /verify/confirm, /get-verified-user and /delete-account
+ALTER TABLE users
+    ADD INDEX idx_users_verification (verification_status, verification_token_created_at),
+    ADD INDEX idx_users_verification_token (verification_token);
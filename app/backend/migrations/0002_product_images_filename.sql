@@ -0,0 +1,14 @@
+-- products.lookup_image finds an upload by product_images.filename. Databases
+-- created before that column existed get it here, and rows written before it
+-- are backfilled from the last segment of their image_url.
+ALTER TABLE product_images
+    ADD COLUMN filename VARCHAR(255) NULL;
+
+ALTER TABLE product_images
+    ADD UNIQUE KEY uq_product_images_filename (filename);
+
+-- Only uploads are served by serve_image; IGNORE leaves a file referenced by
+-- more than one row filled in on the first row only
+UPDATE IGNORE product_images
+SET filename = SUBSTRING_INDEX(image_url, '/', -1)
+WHERE filename IS NULL AND image_url LIKE '/products/serve-image/%';
@@ -0,0 +1,3 @@
+-- products.search_products ranks term searches with MATCH ... AGAINST
+ALTER TABLE products
+    ADD FULLTEXT KEY ft_products_name_description (name, description);
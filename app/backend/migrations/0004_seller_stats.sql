@@ -0,0 +1,15 @@
+-- Running rating totals per seller, kept in step with reviews by
+-- reviews.create_review and rebuilt with `flask reviews rebuild-seller-stats`
+CREATE TABLE IF NOT EXISTS seller_stats (
+    seller_id INT PRIMARY KEY,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (seller_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Recomputed from reviews, so a re-run converges on the same totals
+INSERT INTO seller_stats (seller_id, rating_sum, rating_count)
+SELECT seller_id, SUM(rating), COUNT(*)
+FROM reviews
+GROUP BY seller_id
+ON DUPLICATE KEY UPDATE rating_sum = VALUES(rating_sum), rating_count = VALUES(rating_count);
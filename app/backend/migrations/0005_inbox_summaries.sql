@@ -0,0 +1,36 @@
+-- Inbox summary maintained by messaging.record_message, and per-participant
+-- unread counters served by /messaging/unread-count
+ALTER TABLE conversations
+    ADD COLUMN last_message_id INT NULL;
+
+ALTER TABLE conversations
+    ADD COLUMN last_message_at TIMESTAMP NULL;
+
+ALTER TABLE conversations
+    ADD COLUMN message_count INT NOT NULL DEFAULT 0;
+
+ALTER TABLE conversation_participants
+    ADD COLUMN unread_count INT NOT NULL DEFAULT 0;
+
+-- Same as `flask messaging rebuild-inbox`
+UPDATE conversations c
+LEFT JOIN (
+    SELECT conversation_id, COUNT(*) AS message_count, MAX(message_id) AS last_message_id
+    FROM messages
+    GROUP BY conversation_id
+) s ON s.conversation_id = c.conversation_id
+LEFT JOIN messages m ON m.message_id = s.last_message_id
+SET c.message_count = COALESCE(s.message_count, 0),
+    c.last_message_id = s.last_message_id,
+    c.last_message_at = m.sent_at;
+
+UPDATE conversation_participants cp
+LEFT JOIN (
+    SELECT cp2.id, COUNT(m.message_id) AS unread
+    FROM conversation_participants cp2
+    JOIN messages m ON m.conversation_id = cp2.conversation_id
+        AND m.sender_id != cp2.user_id
+        AND (cp2.last_read_at IS NULL OR m.sent_at > cp2.last_read_at)
+    GROUP BY cp2.id
+) u ON u.id = cp.id
+SET cp.unread_count = COALESCE(u.unread, 0);
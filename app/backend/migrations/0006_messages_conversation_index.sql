@@ -0,0 +1,3 @@
+-- messaging.get_messages pages a conversation by message_id (since/before)
+ALTER TABLE messages
+    ADD KEY idx_messages_conversation (conversation_id, message_id);
@@ -0,0 +1,14 @@
+-- Persisted jobs for jobs.JobQueue; swept by sweep_background_jobs
+CREATE TABLE IF NOT EXISTS background_jobs (
+    job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(64) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('queued', 'running', 'succeeded', 'failed') DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(1000) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    KEY idx_background_jobs_due (status, run_after)
+);
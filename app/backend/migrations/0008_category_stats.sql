@@ -0,0 +1,16 @@
+-- Approved, active listings per category, kept in step with products by the
+-- listing handlers and rebuilt with `flask products rebuild-category-stats`
+CREATE TABLE IF NOT EXISTS category_stats (
+    category_id INT PRIMARY KEY,
+    active_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (category_id) REFERENCES categories(category_id) ON DELETE CASCADE
+);
+
+-- Recomputed from products, so a re-run converges on the same counts
+INSERT INTO category_stats (category_id, active_count)
+SELECT c.category_id, COUNT(p.product_id)
+FROM categories c
+LEFT JOIN products p ON p.category_id = c.category_id
+    AND p.approval_status = 'approved' AND p.status = 'active'
+GROUP BY c.category_id
+ON DUPLICATE KEY UPDATE active_count = VALUES(active_count);
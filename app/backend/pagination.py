@@ -0,0 +1,148 @@
+"""Keyset (cursor) pagination shared by the list endpoints.
+
+A page is requested with ?limit=N&cursor=TOKEN. The body stays a plain JSON
+list; when more rows exist the opaque token for the next page is returned
+in the X-Next-Cursor response header. A request with neither parameter gets
+the whole list, as before pagination, so callers that don't follow
+X-Next-Cursor still see every row.
+"""
+import base64
+import datetime
+import json
+
+from flask import jsonify
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor token that was not produced by encode_cursor"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    # Only what _encode_value can produce; anything else would reach the query
+    if isinstance(value, dict) and value.keys() == {'dt'} and isinstance(value['dt'], str):
+        return datetime.datetime.fromisoformat(value['dt'])
+    if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+        return value
+    raise InvalidCursor('Invalid cursor')
+
+
+def encode_cursor(values):
+    payload = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    try:
+        return [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def get_page_size(args, default=DEFAULT_PAGE_SIZE):
+    """Clamp ?limit= to [1, MAX_PAGE_SIZE]"""
+    try:
+        limit = int(args.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+class Keyset:
+    """Ordering columns for one endpoint, e.g. Keyset(('p.created_at', 'created_at'), ('p.product_id', 'product_id')).
+
+    Each column is (sql_expression, result_key) or, for expressions with
+    placeholders, (sql_expression, result_key, params). All columns sort in
+    the same direction; the last column must be unique.
+    """
+
+    def __init__(self, *columns, descending=True):
+        self.columns = [column if len(column) == 3 else (*column, ()) for column in columns]
+        self.descending = descending
+
+    def order_by(self):
+        direction = 'DESC' if self.descending else 'ASC'
+        sql = ' ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _, _ in self.columns)
+        return sql, [p for _, _, params in self.columns for p in params]
+
+    def where(self, cursor_values):
+        """SQL predicate and params selecting rows after the cursor position.
+
+        Expanded into OR-ed prefixes rather than a row constructor so MySQL
+        can range-scan the matching index.
+        """
+        op = '<' if self.descending else '>'
+        clauses = []
+        params = []
+        for i, (expr, _, expr_params) in enumerate(self.columns):
+            parts = []
+            for j, (prev, _, prev_params) in enumerate(self.columns[:i]):
+                parts.append(f'{prev} = %s')
+                params.extend(prev_params)
+                params.append(cursor_values[j])
+            parts.append(f'{expr} {op} %s')
+            params.extend(expr_params)
+            params.append(cursor_values[i])
+            clauses.append('(' + ' AND '.join(parts) + ')')
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    def cursor_for(self, row):
+        return encode_cursor([row[key] for _, key, _ in self.columns])
+
+
+def page_request(args, keyset):
+    """Parse ?limit= and ?cursor= into (limit, cursor_values or None).
+
+    limit is None, meaning no LIMIT, when the request has neither.
+    """
+    token = args.get('cursor')
+    if not token:
+        return (get_page_size(args) if 'limit' in args else None), None
+    return get_page_size(args), decode_cursor(token, len(keyset.columns))
+
+
+def apply_page(query, params, keyset, cursor_values, limit, has_where=True):
+    """Append the cursor predicate, ORDER BY and LIMIT (one extra row to detect a next page)"""
+    if cursor_values is not None:
+        clause, clause_params = keyset.where(cursor_values)
+        query += (' AND ' if has_where else ' WHERE ') + clause
+        params = list(params) + clause_params
+    order_by, order_params = keyset.order_by()
+    query += order_by
+    params = tuple(params) + tuple(order_params)
+    if limit is None:
+        return query, params
+    return query + ' LIMIT %s', params + (limit + 1,)
+
+
+def split_page(rows, keyset, limit):
+    """Trim the extra row fetched by apply_page; returns (rows, next_cursor or None)"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, keyset.cursor_for(rows[-1])
+
+
+def page_response(rows, next_cursor):
+    """jsonify a page, advertising the next page in X-Next-Cursor"""
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
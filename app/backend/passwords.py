@@ -0,0 +1,184 @@
+"""bcrypt hashing off the request thread, in a bounded process pool.
+
+A bcrypt hash at cost 12 is ~250 ms of CPU, which under the GIL stalls every
+other thread in the worker. PasswordHasher runs hashes in a small process
+pool per worker and admits at most `max_pending` of them at a time; beyond
+that hash_password/check_password raise HasherBusy straight away so the
+handler can answer 503 instead of queueing logins behind each other. A call
+that waits longer than `timeout` also raises HasherBusy; its job keeps its
+slot until the pool has run it.
+
+BCRYPT_ROUNDS sets the work factor for new hashes. Stored hashes with a
+different factor are recognised by needs_rehash, and login rewrites them.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool already has max_pending jobs, or one times out"""
+
+
+def _hashpw(password, rounds):
+    started = time.time()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, started, time.time() - started
+
+
+def _checkpw(password, hashed):
+    started = time.time()
+    matches = bcrypt.checkpw(password, hashed)
+    return matches, started, time.time() - started
+
+
+def hash_rounds(hashed):
+    """Work factor of a stored bcrypt hash ($2b$<rounds>$...), or None"""
+    parts = hashed.split('$')
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+
+class PasswordHasher:
+    """bcrypt in a process pool with admission control and timing metrics.
+
+    workers=0 hashes on the calling thread (still counted and bounded),
+    which is what tests and single-threaded dev servers want.
+    """
+
+    def __init__(self, rounds=12, workers=1, max_pending=16, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._pending = 0
+        self._stats = {'hashes': 0, 'checks': 0, 'rejected': 0,
+                       'hash_seconds_total': 0.0, 'hash_seconds_max': 0.0,
+                       'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+
+    def _pool(self):
+        # Created on first use, and again after fork: a pool inherited from a
+        # preloading gunicorn master would point at the master's processes
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    # forkserver children start from a clean process that only
+                    # imports this module, not a copy of the threaded worker
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('forkserver')
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        # Its child died (e.g. OOM-killed); the next _pool() call starts a new one
+        with self._lock:
+            if self._executor is executor:
+                self._executor_pid = None
+        executor.shutdown(wait=False)
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise HasherBusy('Too many password operations in progress')
+        with self._lock:
+            self._pending += 1
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _submit(self, func, *args):
+        self._admit()
+        executor = self._pool()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            raise
+        # The slot is held until the pool is done with the job, even if the
+        # caller stops waiting, so max_pending bounds the real backlog
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy('Password operation timed out')
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _run(self, func, *args):
+        submitted = time.time()
+        if self.workers:
+            try:
+                result, started, seconds = self._submit(func, *args)
+            except BrokenProcessPool:
+                # Hashing has no side effects, so one retry on a fresh pool is safe
+                result, started, seconds = self._submit(func, *args)
+        else:
+            self._admit()
+            try:
+                result, started, seconds = func(*args)
+            finally:
+                self._release()
+        self._record(max(0.0, started - submitted), seconds)
+        return result
+
+    def _record(self, waited, seconds):
+        with self._lock:
+            stats = self._stats
+            stats['wait_seconds_total'] += waited
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+            stats['hash_seconds_total'] += seconds
+            stats['hash_seconds_max'] = max(stats['hash_seconds_max'], seconds)
+
+    def hash_password(self, password):
+        """bcrypt hash of password (str) at the configured work factor, as str"""
+        hashed = self._run(_hashpw, password.encode('utf-8'), self.rounds)
+        with self._lock:
+            self._stats['hashes'] += 1
+        return hashed.decode('utf-8')
+
+    def check_password(self, password, hashed):
+        matches = self._run(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        with self._lock:
+            self._stats['checks'] += 1
+        return matches
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            operations = stats['hashes'] + stats['checks']
+            stats.update({
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'hash_seconds_avg': stats['hash_seconds_total'] / operations if operations else 0.0,
+                'wait_seconds_avg': stats['wait_seconds_total'] / operations if operations else 0.0,
+            })
+            return stats
+
+
+hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', 12)),
+    workers=int(os.getenv('HASH_WORKERS', 1)),
+    max_pending=int(os.getenv('HASH_MAX_PENDING', 16)),
+    timeout=float(os.getenv('HASH_TIMEOUT', 10))
+)
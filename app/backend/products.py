@@ -1,10 +1,20 @@
 from flask import Blueprint, jsonify, request, send_from_directory
 from app import get_db_connection
 from auth import token_required
+from batch_loaders import attach_images, attach_seller_ratings
+from cache import TTLCache
+from categories import adjust_category_counts, load_categories, lookup_category_id
+from image_variants import SIZES as IMAGE_SIZES, pick_variant, schedule_variants, variant_filenames
+from lazy import Lazy
+from metrics import metrics
+from pagination import InvalidCursor, Keyset, apply_page, page_request, page_response, split_page
+from response_cache import cached_response, invalidate_responses, tag_response
+from werkzeug.utils import safe_join
+import hashlib
+import importlib
 import os
 import uuid
 import re
-import magic  # for MIME type checking
 
 products_bp = Blueprint('products', __name__, url_prefix='/products')
 
@@ -12,24 +22,200 @@ UPLOAD_FOLDER = '/app/product_images'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 ALLOWED_MIMES = {'image/png', 'image/jpeg'}
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+SEARCH_KEYSET = Keyset(('p.created_at', 'created_at'), ('p.product_id', 'product_id'))
+
+# Product pages and search results are served from response_cache; writes
+# to a listing invalidate its page and every cached search
+PRODUCT_RESPONSE_TTL = float(os.getenv('PRODUCT_RESPONSE_TTL', 30))
+SEARCH_RESPONSE_TTL = float(os.getenv('SEARCH_RESPONSE_TTL', 15))
+SEARCH_ARGS_NORMALIZE = {
+    'term': lambda value: ' '.join(value.lower().split()),
+    'category': lambda value: '' if value == 'All Categories' else value,
+}
+
+# Must match innodb_ft_min_token_size; shorter words are not in the FULLTEXT index
+FULLTEXT_MIN_WORD = 3
+FULLTEXT_MATCH = "MATCH(p.name, p.description) AGAINST (%s IN BOOLEAN MODE)"
+
+# serve_image lookups: filename -> product_id never changes once stored, while
+# approval status is cached per product so moderation can update it in place
+image_product_cache = TTLCache(
+    maxsize=int(os.getenv('IMAGE_CACHE_SIZE', 20000)),
+    ttl=float(os.getenv('IMAGE_CACHE_TTL', 3600))
+)
+product_status_cache = TTLCache(
+    maxsize=int(os.getenv('IMAGE_CACHE_SIZE', 20000)),
+    ttl=float(os.getenv('PRODUCT_STATUS_CACHE_TTL', 60))
+)
+# Unknown filenames are remembered briefly so scans for missing images stay off the DB
+IMAGE_MISS_TTL = 30
+_NOT_CACHED = object()
+
+# Approval can be withdrawn and the same URL then has to stop serving the image,
+# so approved images are only cached briefly and revalidated with their ETag
+# after that. The placeholder is served at the product's own image URL and must
+# be replaced once the product is approved, so it gets a short TTL as well.
+PENDING_IMAGE_FOLDER = '/app/static/images'
+APPROVED_IMAGE_MAX_AGE = int(os.getenv('APPROVED_IMAGE_MAX_AGE', 300))
+PENDING_IMAGE_MAX_AGE = int(os.getenv('PENDING_IMAGE_MAX_AGE', 60))
+# (path, mtime, size) -> content hash, so each file is hashed once per worker
+image_etag_cache = TTLCache(
+    maxsize=int(os.getenv('IMAGE_CACHE_SIZE', 20000)),
+    ttl=float(os.getenv('IMAGE_CACHE_TTL', 3600))
+)
+
+# Per-file cap; app.config['MAX_CONTENT_LENGTH'] bounds the whole request
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# libmagic (for MIME type checking) and the upload folder are set up on first use
+_magic = Lazy(lambda: importlib.import_module('magic'))
+_upload_folder = Lazy(lambda: os.makedirs(UPLOAD_FOLDER, exist_ok=True))
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def fulltext_query(term):
+    """Turn free text into a BOOLEAN MODE query requiring every word as a prefix"""
+    words = [w for w in re.findall(r'\w+', term.lower()) if len(w) >= FULLTEXT_MIN_WORD]
+    return ' '.join(f'+{w}*' for w in words)
+
 def secure_filename(filename):
     filename = os.path.basename(filename)
     filename = re.sub(r'[^a-zA-Z0-9._-]', '_', filename)
     return filename if filename else 'file'
 
+def lookup_image(filename):
+    """Return (product_id, approval_status) for an uploaded image, or None"""
+    product_id = image_product_cache.get(filename, _NOT_CACHED)
+    if product_id is None:
+        return None
+    if product_id is not _NOT_CACHED:
+        status = product_status_cache.get(product_id)
+        if status is not None:
+            return product_id, status
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT pi.product_id, p.approval_status
+        FROM product_images pi
+        JOIN products p ON p.product_id = pi.product_id
+        WHERE pi.filename = %s
+    """, (filename,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if row is None:
+        image_product_cache.set(filename, None, ttl=IMAGE_MISS_TTL)
+        return None
+    image_product_cache.set(filename, row['product_id'])
+    product_status_cache.set(row['product_id'], row['approval_status'])
+    return row['product_id'], row['approval_status']
+
+def invalidate_listing(product_id):
+    """Drop cached responses showing this product: its page and all searches"""
+    invalidate_responses(f'product:{product_id}', 'search')
+
+def set_cached_product_status(product_id, status=None):
+    """Record a moderation change for serve_image; None forgets the product"""
+    if status is None:
+        product_status_cache.delete(product_id)
+    else:
+        product_status_cache.set(product_id, status)
+
+def image_etag(path):
+    """Content hash of a file, recomputed only when it changes on disk"""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    etag = image_etag_cache.get(key)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        etag = digest.hexdigest()[:32]
+        image_etag_cache.set(key, etag)
+    return etag
+
+def send_image(directory, filename, max_age):
+    """send_from_directory with a content-hash ETag and public Cache-Control.
+
+    Requests whose If-None-Match matches get an empty 304, missing files a
+    JSON 404 response.
+    """
+    path = safe_join(directory, filename)
+    try:
+        etag = image_etag(path) if path else None
+    except OSError:
+        etag = None
+    if etag is None:
+        response = jsonify({'error': 'Image not found'})
+        response.status_code = 404
+        return response
+
+    response = send_from_directory(directory, filename, etag=etag, max_age=max_age, conditional=True)
+    response.cache_control.public = True
+    return response
+
 def verify_image_content(file):
     # Read the first 2048 bytes to determine file type
     file_head = file.read(2048)
     file.seek(0)  # Reset file pointer
-    mime_type = magic.from_buffer(file_head, mime=True)
+    mime_type = _magic.get().from_buffer(file_head, mime=True)
     return mime_type in ALLOWED_MIMES
 
+class UploadRejected(ValueError):
+    """Raised by save_upload for a file that must not be stored"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def save_upload(file):
+    """Stream an uploaded image into UPLOAD_FOLDER and return its stored filename.
+
+    Chunks are copied to a temporary file that is renamed into place only
+    once the whole image is on disk and within MAX_IMAGE_BYTES, so
+    serve_image never sees a partial upload.
+    """
+    if not verify_image_content(file):
+        raise UploadRejected('Invalid image content or potentially unsafe file')
+
+    _upload_folder.get()
+    unique_filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
+    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+    tmp_path = f'{file_path}.part'
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                written += len(chunk)
+                if written > MAX_IMAGE_BYTES:
+                    raise UploadRejected(f'Image exceeds the {MAX_IMAGE_BYTES // (1024 * 1024)} MB limit', 413)
+                out.write(chunk)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        remove_uploads([os.path.basename(tmp_path)])
+        raise
+    metrics.inc('uploads_total')
+    metrics.inc('upload_bytes_total', written)
+    return unique_filename
+
+def remove_uploads(filenames):
+    """Delete stored uploads, e.g. when the product insert that referenced them failed"""
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(UPLOAD_FOLDER, filename))
+        except FileNotFoundError:
+            pass
+
+def remove_images(filenames):
+    """Delete uploaded product images together with their resized variants"""
+    remove_uploads([name for filename in filenames for name in (filename, *variant_filenames(filename))])
+
 @products_bp.route('/upload-image', methods=['POST'])
 @token_required
 def upload_image(current_user):
@@ -43,15 +229,16 @@ def upload_image(current_user):
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Allowed types: png, jpg, jpeg'}), 400
             
-        if not verify_image_content(file):
-            return jsonify({'error': 'Invalid image content or potentially unsafe file'}), 400
-            
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.save(file_path)
+        unique_filename = save_upload(file)
+        # The job row is written on the request's connection and needs a commit
+        conn = get_db_connection()
+        schedule_variants(os.path.join(UPLOAD_FOLDER, unique_filename))
+        if conn is not None:
+            conn.commit()
         image_url = f'/products/serve-image/{unique_filename}'
         return jsonify({'url': image_url}), 200
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"Error uploading image: {e}")
         return jsonify({'error': f'Failed to upload image: {str(e)}'}), 500
@@ -59,34 +246,40 @@ def upload_image(current_user):
 @products_bp.route('/serve-image/<path:filename>', methods=['GET'])
 def serve_image(filename):
     clean_filename = os.path.basename(filename)
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT p.product_id, p.approval_status 
-        FROM products p
-        JOIN product_images pi ON p.product_id = pi.product_id
-        WHERE pi.image_url LIKE %s
-    """, (f'%{clean_filename}',))
-    product = cursor.fetchone()
-    cursor.close()
-    conn.close()
-
-    if product and product['approval_status'] == 'approved':
-        return send_from_directory(UPLOAD_FOLDER, clean_filename)
-    elif product and product['approval_status'] == 'pending':
-        return send_from_directory('/app/static/images', 'pending_approval.png')
+    image = lookup_image(clean_filename)
+    status = image[1] if image else None
+
+    size = request.args.get('size')
+    if size and size not in IMAGE_SIZES:
+        return jsonify({'error': f'Invalid size. Allowed sizes: {", ".join(IMAGE_SIZES)}'}), 400
+
+    if status == 'approved':
+        if not size:
+            return send_image(UPLOAD_FOLDER, clean_filename, APPROVED_IMAGE_MAX_AGE)
+        accept_webp = 'image/webp' in request.headers.get('Accept', '')
+        served = pick_variant(UPLOAD_FOLDER, clean_filename, size, accept_webp)
+        if served == clean_filename:
+            # Variants are still being generated; don't pin the original to this URL
+            response = send_image(UPLOAD_FOLDER, clean_filename, PENDING_IMAGE_MAX_AGE)
+        else:
+            response = send_image(UPLOAD_FOLDER, served, APPROVED_IMAGE_MAX_AGE)
+            response.headers['X-Original-Content-Length'] = os.path.getsize(os.path.join(UPLOAD_FOLDER, clean_filename))
+        response.vary.add('Accept')
+        return response
+    elif status == 'pending':
+        return send_image(PENDING_IMAGE_FOLDER, 'pending_approval.png', PENDING_IMAGE_MAX_AGE)
     else:
         return jsonify({'error': 'Image not found'}), 404
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@cached_response('product', ttl=PRODUCT_RESPONSE_TTL, tags=lambda product_id: [f'product:{product_id}'])
 def get_product(product_id):
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
     # Fetch product info
     cursor.execute("""
-        SELECT p.*, u.username,
-               (SELECT AVG(rating) FROM reviews WHERE seller_id = p.user_id) as seller_rating
+        SELECT p.*, u.username
         FROM products p
         JOIN users u ON p.user_id = u.user_id
         WHERE p.product_id = %s
@@ -94,12 +287,9 @@ def get_product(product_id):
     product = cursor.fetchone()
 
     if product:
-        # Fetch images
-        cursor.execute("SELECT image_url FROM product_images WHERE product_id = %s", (product_id,))
-        images = cursor.fetchall()
-        product['images'] = [img['image_url'] for img in images]
-
-        product['seller_rating'] = float(product['seller_rating']) if product['seller_rating'] else 0.0
+        attach_images(cursor, [product])
+        attach_seller_ratings(cursor, [product])
+        tag_response(f"seller:{product['user_id']}")
 
     cursor.close()
     conn.close()
@@ -110,106 +300,163 @@ def get_product(product_id):
         return jsonify({'error': 'Product not found'}), 404
 
 @products_bp.route('/search', methods=['GET'])
+@cached_response('search', ttl=SEARCH_RESPONSE_TTL, tags=lambda: ['search'], normalize=SEARCH_ARGS_NORMALIZE)
 def search_products():
     term = request.args.get('term')
     category = request.args.get('category')
+    category_id = request.args.get('category_id', type=int)
     user_id = request.args.get('user_id')
+    sort = request.args.get('sort')
+
+    # Ranked FULLTEXT search when the term has indexable words, newest first otherwise
+    fulltext = fulltext_query(term) if term else ''
+    ranked = bool(fulltext) and sort != 'newest'
+    keyset = SEARCH_KEYSET
+    if ranked:
+        keyset = Keyset((FULLTEXT_MATCH, 'relevance', (fulltext,)), ('p.product_id', 'product_id'))
+
+    try:
+        limit, cursor_values = page_request(request.args, keyset)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
 
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    query = """
-        SELECT p.*, u.username,
-               (SELECT AVG(rating) FROM reviews WHERE seller_id = p.user_id) as seller_rating
+
+    # Category names are resolved from the in-memory map, so the filter is on
+    # p.category_id and categories is never joined
+    if category_id is None and category and category != "All Categories":
+        category_id = lookup_category_id(cursor, category)
+        if category_id is None:
+            cursor.close()
+            conn.close()
+            return page_response([], None)
+
+    query = f"""
+        SELECT p.*, u.username{f', {FULLTEXT_MATCH} AS relevance' if ranked else ''}
         FROM products p
         JOIN users u ON p.user_id = u.user_id
-        JOIN categories c ON p.category_id = c.category_id
         WHERE p.approval_status = 'approved'
     """
-    params = []
+    params = [fulltext] if ranked else []
 
     # filter out sold items if not viewing a specific user's listings
     if not user_id:
         query += "AND p.status = 'active'"
     
-    if term:
+    if fulltext:
+        query += f" AND {FULLTEXT_MATCH}"
+        params.append(fulltext)
+    elif term:
+        # Only words below the FULLTEXT minimum length, e.g. "tv"
         query += " AND (p.name LIKE %s OR p.description LIKE %s)"
         params.extend([f"%{term}%", f"%{term}%"])
-    if category and category != "All Categories":
-        query += " AND c.name = %s"
-        params.append(category)
+    if category_id is not None:
+        query += " AND p.category_id = %s"
+        params.append(category_id)
     if user_id:
         query += " AND p.user_id = %s"
         params.append(user_id)
-    query += " ORDER BY p.created_at DESC"
+    query, params = apply_page(query, params, keyset, cursor_values, limit)
 
-    cursor.execute(query, tuple(params))
-    products = cursor.fetchall()
+    cursor.execute(query, params)
+    products, next_cursor = split_page(cursor.fetchall(), keyset, limit)
     for product in products:
-        cursor.execute("SELECT image_url FROM product_images WHERE product_id = %s", (product['product_id'],))
-        images = cursor.fetchall()
-        product['images'] = [img['image_url'] for img in images]
+        product.pop('relevance', None)
+    attach_images(cursor, products)
+    attach_seller_ratings(cursor, products)
+    tag_response(*{f"seller:{product['user_id']}" for product in products})
+    cursor.close()
+    conn.close()
+    return page_response(products, next_cursor)
 
-        product['seller_rating'] = float(product['seller_rating']) if product['seller_rating'] else 0.0
+@products_bp.route('/categories', methods=['GET'])
+@cached_response('categories', ttl=SEARCH_RESPONSE_TTL, tags=lambda: ['search'])
+def get_categories():
+    """Every category with its number of approved, active listings"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    names = load_categories(cursor)['by_id']
+    cursor.execute("SELECT category_id, active_count FROM category_stats")
+    counts = dict(cursor.fetchall())
     cursor.close()
     conn.close()
-    return jsonify(products)
+    return jsonify([
+        {'category_id': category_id, 'name': name, 'active_count': max(0, counts.get(category_id, 0))}
+        for category_id, name in names.items()
+    ])
 
 @products_bp.route('/', methods=['POST'])
 @token_required
 def create_product(current_user):
     try:
         if request.content_type and 'multipart/form-data' in request.content_type:
-            # Check user's total products first
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT COUNT(*) FROM products 
-                WHERE user_id = %s AND status = 'active'
-            """, (current_user['user_id'],))
-            product_count = cursor.fetchone()[0]
-            
-            if product_count >= 100:
+            # Get every image onto disk before touching the database, so no
+            # transaction is held open while files are written
+            saved_filenames = []
+            try:
+                for file in request.files.getlist('images'):
+                    if file and allowed_file(file.filename):
+                        saved_filenames.append(save_upload(file))
+            except UploadRejected as e:
+                remove_uploads(saved_filenames)
+                return jsonify({'error': str(e)}), e.status
+
+            try:
+                # Check user's total products first
+                conn = get_db_connection()
+                cursor = conn.cursor()
+
+                cursor.execute("""
+                    SELECT COUNT(*) FROM products 
+                    WHERE user_id = %s AND status = 'active'
+                """, (current_user['user_id'],))
+                product_count = cursor.fetchone()[0]
+
+                if product_count >= 100:
+                    cursor.close()
+                    conn.close()
+                    remove_uploads(saved_filenames)
+                    return jsonify({'error': 'You have reached the maximum limit of 100 active products'}), 400
+
+                name = request.form.get('name')
+                description = request.form.get('description')
+                price = request.form.get('price')
+                condition = request.form.get('condition')
+                category_id = request.form.get('category_id')
+
+                # Insert product first
+                cursor.execute("""
+                    INSERT INTO products (
+                        user_id, name, description, price, 
+                        `condition`, category_id, approval_status
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    current_user['user_id'], name, description, price,
+                    condition, category_id, 'pending'
+                ))
+                product_id = cursor.lastrowid
+
+                if saved_filenames:
+                    cursor.executemany("""
+                        INSERT INTO product_images (product_id, image_url, filename)
+                        VALUES (%s, %s, %s)
+                    """, [(product_id, f'/products/serve-image/{unique_filename}', unique_filename)
+                          for unique_filename in saved_filenames])
+                for unique_filename in saved_filenames:
+                    schedule_variants(os.path.join(UPLOAD_FOLDER, unique_filename))
+
+                conn.commit()
                 cursor.close()
                 conn.close()
-                return jsonify({'error': 'You have reached the maximum limit of 100 active products'}), 400
-
-            name = request.form.get('name')
-            description = request.form.get('description')
-            price = request.form.get('price')
-            condition = request.form.get('condition')
-            category_id = request.form.get('category_id')
-
-            # Insert product first
-            cursor.execute("""
-                INSERT INTO products (
-                    user_id, name, description, price, 
-                    `condition`, category_id, approval_status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                current_user['user_id'], name, description, price,
-                condition, category_id, 'pending'
-            ))
-            product_id = cursor.lastrowid
-
-            # Save multiple images
-            images = request.files.getlist('images')
-            for file in images:
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                    file.save(file_path)
-                    image_url = f'/products/serve-image/{unique_filename}'
-
-                    cursor.execute("""
-                        INSERT INTO product_images (product_id, image_url)
-                        VALUES (%s, %s)
-                    """, (product_id, image_url))
+            except Exception:
+                remove_uploads(saved_filenames)
+                raise
 
-            conn.commit()
-            cursor.close()
-            conn.close()
+            for unique_filename in saved_filenames:
+                image_product_cache.set(unique_filename, product_id)
+            set_cached_product_status(product_id, 'pending')
+            invalidate_responses(f'product:{product_id}')
 
             return jsonify({'message': 'Product created successfully', 'product_id': product_id}), 201
 
@@ -232,6 +479,7 @@ def update_product(current_user, product_id):
         if not product or product['user_id'] != current_user['user_id']:
             return jsonify({'error': 'Unauthorized to update this product'}), 403
 
+        adjust_category_counts(cursor, -1, 'product_id = %s', (product_id,))
         query = """
             UPDATE products
             SET name = %s,
@@ -249,16 +497,16 @@ def update_product(current_user, product_id):
             data.get('category_id'),
             product_id
         ))
+        adjust_category_counts(cursor, 1, 'product_id = %s', (product_id,))
         conn.commit()
+        invalidate_listing(product_id)
 
         # Get updated product details
         cursor.execute("SELECT * FROM products WHERE product_id = %s", (product_id,))
         updated_product = cursor.fetchone()
 
         # Get associated images
-        cursor.execute("SELECT image_url FROM product_images WHERE product_id = %s", (product_id,))
-        images = cursor.fetchall()
-        updated_product['images'] = [img['image_url'] for img in images]
+        attach_images(cursor, [updated_product])
 
         cursor.close()
         conn.close()
@@ -279,9 +527,19 @@ def delete_product(current_user, product_id):
         product = cursor.fetchone()
         if not product or product[0] != current_user['user_id']:
             return jsonify({'error': 'Unauthorized to delete this product'}), 403
+        cursor.execute("""
+            SELECT filename FROM product_images
+            WHERE product_id = %s AND filename IS NOT NULL
+        """, (product_id,))
+        filenames = [row[0] for row in cursor.fetchall()]
+        adjust_category_counts(cursor, -1, 'product_id = %s', (product_id,))
         cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
-        conn.commit()
         affected = cursor.rowcount
+        conn.commit()
+        # product_images rows went with the product; the stored files and variants don't
+        remove_images(filenames)
+        set_cached_product_status(product_id)
+        invalidate_listing(product_id)
         cursor.close()
         conn.close()
         if affected:
@@ -302,12 +560,44 @@ def mark_product_as_sold(current_user, product_id):
         product = cursor.fetchone()
         if not product or product[0] != current_user['user_id']:
             return jsonify({'error': 'Unauthorized'}), 403
+        adjust_category_counts(cursor, -1, 'product_id = %s', (product_id,))
         cursor.execute("UPDATE products SET status = 'sold' WHERE product_id = %s", (product_id,))
         cursor.execute("UPDATE wishlist_tracking SET notified = FALSE WHERE product_id = %s", (product_id,))
         conn.commit()
+        invalidate_listing(product_id)
         cursor.close()
         conn.close()
         return jsonify({'message': 'Product marked as sold'}), 200
     except Exception as e:
         print(f"Error marking product as sold: {e}")
-        return jsonify({'error': 'Failed to mark product as sold'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to mark product as sold'}), 500
+
+def rebuild_category_stats():
+    """Recompute category_stats from products; returns the number of categories"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM category_stats")
+        cursor.execute("""
+            INSERT INTO category_stats (category_id, active_count)
+            SELECT c.category_id, COUNT(p.product_id)
+            FROM categories c
+            LEFT JOIN products p ON p.category_id = c.category_id
+                AND p.approval_status = 'approved' AND p.status = 'active'
+            GROUP BY c.category_id
+        """)
+        categories = cursor.rowcount
+        conn.commit()
+        return categories
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+@products_bp.cli.command('rebuild-category-stats')
+def rebuild_category_stats_command():
+    """Backfill or repair category_stats from products"""
+    categories = rebuild_category_stats()
+    print(f"Rebuilt listing counts for {categories} categories")
@@ -0,0 +1,246 @@
+"""Per-request query counts and timings, slow-query logging and route percentiles.
+
+get_db_connection() hands out connections wrapped in ProfiledConnection,
+whose cursors time every execute(). Inside a request the timings go into a
+RequestProfile on flask.g. When the request ends, QueryProfiler does three
+things with it:
+
+  - adds a Server-Timing header (db;dur=..., app;dur=...), shown per
+    request in the browser's network panel
+  - writes one JSON line to the `perf` logger if the request was slow, ran
+    a slow or failing statement, or repeated one statement
+    QUERY_REPEAT_THRESHOLD times (the N+1 pattern)
+  - adds the request's timings to a per-route window, which /admin/perf
+    reports as p50/p95/p99
+
+Statements are grouped by their SQL text with whitespace collapsed;
+parameters are never logged. All numbers are for the current worker.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger('perf')
+
+_WHITESPACE = re.compile(r'\s+')
+# IN (%s, %s, ...) lists built per call; folded so their lengths group together
+_PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def normalize_sql(query):
+    query = query if isinstance(query, str) else query.decode('utf-8')
+    return _PLACEHOLDER_LIST.sub('%s, ...', _WHITESPACE.sub(' ', query)).strip()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class RequestProfile:
+    """Statements run during one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}  # normalized sql -> [count, seconds, max seconds]
+        self.slow = []  # (normalized sql, seconds)
+        self.errors = []  # (normalized sql, error)
+
+    def record(self, sql, seconds, slow_threshold, error=None):
+        self.queries += 1
+        self.db_seconds += seconds
+        stats = self.statements.setdefault(sql, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        if seconds >= slow_threshold:
+            self.slow.append((sql, seconds))
+        if error is not None:
+            self.errors.append((sql, str(error)))
+
+    def repeated(self, threshold):
+        """Statements run at least `threshold` times, most repeated first"""
+        return sorted(((sql, stats[0]) for sql, stats in self.statements.items() if stats[0] >= threshold),
+                      key=lambda item: item[1], reverse=True)
+
+
+class ProfiledCursor:
+    """Cursor proxy that reports each execute() to the profiler"""
+
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, method, query, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = method(query, *args, **kwargs)
+        except Exception as e:
+            self._profiler.record(query, time.perf_counter() - started, e)
+            raise
+        self._profiler.record(query, time.perf_counter() - started)
+        return result
+
+    def execute(self, query, *args, **kwargs):
+        return self._timed(self._cursor.execute, query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._timed(self._cursor.executemany, query, *args, **kwargs)
+
+
+class ProfiledConnection:
+    """Connection proxy whose cursors are ProfiledCursors"""
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self._conn.cursor(*args, **kwargs), self._profiler)
+
+
+class QueryProfiler:
+    """Collects RequestProfiles per request and keeps a window of timings per route"""
+
+    def __init__(self, slow_query=0.1, slow_request=0.5, repeat_threshold=5, window=1000, log_all=False):
+        self.slow_query = slow_query
+        self.slow_request = slow_request
+        self.repeat_threshold = repeat_threshold
+        self.window = window
+        self.log_all = log_all
+        self._lock = threading.Lock()
+        self._routes = {}  # route -> {'samples': deque of (total, db, queries), ...}
+        self._statements = {}  # normalized sql -> [count, seconds, max seconds]
+
+    def wrap(self, conn):
+        return ProfiledConnection(conn, self)
+
+    def record(self, query, seconds, error=None):
+        sql = normalize_sql(query)
+        with self._lock:
+            stats = self._statements.setdefault(sql, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        if has_request_context() and 'query_profile' in g:
+            g.query_profile.record(sql, seconds, self.slow_query, error)
+        elif seconds >= self.slow_query or error is not None:
+            # Background jobs and the scheduler have no request to attach to
+            self._log({'event': 'slow_query' if error is None else 'query_error', 'sql': sql,
+                       'ms': round(seconds * 1000, 2), 'error': str(error) if error else None})
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.query_profile = RequestProfile()
+
+    def _after_request(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile.started
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+        repeated = profile.repeated(self.repeat_threshold)
+
+        response.headers.add('Server-Timing', (
+            f'db;dur={profile.db_seconds * 1000:.2f};desc="{profile.queries} queries", '
+            f'app;dur={(total - profile.db_seconds) * 1000:.2f}'
+        ))
+        self._add_sample(route, total, profile, bool(repeated))
+
+        if self.log_all or total >= self.slow_request or profile.slow or profile.errors or repeated:
+            self._log({
+                'event': 'request',
+                'route': route,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(total * 1000, 2),
+                'db_ms': round(profile.db_seconds * 1000, 2),
+                'queries': profile.queries,
+                'slow_queries': [{'sql': sql, 'ms': round(s * 1000, 2)} for sql, s in profile.slow],
+                'repeated': [{'sql': sql, 'count': count} for sql, count in repeated],
+                'errors': [{'sql': sql, 'error': error} for sql, error in profile.errors],
+            }, level=logging.ERROR if profile.errors else logging.WARNING)
+        return response
+
+    def _add_sample(self, route, total, profile, repeated):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'samples': deque(maxlen=self.window), 'requests': 0, 'repeated': 0, 'max_queries': 0
+                }
+            stats['samples'].append((total, profile.db_seconds, profile.queries))
+            stats['requests'] += 1
+            stats['repeated'] += repeated
+            stats['max_queries'] = max(stats['max_queries'], profile.queries)
+
+    def _log(self, event, level=logging.WARNING):
+        logger.log(level, json.dumps(event))
+
+    def stats(self, top=20):
+        """Per-route percentiles over the last `window` requests, and the costliest statements"""
+        with self._lock:
+            routes = {route: (list(s['samples']), s['requests'], s['repeated'], s['max_queries'])
+                      for route, s in self._routes.items()}
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+
+        report = {}
+        for route, (samples, requests, repeated, max_queries) in routes.items():
+            totals = sorted(sample[0] for sample in samples)
+            db = sorted(sample[1] for sample in samples)
+            report[route] = {
+                'requests': requests,
+                'p50_ms': round(percentile(totals, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(totals, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(totals, 0.99) * 1000, 2),
+                'db_p50_ms': round(percentile(db, 0.50) * 1000, 2),
+                'db_p95_ms': round(percentile(db, 0.95) * 1000, 2),
+                'db_p99_ms': round(percentile(db, 0.99) * 1000, 2),
+                'avg_queries': round(sum(sample[2] for sample in samples) / len(samples), 2) if samples else 0.0,
+                'max_queries': max_queries,
+                'repeated_statement_requests': repeated,
+            }
+        return {
+            'window': self.window,
+            'routes': report,
+            'statements': [
+                {'sql': sql, 'count': count, 'total_ms': round(seconds * 1000, 2),
+                 'avg_ms': round(seconds / count * 1000, 2), 'max_ms': round(longest * 1000, 2)}
+                for sql, (count, seconds, longest) in statements
+            ],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._statements.clear()
+
+
+profiler = QueryProfiler(
+    slow_query=float(os.getenv('SLOW_QUERY_MS', 100)) / 1000,
+    slow_request=float(os.getenv('SLOW_REQUEST_MS', 500)) / 1000,
+    repeat_threshold=int(os.getenv('QUERY_REPEAT_THRESHOLD', 5)),
+    window=int(os.getenv('PERF_WINDOW', 1000)),
+    log_all=os.getenv('PERF_LOG_ALL', '0') == '1'
+)
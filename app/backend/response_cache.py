@@ -0,0 +1,302 @@
+"""Cached responses for public, read-heavy GET endpoints.
+
+    @products_bp.route('/<int:product_id>', methods=['GET'])
+    @cached_response('product', ttl=30, tags=lambda product_id: [f'product:{product_id}'])
+    def get_product(product_id):
+        ...
+
+Entries are keyed on the endpoint name, its view arguments and the query
+string with arguments sorted and blanks dropped, so `?b=1&a=2` and
+`?a=2&c=&b=1` share an entry. Only 200 responses are stored, together with
+their headers (X-Next-Cursor, ETag, Cache-Control), so a hit pages like a
+miss. Views can tag an entry from what they loaded with tag_response(), and
+writers call invalidate_responses(*tags) after they commit.
+
+RESPONSE_CACHE_URL picks the backend:
+
+  (unset)     per-worker memory cache, LRU within RESPONSE_CACHE_MAX_BYTES
+  redis://... one cache shared by every worker, so invalidation reaches all
+              of them (any Redis-compatible server; needs the `redis` package)
+  off         no caching
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, make_response, request
+
+
+class MemoryBackend:
+    """TTL + LRU store of bytes values bounded by total size, with a tag index"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, tags=()):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, tuple(tags))
+            self._bytes += len(value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes or len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, value, tags = self._data.pop(key)
+        self._bytes -= len(value)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tags):
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.get(tag, ()).copy():
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+            }
+
+
+class RedisBackend:
+    """Entries and tag sets in Redis, shared by every worker.
+
+    Memory is bounded by the server (maxmemory with an LRU policy). Tag sets
+    expire after tag_ttl, which must be longer than any entry's TTL.
+    """
+
+    def __init__(self, url=None, prefix='gator-market:response:', tag_ttl=3600, client=None):
+        if client is None:
+            import redis  # optional dependency, only needed for this backend
+            client = redis.Redis.from_url(url)
+        self._redis = client
+        self._prefix = prefix
+        self.tag_ttl = tag_ttl
+
+    def get(self, key):
+        return self._redis.get(self._prefix + key)
+
+    def set(self, key, value, ttl, tags=()):
+        pipe = self._redis.pipeline()
+        pipe.set(self._prefix + key, value, px=int(ttl * 1000))
+        for tag in tags:
+            pipe.sadd(self._prefix + 'tag:' + tag, key)
+            pipe.expire(self._prefix + 'tag:' + tag, self.tag_ttl)
+        pipe.execute()
+
+    def invalidate(self, tags):
+        tag_keys = [self._prefix + 'tag:' + tag for tag in tags]
+        pipe = self._redis.pipeline()
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        keys = {key for members in pipe.execute() for key in members}
+        keys = [self._prefix + (key.decode('utf-8') if isinstance(key, bytes) else key) for key in keys]
+        if keys or tag_keys:
+            self._redis.delete(*keys, *tag_keys)
+        return len(keys)
+
+    def clear(self):
+        keys = list(self._redis.scan_iter(match=self._prefix + '*'))
+        if keys:
+            self._redis.delete(*keys)
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+# Recomputed for every response, or never shared between clients
+_UNCACHED_HEADERS = {'content-length', 'set-cookie', 'x-cache'}
+
+
+def _pack(response):
+    """Headers as one JSON line, then the body; X-Next-Cursor, ETag etc. replay on a hit"""
+    headers = [[name, value] for name, value in response.headers.items()
+               if name.lower() not in _UNCACHED_HEADERS]
+    return json.dumps(headers).encode('utf-8') + b'\n' + response.get_data()
+
+
+def _unpack(blob):
+    """The stored response, or None for an entry this format cannot read"""
+    head, _, body = blob.partition(b'\n')
+    try:
+        headers = json.loads(head)
+    except ValueError:
+        return None  # written by an older version before a deploy
+    return make_response(body, 200, [tuple(header) for header in headers])
+
+
+class ResponseCache:
+    """Caches view responses in a backend and counts hits per endpoint"""
+
+    def __init__(self, backend, default_ttl=30.0):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._endpoints = {}  # name -> [hits, misses]
+        self._generation = 0  # bumped by invalidate()
+        self.stores = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def key(self, name, view_args, args, normalize=None):
+        normalize = normalize or {}
+        pairs = []
+        for arg, value in args.items(multi=True):
+            value = value.strip()
+            if arg in normalize:
+                value = normalize[arg](value)
+            if value:
+                pairs.append((arg, value))
+        path = ','.join(f'{k}={view_args[k]}' for k in sorted(view_args))
+        return f'{name}:{path}?{urlencode(sorted(pairs))}'
+
+    def cached(self, name, ttl=None, tags=None, normalize=None):
+        """Decorator for a GET view; tags(**view_args) gives the entry's base tags.
+
+        normalize maps query argument names to functions applied to their
+        values before keying; returning '' drops the argument.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+                key = self.key(name, kwargs, request.args, normalize)
+                blob = self._call('get', key)
+                response = _unpack(blob) if blob is not None else None
+                self._count(name, response is not None)
+                if response is not None:
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                generation = self._generation
+                g.response_tags = list(tags(**kwargs)) if tags else []
+                response = make_response(view(*args, **kwargs))
+                # Skip the store if a write was invalidated while the view ran,
+                # or it could put back what was just removed
+                if response.status_code == 200 and not response.direct_passthrough \
+                        and generation == self._generation:
+                    self._call('set', key, _pack(response), self.default_ttl if ttl is None else ttl,
+                               g.response_tags)
+                    with self._lock:
+                        self.stores += 1
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        if self.backend is not None and tags:
+            self._call('invalidate', tags)
+
+    def _call(self, method, *args):
+        # A cache outage should cost latency, not availability
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"Error in response cache {method}: {e}")
+            return None
+
+    def _count(self, name, hit):
+        with self._lock:
+            counts = self._endpoints.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                name: {'hits': hits, 'misses': misses,
+                       'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0}
+                for name, (hits, misses) in self._endpoints.items()
+            }
+            hits = sum(e['hits'] for e in endpoints.values())
+            lookups = hits + sum(e['misses'] for e in endpoints.values())
+            stats = {
+                'hits': hits,
+                'misses': lookups - hits,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+                'endpoints': endpoints,
+            }
+        stats.update(self.backend.stats() if self.backend is not None else {'backend': 'off'})
+        return stats
+
+
+def tag_response(*tags):
+    """Add tags to the response being cached by the current view"""
+    if 'response_tags' in g:
+        g.response_tags.extend(tags)
+
+
+def create_response_cache(url=None):
+    ttl = float(os.getenv('RESPONSE_CACHE_TTL', 30))
+    if url == 'off':
+        return ResponseCache(None, ttl)
+    if url and url.startswith('redis'):
+        return ResponseCache(RedisBackend(url), ttl)
+    return ResponseCache(MemoryBackend(
+        max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+        max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+    ), ttl)
+
+
+response_cache = create_response_cache(os.getenv('RESPONSE_CACHE_URL'))
+cached_response = response_cache.cached
+invalidate_responses = response_cache.invalidate
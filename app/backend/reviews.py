@@ -1,9 +1,28 @@
 from flask import Blueprint, request, jsonify
 from app import get_db_connection
 from auth import token_required
+from pagination import InvalidCursor, Keyset, apply_page, page_request, page_response, split_page
+from response_cache import cached_response, invalidate_responses
+import os
 
 reviews_bp = Blueprint('reviews', __name__, url_prefix='/reviews')
 
+REVIEWS_KEYSET = Keyset(('created_at', 'created_at'), ('review_id', 'review_id'))
+
+REVIEWS_RESPONSE_TTL = float(os.getenv('REVIEWS_RESPONSE_TTL', 60))
+
+def parse_rating(value):
+    """A whole-number rating from 1 to 5 (int, whole float or digit string), or None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or not 1 <= value <= 5:
+        return None
+    return value
+
 # Post a review
 @reviews_bp.route('/', methods=['POST'])
 @token_required
@@ -15,16 +34,29 @@ def create_review(current_user):
         if field not in data:
             return jsonify({'error': f'Missing field: {field}'}), 400
 
-    if not (1 <= int(data['rating']) <= 5):
-        return jsonify({'error': 'Rating must be between 1 and 5'}), 400
+    # The same parsed value goes into the review and seller_stats, so the
+    # running total always matches SUM(rating)
+    rating = parse_rating(data['rating'])
+    if rating is None:
+        return jsonify({'error': 'Rating must be a whole number between 1 and 5'}), 400
 
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO reviews (seller_id, rating, comment)
         VALUES (%s, %s, %s)
-    """, (data['seller_id'], data['rating'], data['comment']))
+    """, (data['seller_id'], rating, data['comment']))
+    # Keep the seller's running totals in the same transaction as the review
+    cursor.execute("""
+        INSERT INTO seller_stats (seller_id, rating_sum, rating_count)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE
+            rating_sum = rating_sum + VALUES(rating_sum),
+            rating_count = rating_count + 1
+    """, (data['seller_id'], rating))
     conn.commit()
+    # The seller's reviews, profile rating and the ratings on their listings
+    invalidate_responses(f"seller:{data['seller_id']}")
 
     cursor.close()
     conn.close()
@@ -32,17 +64,51 @@ def create_review(current_user):
 
 # Get reviews for a seller
 @reviews_bp.route('/<int:seller_id>', methods=['GET'])
+@cached_response('seller_reviews', ttl=REVIEWS_RESPONSE_TTL, tags=lambda seller_id: [f'seller:{seller_id}'])
 def get_reviews_for_seller(seller_id):
+    try:
+        limit, cursor_values = page_request(request.args, REVIEWS_KEYSET)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
+    query, params = apply_page("""
         SELECT review_id, rating, comment, created_at
         FROM reviews
         WHERE seller_id = %s
-        ORDER BY created_at DESC
-    """, (seller_id,))
-    reviews = cursor.fetchall()
+    """, (seller_id,), REVIEWS_KEYSET, cursor_values, limit)
+    cursor.execute(query, params)
+    reviews, next_cursor = split_page(cursor.fetchall(), REVIEWS_KEYSET, limit)
 
     cursor.close()
     conn.close()
-    return jsonify(reviews)
\ No newline at end of file
+    return page_response(reviews, next_cursor)
+
+def rebuild_seller_stats():
+    """Recompute seller_stats from the reviews table; returns the number of sellers"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM seller_stats")
+        cursor.execute("""
+            INSERT INTO seller_stats (seller_id, rating_sum, rating_count)
+            SELECT seller_id, SUM(rating), COUNT(*)
+            FROM reviews
+            GROUP BY seller_id
+        """)
+        sellers = cursor.rowcount
+        conn.commit()
+        return sellers
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+@reviews_bp.cli.command('rebuild-seller-stats')
+def rebuild_seller_stats_command():
+    """Backfill or repair seller_stats from reviews"""
+    sellers = rebuild_seller_stats()
+    print(f"Rebuilt rating totals for {sellers} sellers")
@@ -0,0 +1,148 @@
+# testing the batched purge of expired unverified accounts and the single-account delete link
+
+import app  # noqa: F401  (email_verification must be imported through the app, not first)
+import email_verification
+import products
+
+
+class FakeCursor:
+    def __init__(self, batches, conversations=(), filenames=(), products=(), user=None):
+        self.batches = list(batches)
+        self.user = user
+        self.products = list(products)
+        self.conversations = list(conversations)
+        self.filenames = list(filenames)
+        self.executed = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.executed.append((' '.join(query.split()), params))
+        self.rowcount = len(params) if query.lstrip().startswith('DELETE') else 0
+
+    def fetchall(self):
+        query = self.executed[-1][0]
+        if 'FROM users' in query:
+            return [(user_id,) for user_id in self.batches.pop(0)] if self.batches else []
+        if query.startswith('SELECT product_id'):
+            rows = self.products
+        else:
+            rows = self.conversations if 'conversation_id' in query else self.filenames
+        return [(row,) for row in rows]
+
+    def fetchone(self):
+        return self.user
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, batches, **rows):
+        self.cursor_ = FakeCursor(batches, **rows)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def run_purge(monkeypatch, batches, batch_size, **rows):
+    conn = FakeConn(batches, **rows)
+    monkeypatch.setattr(email_verification, 'get_db_connection', lambda: conn)
+    deleted = email_verification.purge_expired_accounts(batch_size=batch_size, pause=0)
+    return conn, deleted
+
+
+def test_deletes_in_batches_and_counts_per_table(monkeypatch):
+    conn, deleted = run_purge(monkeypatch, [[1, 2], [5]], batch_size=2)
+    assert deleted['users'] == 3 and deleted['wishlist_tracking'] == 3
+    assert conn.commits == 2
+    selects = [params for query, params in conn.cursor_.executed if query.startswith('SELECT user_id FROM users')]
+    assert selects == [(0, 2), (2, 2)]
+
+
+def test_nothing_to_purge(monkeypatch):
+    conn, deleted = run_purge(monkeypatch, [], batch_size=10)
+    assert set(deleted.values()) == {0}
+    assert len(conn.cursor_.executed) == 1
+
+
+def test_users_are_deleted_last(monkeypatch):
+    conn, _ = run_purge(monkeypatch, [[7]], batch_size=10)
+    deletes = [query for query, _ in conn.cursor_.executed if query.startswith('DELETE')]
+    assert deletes[-1] == 'DELETE FROM users WHERE user_id IN (%s)'
+
+
+def test_counters_follow_the_deleted_rows(monkeypatch):
+    conn, _ = run_purge(monkeypatch, [[7, 8]], batch_size=10, conversations=[3, 4])
+    queries = [query for query, _ in conn.cursor_.executed]
+    counts = next(i for i, query in enumerate(queries) if 'INTO category_stats' in query)
+    assert queries.index('DELETE FROM products WHERE user_id IN (%s, %s)') > counts
+    assert conn.cursor_.executed[counts][1] == (-1, 7, 8)
+
+    summaries = [(query, params) for query, params in conn.cursor_.executed if query.startswith('UPDATE')]
+    assert [query.split()[1] for query, _ in summaries] == ['conversations', 'conversation_participants']
+    assert all(params == (3, 4, 3, 4) for _, params in summaries)
+    assert queries.index(summaries[0][0]) > queries.index('DELETE FROM users WHERE user_id IN (%s, %s)')
+
+
+def test_conversations_untouched_when_no_messages_go(monkeypatch):
+    conn, _ = run_purge(monkeypatch, [[7]], batch_size=10)
+    assert not [query for query, _ in conn.cursor_.executed if query.startswith('UPDATE')]
+
+
+def test_image_files_and_variants_are_removed(monkeypatch, tmp_path):
+    monkeypatch.setattr(products, 'UPLOAD_FOLDER', str(tmp_path))
+    for name in ('a_photo.jpg', 'a_photo.thumb.jpg', 'a_photo.card.webp', 'keep.jpg'):
+        (tmp_path / name).write_bytes(b'x')
+    run_purge(monkeypatch, [[7]], batch_size=10, filenames=['a_photo.jpg'])
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['keep.jpg']
+
+
+def delete_account(monkeypatch, user, **rows):
+    conn = FakeConn([], user=user, **rows)
+    monkeypatch.setattr(email_verification, 'get_db_connection', lambda: conn)
+    with app.app.test_request_context('/verify/delete-account?token=abc'):
+        response = app.app.make_response(email_verification.delete_unverified_account())
+    return conn, response
+
+
+def test_delete_link_updates_conversations_like_the_purge(monkeypatch):
+    conn, response = delete_account(monkeypatch, (7, 'unverified', None), conversations=[3])
+    assert response.status_code == 200 and conn.commits == 1
+    queries = [query for query, _ in conn.cursor_.executed]
+    assert queries[-3] == 'DELETE FROM users WHERE user_id IN (%s)'
+    assert [query.split()[1] for query in queries[-2:]] == ['conversations', 'conversation_participants']
+
+
+def test_delete_link_refuses_verified_accounts(monkeypatch):
+    conn, response = delete_account(monkeypatch, (7, 'verified', None))
+    assert response.status_code == 403
+    assert not [query for query, _ in conn.cursor_.executed if query.startswith('DELETE')]
+
+
+def test_delete_link_uncounts_listings_and_removes_their_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(products, 'UPLOAD_FOLDER', str(tmp_path))
+    for name in ('a_photo.jpg', 'a_photo.full.webp'):
+        (tmp_path / name).write_bytes(b'x')
+    invalidated = []
+    monkeypatch.setattr(email_verification, 'invalidate_responses', lambda *tags: invalidated.extend(tags))
+    products.set_cached_product_status(11, 'approved')
+
+    conn, response = delete_account(monkeypatch, (7, 'unverified', None), products=[11], filenames=['a_photo.jpg'])
+    assert response.status_code == 200
+    queries = [query for query, _ in conn.cursor_.executed]
+    counts = next(i for i, query in enumerate(queries) if 'INTO category_stats' in query)
+    assert conn.cursor_.executed[counts][1] == (-1, 7)
+    assert queries.index('DELETE FROM products WHERE user_id IN (%s)') > counts
+    assert not list(tmp_path.iterdir())
+    assert products.product_status_cache.get(11) is None
+    assert {'seller:7', 'product:11', 'search'} <= set(invalidated)
@@ -0,0 +1,45 @@
+# testing the set-based loaders used by search, product and inbox handlers
+# a fake cursor records each statement so round trips can be counted
+
+from batch_loaders import attach_images, attach_seller_ratings, fetch_seller_ratings
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_attach_images_uses_one_query():
+    products = [{'product_id': n} for n in (1, 2, 3)]
+    cursor = FakeCursor([
+        {'product_id': 1, 'image_url': '/a.jpg'},
+        {'product_id': 1, 'image_url': '/b.jpg'},
+        {'product_id': 3, 'image_url': '/c.jpg'},
+    ])
+    attach_images(cursor, products)
+    assert len(cursor.executed) == 1
+    assert cursor.executed[0][1] == (1, 2, 3)
+    assert [p['images'] for p in products] == [['/a.jpg', '/b.jpg'], [], ['/c.jpg']]
+
+
+def test_attach_seller_ratings_dedupes_sellers():
+    products = [{'user_id': 7}, {'user_id': 7}, {'user_id': 9}]
+    cursor = FakeCursor([{'seller_id': 7, 'rating_sum': 9, 'rating_count': 2}])
+    attach_seller_ratings(cursor, products)
+    assert len(cursor.executed) == 1
+    assert cursor.executed[0][1] == (7, 9)
+    assert [p['seller_rating'] for p in products] == [4.5, 4.5, 0.0]
+
+
+def test_empty_input_skips_query():
+    cursor = FakeCursor([])
+    assert attach_images(cursor, []) == []
+    assert fetch_seller_ratings(cursor, []) == {}
+    assert cursor.executed == []
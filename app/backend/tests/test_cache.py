@@ -0,0 +1,40 @@
+# testing the in-process TTL/LRU cache used for auth users and hot reads
+
+import time
+
+from cache import TTLCache
+
+
+def test_hit_and_miss_counters():
+    cache = TTLCache(maxsize=4, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+
+def test_entries_expire():
+    cache = TTLCache(ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_delete():
+    cache = TTLCache()
+    cache.set('a', 1)
+    assert cache.delete('a')
+    assert not cache.delete('a')
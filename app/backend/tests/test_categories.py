@@ -0,0 +1,109 @@
+# testing category lookups from memory and search filtering by category_id
+
+import app  # noqa: F401  (products must be imported through the app, not first)
+import products
+from categories import adjust_category_counts, category_cache, invalidate_categories, lookup_category_id
+from response_cache import invalidate_responses
+
+CATEGORIES = [{'category_id': 1, 'name': 'Computers'}, {'category_id': 4, 'name': 'Books'}]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.conn.executed.append((' '.join(query.split()), params))
+        if 'FROM categories' in query:
+            self.rows = [dict(row) for row in CATEGORIES]
+        elif 'FROM category_stats' in query:
+            self.rows = [(1, 3)]
+        else:
+            self.rows = []
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+def setup_function():
+    invalidate_categories()
+    invalidate_responses('search')
+
+
+def test_lookups_load_the_table_once():
+    conn = FakeConn()
+    cursor = conn.cursor()
+    assert lookup_category_id(cursor, 'Books') == 4
+    assert lookup_category_id(cursor, 'Computers') == 1
+    assert lookup_category_id(cursor, 'Cars') is None
+    assert len(conn.executed) == 1
+    invalidate_categories()
+    lookup_category_id(cursor, 'Books')
+    assert len(conn.executed) == 2
+    assert category_cache.stats()['size'] == 1
+
+
+def search(monkeypatch, query_string):
+    conn = FakeConn()
+    monkeypatch.setattr(products, 'get_db_connection', lambda: conn)
+    with app.app.test_request_context(f'/products/search?{query_string}'):
+        response = products.search_products()
+    return response, [query for query, _ in conn.executed if 'FROM products' in query], conn
+
+
+def test_search_filters_on_category_id_without_joining(monkeypatch):
+    _, queries, conn = search(monkeypatch, 'category=Books')
+    assert len(queries) == 1
+    assert 'p.category_id = %s' in queries[0]
+    assert 'JOIN categories' not in queries[0]
+    assert 4 in conn.executed[-1][1]
+
+    _, queries, _ = search(monkeypatch, 'category=All%20Categories')
+    assert 'category_id' not in queries[0]
+
+
+def test_search_accepts_category_id(monkeypatch):
+    _, queries, conn = search(monkeypatch, 'category_id=1')
+    assert 'p.category_id = %s' in queries[0]
+    assert not any('FROM categories' in query for query, _ in conn.executed)
+
+
+def test_unknown_category_returns_empty_page_without_searching(monkeypatch):
+    response, queries, _ = search(monkeypatch, 'category=Cars')
+    assert response.get_json() == []
+    assert queries == []
+
+
+def test_categories_endpoint_reads_counters(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(products, 'get_db_connection', lambda: conn)
+    with app.app.test_request_context('/products/categories'):
+        body = products.get_categories().get_json()
+    assert body == [
+        {'category_id': 1, 'name': 'Computers', 'active_count': 3},
+        {'category_id': 4, 'name': 'Books', 'active_count': 0},
+    ]
+    assert not any('GROUP BY' in query for query, _ in conn.executed)
+
+
+def test_counter_adjustment_counts_only_visible_products():
+    conn = FakeConn()
+    adjust_category_counts(conn.cursor(), -1, 'product_id = %s', (7,))
+    query, params = conn.executed[0]
+    assert "approval_status = 'approved' AND status = 'active' AND (product_id = %s)" in query
+    assert params == (-1, 7)
@@ -0,0 +1,111 @@
+# testing the connection pool behind get_db_connection
+# uses a fake connection factory so no MySQL server is needed
+
+import threading
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+        self.pings = 0
+        self.in_transaction = False
+        self.unread_result = False
+        self.fail_ping = False
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self.pings += 1
+        if self.fail_ping:
+            raise OSError("MySQL server has gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def created():
+    return []
+
+
+@pytest.fixture()
+def pool(created):
+    def factory():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+    return ConnectionPool(factory, size=2, timeout=0.05, ping_interval=0)
+
+
+def test_connection_is_reused(pool, created):
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+    assert len(created) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_timeout_when_exhausted(pool):
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    first.release()
+    second.release()
+    assert pool.stats()['in_use'] == 0
+
+
+def test_waiter_gets_released_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    pool.timeout = 2
+    threading.Timer(0.05, held[0].release).start()
+    conn = pool.acquire()
+    assert conn is not None
+    assert pool.stats()['wait_seconds_max'] > 0
+    conn.release()
+    held[1].release()
+
+
+def test_stale_connection_is_replaced(pool, created):
+    with pool.connection():
+        created[0].fail_ping = True
+    with pool.connection():
+        pass
+    assert len(created) == 2
+    assert created[0].closed
+    assert pool.stats()['reconnects'] == 1
+
+
+def test_open_transaction_rolled_back_on_release(pool, created):
+    with pool.connection():
+        created[0].in_transaction = True
+    assert created[0].rollbacks == 1
+
+
+def test_request_scoped_close_keeps_connection(pool, created):
+    conn = pool.acquire(request_scoped=True)
+    created[0].in_transaction = True
+    conn.close()
+    assert created[0].rollbacks == 1
+    assert pool.stats()['in_use'] == 1
+    conn.release()
+    assert pool.stats()['in_use'] == 0
+
+
+def test_after_fork_drops_inherited_connections_without_closing(pool, created):
+    with pool.connection():
+        pass
+    pool.after_fork()
+    assert pool.stats()['open'] == 0
+    with pool.connection():
+        pass
+    assert len(created) == 2
+    assert not created[0].closed
@@ -0,0 +1,36 @@
+# testing the in-process event broker behind /messaging/events
+
+import threading
+import time
+
+from events import LocalBroker, user_channel
+
+
+def test_wait_returns_history_after_since():
+    broker = LocalBroker()
+    first = broker.publish(user_channel(1), 'message', {'n': 1})
+    broker.publish(user_channel(1), 'message', {'n': 2})
+    events = broker.wait(user_channel(1), since=first['id'], timeout=0)
+    assert [e['data']['n'] for e in events] == [2]
+
+
+def test_wait_times_out_without_events():
+    broker = LocalBroker()
+    started = time.monotonic()
+    assert broker.wait(user_channel(1), timeout=0.05) == []
+    assert time.monotonic() - started >= 0.05
+
+
+def test_waiter_is_woken_by_publish():
+    broker = LocalBroker()
+    threading.Timer(0.05, broker.publish, args=(user_channel(2), 'unread_count', {'count': 1})).start()
+    events = broker.wait(user_channel(2), timeout=5)
+    assert events[0]['type'] == 'unread_count'
+
+
+def test_channels_are_isolated_and_history_bounded():
+    broker = LocalBroker(history=3)
+    for n in range(5):
+        broker.publish(user_channel(1), 'message', {'n': n})
+    assert broker.wait(user_channel(2), timeout=0) == []
+    assert [e['data']['n'] for e in broker.wait(user_channel(1), timeout=0)] == [2, 3, 4]
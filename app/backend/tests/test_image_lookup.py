@@ -0,0 +1,93 @@
+# testing that serve_image lookups are answered from the filename/status caches
+
+import app  # products must be imported through the app, not first
+import products
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, row):
+        self.cursors = []
+        self.row = row
+
+    def cursor(self, dictionary=False):
+        cursor = FakeCursor(self.row)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        pass
+
+
+def use_db(monkeypatch, row):
+    products.image_product_cache.clear()
+    products.product_status_cache.clear()
+    conn = FakeConn(row)
+    monkeypatch.setattr(products, 'get_db_connection', lambda: conn)
+    return conn
+
+
+def test_repeat_lookups_skip_the_db(monkeypatch):
+    conn = use_db(monkeypatch, {'product_id': 4, 'approval_status': 'pending'})
+    assert products.lookup_image('a.jpg') == (4, 'pending')
+    assert products.lookup_image('a.jpg') == (4, 'pending')
+    assert len(conn.cursors) == 1
+    assert conn.cursors[0].executed[0][1] == ('a.jpg',)
+
+
+def test_moderation_updates_cached_status(monkeypatch):
+    conn = use_db(monkeypatch, {'product_id': 4, 'approval_status': 'pending'})
+    products.lookup_image('a.jpg')
+    products.set_cached_product_status(4, 'approved')
+    assert products.lookup_image('a.jpg') == (4, 'approved')
+    assert len(conn.cursors) == 1
+
+
+def test_unknown_filenames_are_remembered(monkeypatch):
+    conn = use_db(monkeypatch, None)
+    assert products.lookup_image('missing.jpg') is None
+    assert products.lookup_image('missing.jpg') is None
+    assert len(conn.cursors) == 1
+
+
+def test_images_are_cached_briefly_and_revalidate(tmp_path):
+    (tmp_path / 'a.jpg').write_bytes(b'image bytes')
+    with app.app.test_request_context('/products/serve-image/a.jpg'):
+        response = products.send_image(str(tmp_path), 'a.jpg', products.APPROVED_IMAGE_MAX_AGE)
+        etag = response.get_etag()[0]
+        assert response.status_code == 200
+        # moderation can take an approved image down again at the same URL
+        assert not response.cache_control.immutable
+        assert response.cache_control.max_age == products.APPROVED_IMAGE_MAX_AGE <= 3600
+
+    with app.app.test_request_context('/products/serve-image/a.jpg', headers={'If-None-Match': f'"{etag}"'}):
+        response = products.send_image(str(tmp_path), 'a.jpg', products.APPROVED_IMAGE_MAX_AGE)
+        assert response.status_code == 304
+
+
+def test_etag_follows_file_content(tmp_path):
+    image = tmp_path / 'a.jpg'
+    image.write_bytes(b'first')
+    first = products.image_etag(str(image))
+    image.write_bytes(b'second version')
+    assert products.image_etag(str(image)) != first
+
+
+def test_missing_file_is_404(tmp_path):
+    with app.app.test_request_context('/products/serve-image/gone.jpg'):
+        response = products.send_image(str(tmp_path), 'gone.jpg', 60)
+    assert response.status_code == 404
@@ -0,0 +1,63 @@
+# testing thumbnail/card/full variants written for uploaded images
+
+import pytest
+from PIL import Image
+
+import app  # noqa: F401  (image_variants must be imported through the app, not first)
+import image_variants
+from image_variants import SIZES, generate_variants, pick_variant, variant_filename
+
+
+def make_image(tmp_path, name='photo.jpg', size=(2000, 1000), fmt='JPEG'):
+    path = tmp_path / name
+    Image.new('RGB', size, (200, 30, 30)).save(path, fmt)
+    return path
+
+
+def test_every_size_is_written_in_both_formats(tmp_path):
+    path = make_image(tmp_path)
+    written = generate_variants(str(path))
+    assert len(written) == len(SIZES) * 2
+    with Image.open(tmp_path / 'photo.thumb.jpg') as thumb:
+        assert thumb.size == (160, 80)
+    with Image.open(tmp_path / 'photo.card.webp') as card:
+        assert card.format == 'WEBP' and card.size == (480, 240)
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    path = make_image(tmp_path, 'small.png', size=(100, 50), fmt='PNG')
+    generate_variants(str(path))
+    with Image.open(tmp_path / 'small.full.png') as full:
+        assert full.size == (100, 50)
+
+
+def test_pick_variant_prefers_webp_and_falls_back(tmp_path):
+    path = make_image(tmp_path)
+    assert pick_variant(str(tmp_path), 'photo.jpg', 'thumb', accept_webp=True) == 'photo.jpg'
+    generate_variants(str(path))
+    assert pick_variant(str(tmp_path), 'photo.jpg', 'thumb', accept_webp=True) == 'photo.thumb.webp'
+    assert pick_variant(str(tmp_path), 'photo.jpg', 'thumb') == 'photo.thumb.jpg'
+    assert pick_variant(str(tmp_path), 'photo.jpg', 'huge') == 'photo.jpg'
+
+
+def test_variant_filename():
+    assert variant_filename('abc_photo.jpeg', 'card') == 'abc_photo.card.jpeg'
+    assert variant_filename('abc_photo.jpeg', 'card', webp=True) == 'abc_photo.card.webp'
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    path = tmp_path / 'rotated.jpg'
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotate 90 degrees clockwise when displayed
+    Image.new('RGB', (2000, 1000), (200, 30, 30)).save(path, 'JPEG', exif=exif)
+    generate_variants(str(path))
+    with Image.open(tmp_path / 'rotated.card.jpg') as card:
+        assert card.size == (240, 480)
+
+
+def test_oversized_images_are_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)  # restored afterwards
+    monkeypatch.setattr(image_variants, 'MAX_IMAGE_PIXELS', 100 * 100)
+    path = make_image(tmp_path, 'huge.png', size=(200, 100), fmt='PNG')
+    with pytest.warns(Image.DecompressionBombWarning), pytest.raises(Image.DecompressionBombError):
+        generate_variants(str(path))
@@ -0,0 +1,155 @@
+# testing retries, backoff and counters of the in-memory job queue
+
+import time
+
+import pytest
+from flask import Flask
+
+import app  # noqa: F401  (jobs must be imported through the app, not first)
+from jobs import JobQueue
+
+
+def wait_for(queue, job_type, counter, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = queue.stats()['jobs'].get(job_type, {})
+        if stats.get(counter):
+            return stats
+        time.sleep(0.01)
+    raise AssertionError(f'{job_type} never reached {counter}: {queue.stats()}')
+
+
+def test_job_runs_with_payload_as_kwargs():
+    queue = JobQueue(workers=1)
+    seen = []
+    queue.register('echo')(lambda text: seen.append(text))
+    queue.enqueue('echo', {'text': 'hi'}).result()
+    assert seen == ['hi']
+    assert queue.stats()['jobs']['echo']['succeeded'] == 1
+
+
+def test_failures_are_retried_until_success():
+    queue = JobQueue(workers=1, base_delay=0.01)
+    calls = []
+
+    @queue.register('flaky', max_attempts=3)
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError('try again')
+
+    queue.enqueue('flaky')
+    stats = wait_for(queue, 'flaky', 'succeeded')
+    assert (stats['retried'], stats['failed'], len(calls)) == (2, 0, 3)
+
+
+def test_gives_up_after_max_attempts():
+    queue = JobQueue(workers=1, base_delay=0.01)
+    queue.register('broken', max_attempts=2)(lambda: 1 / 0)
+    queue.enqueue('broken')
+    stats = wait_for(queue, 'broken', 'failed')
+    assert (stats['retried'], stats['failed']) == (1, 1)
+
+
+def test_failure_hook_gets_the_last_error_and_payload():
+    queue = JobQueue(workers=1, base_delay=0.01)
+    failures = []
+    queue.register('broken', max_attempts=2,
+                   on_failure=lambda error, **payload: failures.append((error, payload)))(lambda n: 1 / 0)
+    queue.enqueue('broken', {'n': 3})
+    wait_for(queue, 'broken', 'failed')
+    deadline = time.monotonic() + 2
+    while not failures and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert failures == [('ZeroDivisionError: division by zero', {'n': 3})]
+
+
+def test_backoff_doubles_up_to_the_cap():
+    queue = JobQueue(base_delay=5, max_delay=30)
+    assert [queue.backoff(n) for n in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+def test_unknown_job_type():
+    queue = JobQueue()
+    with pytest.raises(ValueError):
+        queue.enqueue('nope')
+
+
+class FakeJobsDb:
+    """background_jobs rows: written on a request connection, visible once committed"""
+
+    def __init__(self):
+        self.committed = set()
+        self.claimed = []
+
+    def connection(self):
+        return FakeJobsConn(self)
+
+
+class FakeJobsCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        db = self.conn.db
+        if query.strip().startswith('INSERT INTO background_jobs'):
+            self.lastrowid = len(db.committed) + len(self.conn.uncommitted) + 1
+            self.conn.uncommitted.append(self.lastrowid)
+        elif "SET status = 'running'" in query:
+            self.rowcount = int(params[0] in db.committed)
+            db.claimed.append(params[0])
+
+    def close(self):
+        pass
+
+
+class FakeJobsConn:
+    def __init__(self, db):
+        self.db = db
+        self.uncommitted = []
+
+    def cursor(self, dictionary=False):
+        return FakeJobsCursor(self)
+
+    def commit(self):
+        self.db.committed.update(self.uncommitted)
+        self.uncommitted = []
+
+    def close(self):
+        self.uncommitted = []
+
+
+def request_queue():
+    db = FakeJobsDb()
+    request_conn = db.connection()
+    queue = JobQueue(connect=db.connection, request_connection=lambda: request_conn, workers=1)
+    flask_app = Flask(__name__)
+    queue.init_app(flask_app)
+    return db, request_conn, queue, flask_app
+
+
+def test_request_jobs_use_the_request_connection_and_run_after_commit():
+    db, request_conn, queue, flask_app = request_queue()
+    seen = []
+    queue.register('echo')(lambda text: seen.append(text))
+
+    with flask_app.test_request_context('/'):
+        assert queue.enqueue('echo', {'text': 'hi'}) is None
+        assert request_conn.uncommitted == [1] and not db.claimed
+        request_conn.commit()
+    wait_for(queue, 'echo', 'succeeded')
+    assert seen == ['hi'] and db.claimed == [1]
+
+
+def test_request_jobs_rolled_back_with_the_handler_never_run():
+    db, request_conn, queue, flask_app = request_queue()
+    seen = []
+    queue.register('echo')(lambda text: seen.append(text))
+
+    with flask_app.test_request_context('/'):
+        queue.enqueue('echo', {'text': 'hi'})
+        request_conn.close()  # request-scoped close() rolls back
+    queue._executor.shutdown(wait=True)
+    assert db.claimed == [1] and seen == []
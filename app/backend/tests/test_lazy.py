@@ -0,0 +1,43 @@
+# testing once-only lazy initialization of shared resources
+
+import threading
+import time
+
+from lazy import Lazy
+
+
+def test_factory_runs_once_across_threads():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.01)
+        return object()
+
+    lazy = Lazy(factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lazy.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len({id(result) for result in results}) == 1
+
+
+def test_failed_factory_is_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError('not yet')
+        return 'ready'
+
+    lazy = Lazy(factory)
+    try:
+        lazy.get()
+    except OSError:
+        pass
+    assert not lazy.initialized
+    assert lazy.get() == 'ready' and lazy.initialized
@@ -0,0 +1,110 @@
+# testing the batching mail outbox with in-memory and file transports
+
+import email
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from mailer import FileTransport, Outbox, RateLimiter, build_message, create_outbox
+
+
+class MemoryTransport:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+
+    def send(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('temporarily unavailable')
+        self.sent.append(message['To'])
+
+    def close(self):
+        pass
+
+
+def test_messages_are_sent_in_batches():
+    transport = MemoryTransport()
+    outbox = Outbox(transport, batch_size=10, rate=0)
+    with outbox._cond:  # hold the sender so all five land in one batch
+        for i in range(5):
+            outbox._queue.append((0, i, 0, {'To': f'user{i}@sfsu.edu'}, None))
+    outbox.put({'To': 'last@sfsu.edu'})
+    assert outbox.flush(timeout=2)
+    assert len(transport.sent) == 6
+    assert outbox.stats()['batches'] <= 2
+
+
+def test_failures_are_retried_then_dead_lettered(tmp_path):
+    transport = MemoryTransport(failures=10)
+    outbox = Outbox(transport, rate=0, max_attempts=2, base_delay=0.01,
+                    dead_letter=FileTransport(str(tmp_path)))
+    outbox.send('user@sfsu.edu', 'Verify your email', 'hello')
+    deadline = time.monotonic() + 2
+    while outbox.stats()['dead_lettered'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert outbox.stats()['retried'] == 1
+    [letter] = tmp_path.iterdir()
+    assert email.message_from_string(letter.read_text())['X-Dead-Letter-Reason'] == 'temporarily unavailable'
+
+
+def test_file_transport_writes_eml(tmp_path):
+    outbox = Outbox(FileTransport(str(tmp_path)), rate=0)
+    outbox.send('user@sfsu.edu', 'Verify your email', 'plain', '<p>html</p>')
+    assert outbox.flush(timeout=2)
+    [sent] = tmp_path.iterdir()
+    message = email.message_from_string(sent.read_text())
+    assert message['To'] == 'user@sfsu.edu' and message.is_multipart()
+
+
+def test_rate_limiter_paces_after_the_burst():
+    limiter = RateLimiter(rate=100, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.04
+
+
+def test_deliver_reports_one_attempt_without_retrying():
+    transport = MemoryTransport(failures=1)
+    outbox = Outbox(transport, rate=0, base_delay=0.01)
+    failed = outbox.deliver(build_message('a@sfsu.edu', 'Hi', 'Hello'))
+    with pytest.raises(ConnectionError):
+        failed.result(timeout=2)
+    assert outbox.deliver(build_message('b@sfsu.edu', 'Hi', 'Hello')).result(timeout=2)
+    assert transport.sent == ['b@sfsu.edu']
+    assert outbox.stats()['retried'] == 0 and outbox.stats()['queued'] == 0
+
+
+def test_sending_rate_is_split_between_workers(monkeypatch):
+    monkeypatch.setenv('MAIL_RATE_PER_SECOND', '14')
+    monkeypatch.setenv('MAIL_SENDERS', '2')
+    assert create_outbox('file').limiter.rate == 7
+
+
+class BrokenCloseTransport(MemoryTransport):
+    def close(self):
+        raise RuntimeError('close failed')
+
+
+def test_sender_survives_errors_outside_the_send():
+    transport = BrokenCloseTransport()
+    outbox = Outbox(transport, rate=0)
+    cancelled = Future()
+    cancelled.cancel()  # its job gave up waiting
+    outbox.put(build_message('a@sfsu.edu', 'Hi', 'Hello'), future=cancelled)
+    assert outbox.deliver(build_message('b@sfsu.edu', 'Hi', 'Hello')).result(timeout=2)
+    assert transport.sent == ['a@sfsu.edu', 'b@sfsu.edu']
+
+
+def test_bury_writes_a_dead_letter(tmp_path):
+    outbox = Outbox(MemoryTransport(), rate=0, dead_letter=FileTransport(str(tmp_path)))
+    outbox.bury(build_message('a@sfsu.edu', 'Hi', 'Hello'), 'RuntimeError: boom')
+    [letter] = tmp_path.iterdir()
+    assert email.message_from_string(letter.read_text())['X-Dead-Letter-Reason'] == 'RuntimeError: boom'
+    assert outbox.stats()['dead_lettered'] == 1
@@ -0,0 +1,57 @@
+# testing how message pages resolve sender usernames through the cache
+
+import threading
+
+import app  # noqa: F401  (messaging must be imported through the app, not first)
+import messaging
+from messaging import attach_sender_usernames, sender_username_cache
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_one_lookup_for_uncached_senders():
+    sender_username_cache.clear()
+    messages = [{'sender_id': 1}, {'sender_id': 2}, {'sender_id': 1}]
+    cursor = FakeCursor([{'user_id': 1, 'username': 'ann'}, {'user_id': 2, 'username': 'bob'}])
+    attach_sender_usernames(cursor, messages)
+    assert len(cursor.executed) == 1
+    assert cursor.executed[0][1] == (1, 2)
+    assert [m['sender_username'] for m in messages] == ['ann', 'bob', 'ann']
+
+
+def test_cached_senders_skip_the_query():
+    sender_username_cache.clear()
+    sender_username_cache.set(1, 'ann')
+    cursor = FakeCursor([])
+    messages = attach_sender_usernames(cursor, [{'sender_id': 1}])
+    assert cursor.executed == []
+    assert messages[0]['sender_username'] == 'ann'
+
+
+def poll(since=0):
+    with app.app.test_request_context(f'/messaging/events?since={since}&timeout=0'):
+        response = app.app.make_response(messaging.poll_events.__wrapped__({'user_id': 1}))
+        return response.status_code, response.headers, response.get_json()
+
+
+def test_polls_past_the_reserved_threads_are_turned_away(monkeypatch):
+    monkeypatch.setattr(messaging, 'poll_slots', threading.BoundedSemaphore(1))
+    assert poll()[0] == 200
+
+    messaging.poll_slots.acquire()  # another poll is parked
+    status, headers, body = poll()
+    assert status == 503
+    # longer than a successful poll would have kept the client waiting
+    assert int(headers['Retry-After']) > messaging.EVENTS_POLL_TIMEOUT
+    messaging.poll_slots.release()
+    assert poll()[0] == 200
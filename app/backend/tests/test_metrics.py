@@ -0,0 +1,159 @@
+# testing the /metrics registry: histograms, exposition format and merging worker snapshots
+
+import os
+import threading
+
+from flask import Blueprint, Flask
+
+import app  # noqa: F401  (the app collector imports the blueprints through it)
+from metrics import BUCKETS, Metrics, app_stats
+
+
+def make_app(registry):
+    flask_app = Flask(__name__)
+    registry.init_app(flask_app)
+    items = Blueprint('items', __name__)
+
+    @items.route('/items/<int:item_id>')
+    def get_item(item_id):
+        return {'item_id': item_id}
+
+    flask_app.register_blueprint(items)
+    return flask_app
+
+
+def sample(text, line_start):
+    """Value of the first exposition line starting with line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{line_start} not in:\n{text}')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Metrics()
+    for seconds in (0.001, 0.02, 0.02, 7, 100):
+        registry.observe('http_request_duration_seconds', seconds, (('endpoint', 'a'),))
+    text = registry.render(registry.collect())
+
+    assert sample(text, 'http_request_duration_seconds_bucket{endpoint="a",le="0.005"}') == 1
+    assert sample(text, 'http_request_duration_seconds_bucket{endpoint="a",le="0.025"}') == 3
+    assert sample(text, 'http_request_duration_seconds_bucket{endpoint="a",le="10.0"}') == 4
+    assert sample(text, 'http_request_duration_seconds_bucket{endpoint="a",le="+Inf"}') == 5
+    assert sample(text, 'http_request_duration_seconds_count{endpoint="a"}') == 5
+    assert sample(text, 'http_request_duration_seconds_sum{endpoint="a"}') == 107.041
+    assert len([line for line in text.splitlines() if '_bucket' in line]) == len(BUCKETS) + 1
+
+
+def test_label_values_are_escaped():
+    registry = Metrics()
+    registry.describe('odd_total', 'counter', 'Odd labels')
+    registry.inc('odd_total', labels=(('path', 'a"b\\c\nd'),))
+    assert 'odd_total{path="a\\"b\\\\c\\nd"} 1' in registry.render(registry.collect())
+
+
+def test_requests_are_timed_per_blueprint_and_endpoint():
+    client = make_app(Metrics()).test_client()
+    for item_id in (1, 2):
+        assert client.get(f'/items/{item_id}').status_code == 200
+    client.get('/missing')
+
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+    assert response.mimetype == 'text/plain'
+    assert sample(text, 'http_request_duration_seconds_count{blueprint="items",endpoint="items.get_item",'
+                        'method="GET",status="200"}') == 2
+    assert sample(text, 'http_request_duration_seconds_count{blueprint="",endpoint="unmatched",'
+                        'method="GET",status="404"}') == 1
+    # the scrape itself is in flight while it renders
+    assert sample(text, 'http_requests_in_flight ') == 1
+
+
+def test_in_flight_counts_concurrent_requests():
+    registry = Metrics()
+    flask_app = make_app(registry)
+    started, release = threading.Event(), threading.Event()
+
+    @flask_app.route('/slow')
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    thread = threading.Thread(target=flask_app.test_client().get, args=('/slow',))
+    thread.start()
+    started.wait(5)
+    assert registry.collect()['http_requests_in_flight'][()] == 1
+    release.set()
+    thread.join()
+    assert registry.collect()['http_requests_in_flight'][()] == 0
+
+
+def test_metrics_token(monkeypatch):
+    client = make_app(Metrics()).test_client()
+    monkeypatch.setenv('METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_collectors_and_derived_hit_ratio():
+    registry = Metrics()
+    registry.describe('thing_hits_total', 'counter', 'Hits')
+    registry.describe('thing_misses_total', 'counter', 'Misses')
+    registry.register(lambda: [('thing_hits_total', (('cache', 'a'),), 3),
+                               ('thing_misses_total', (('cache', 'a'),), 1)])
+
+    def broken():
+        raise RuntimeError('boom')
+    registry.register(broken)
+
+    merged = registry.collect()
+    assert merged['thing_hit_ratio'][(('cache', 'a'),)] == 0.75
+    assert '# TYPE thing_hit_ratio gauge' in registry.render(merged)
+
+
+def worker_snapshot(pid, in_flight, requests, uploaded):
+    return {
+        'pid': pid,
+        'values': [['http_requests_in_flight', [], in_flight], ['upload_bytes_total', [], uploaded]],
+        'histograms': [['http_request_duration_seconds', [['endpoint', 'a']],
+                        [requests] + [0] * len(BUCKETS) + [requests * 0.001]]],
+    }
+
+
+def test_worker_snapshots_are_summed(tmp_path):
+    registry = Metrics(directory=str(tmp_path))
+    registry.describe('upload_bytes_total', 'counter', 'Bytes')
+    registry._write('101.json', worker_snapshot(101, 2, 5, 100))
+    registry._write('102.json', worker_snapshot(102, 1, 3, 50))
+
+    merged = registry.collect()
+    assert merged['http_requests_in_flight'][()] == 3  # 2 + 1 + this process's 0
+    assert merged['upload_bytes_total'][()] == 150
+    assert merged['http_request_duration_seconds'][(('endpoint', 'a'),)][0] == 8
+    assert os.path.exists(tmp_path / f'{os.getpid()}.json')
+
+
+def test_dead_worker_keeps_counters_but_not_gauges(tmp_path):
+    registry = Metrics(directory=str(tmp_path))
+    registry.describe('upload_bytes_total', 'counter', 'Bytes')
+    registry._write('101.json', worker_snapshot(101, 2, 5, 100))
+    registry._write('102.json', worker_snapshot(102, 1, 3, 50))
+
+    registry.mark_process_dead(101)
+    registry.mark_process_dead(102)
+    registry.mark_process_dead(103)  # never wrote a snapshot
+    assert not os.path.exists(tmp_path / '101.json')
+
+    merged = registry.collect()
+    assert merged['http_requests_in_flight'][()] == 0
+    assert merged['upload_bytes_total'][()] == 150
+    assert merged['http_request_duration_seconds'][(('endpoint', 'a'),)][0] == 8
+
+    registry.clear()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.json')]
+
+
+def test_app_stats_reads_existing_counters():
+    families = {name for name, _, _ in app_stats()}
+    assert {'db_pool_connections', 'cache_hits_total', 'password_hash_pending', 'mail_queued'} <= families
@@ -0,0 +1,114 @@
+# testing the migration runner: discovery, statement splitting, applying only pending versions
+
+import pytest
+
+import migrate
+
+
+class FakeError(Exception):
+    def __init__(self, errno):
+        super().__init__(f'error {errno}')
+        self.errno = errno
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        if query in self.conn.fail:
+            raise FakeError(self.conn.fail[query])
+        self.conn.executed.append((query, params))
+        if query.startswith('SELECT GET_LOCK') or query.startswith('SELECT RELEASE_LOCK'):
+            self.result = [(1,)]
+        elif query.startswith('SELECT version'):
+            self.result = [(version,) for version in self.conn.applied]
+        elif query.startswith('INSERT INTO schema_migrations'):
+            self.conn.applied.append(params[0])
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, applied=(), fail=None):
+        self.applied = list(applied)
+        self.fail = fail or {}
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    (tmp_path / '0002_second.sql').write_text('-- comment\nALTER TABLE b ADD INDEX i (x);\n')
+    (tmp_path / '0001_first.sql').write_text('CREATE INDEX a1 ON a (x);\n\nCREATE INDEX a2 ON a (y);')
+    (tmp_path / 'README.md').write_text('not a migration')
+    return str(tmp_path)
+
+
+def test_discover_orders_by_version(migrations_dir):
+    assert [(v, name) for v, name, _ in migrate.discover(migrations_dir)] == [(1, 'first'), (2, 'second')]
+
+
+def test_duplicate_versions_are_rejected(migrations_dir, tmp_path):
+    (tmp_path / '0002_other.sql').write_text('SELECT 1;')
+    with pytest.raises(ValueError):
+        migrate.discover(migrations_dir)
+
+
+def test_split_statements_drops_comments_and_blanks():
+    sql = '-- header\nALTER TABLE t\n    ADD INDEX i (a);\n\n-- next\nCREATE INDEX j ON t (b);\n'
+    assert migrate.split_statements(sql) == ['ALTER TABLE t\n    ADD INDEX i (a)', 'CREATE INDEX j ON t (b)']
+
+
+def test_only_pending_migrations_are_applied(migrations_dir):
+    conn = FakeConn(applied=[1])
+    assert migrate.migrate(conn, migrations_dir) == [2]
+    statements = [query for query, _ in conn.executed]
+    assert 'ALTER TABLE b ADD INDEX i (x)' in statements
+    assert 'CREATE INDEX a1 ON a (x)' not in statements
+    assert conn.applied == [1, 2] and conn.commits == 1
+    assert statements[-1].startswith('SELECT RELEASE_LOCK')
+    assert migrate.migrate(conn, migrations_dir) == []
+
+
+def test_already_applied_statements_are_skipped(migrations_dir):
+    conn = FakeConn(fail={'CREATE INDEX a1 ON a (x)': 1061})
+    assert migrate.migrate(conn, migrations_dir) == [1, 2]
+    assert ('CREATE INDEX a2 ON a (y)', None) in conn.executed
+
+
+def test_other_errors_stop_the_run(migrations_dir):
+    conn = FakeConn(fail={'CREATE INDEX a2 ON a (y)': 1146})
+    with pytest.raises(FakeError):
+        migrate.migrate(conn, migrations_dir)
+    assert conn.applied == []
+    assert conn.executed[-1][0].startswith('SELECT RELEASE_LOCK')
+
+
+def test_repository_migrations_parse():
+    for _, _, path in migrate.discover():
+        with open(path) as f:
+            assert migrate.split_statements(f.read())
+
+
+def test_shipped_migrations_parse():
+    for version, name, path in migrate.discover():
+        with open(path) as f:
+            statements = migrate.split_statements(f.read())
+        assert statements, f'{version:04d}_{name} has no statements'
+        assert all(not statement.startswith('--') for statement in statements)
@@ -0,0 +1,73 @@
+# testing the keyset pagination helpers used by the list endpoints
+
+import base64
+import datetime
+import json
+
+import pytest
+
+from pagination import (
+    InvalidCursor, Keyset, MAX_PAGE_SIZE, apply_page, decode_cursor, encode_cursor,
+    get_page_size, page_request, split_page
+)
+
+KEYSET = Keyset(('p.created_at', 'created_at'), ('p.product_id', 'product_id'))
+
+
+def test_cursor_round_trip():
+    values = [datetime.datetime(2025, 5, 1, 12, 30), 42]
+    assert decode_cursor(encode_cursor(values), 2) == values
+
+
+def forged(values):
+    payload = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+@pytest.mark.parametrize('token', [
+    'not-a-cursor', encode_cursor([1]), '',
+    forged([{'x': 1}, 2]), forged([{'dt': 5}, 2]), forged([{'dt': '2025-05-01', 'y': 1}, 2]),
+    forged([[1], 2]), forged([None, 2]), forged([True, 2]),
+])
+def test_bad_cursor_rejected(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, 2)
+
+
+def test_page_size_is_clamped():
+    assert get_page_size({'limit': '100000'}) == MAX_PAGE_SIZE
+    assert get_page_size({'limit': '0'}) == 1
+    assert get_page_size({'limit': 'abc'}) == get_page_size({})
+
+
+def test_apply_page_adds_keyset_predicate():
+    created = datetime.datetime(2025, 5, 1)
+    query, params = apply_page("SELECT * FROM products p WHERE 1", ['x'], KEYSET, [created, 9], 20)
+    assert "(p.created_at < %s) OR (p.created_at = %s AND p.product_id < %s)" in query
+    assert query.endswith("ORDER BY p.created_at DESC, p.product_id DESC LIMIT %s")
+    assert params == ('x', created, created, 9, 21)
+
+
+def test_split_page_returns_next_cursor():
+    rows = [{'created_at': datetime.datetime(2025, 5, 1), 'product_id': n} for n in (3, 2, 1)]
+    page, next_cursor = split_page(rows, KEYSET, 2)
+    assert [r['product_id'] for r in page] == [3, 2]
+    assert decode_cursor(next_cursor, 2)[1] == 2
+    assert split_page(rows, KEYSET, 3) == (rows, None)
+
+
+def test_expression_keyset_repeats_its_params():
+    keyset = Keyset(("MATCH(p.name) AGAINST (%s IN BOOLEAN MODE)", 'relevance', ('+mac*',)),
+                    ('p.product_id', 'product_id'))
+    query, params = apply_page("SELECT 1 WHERE 1", [], keyset, [0.5, 9], 10)
+    assert query.count('%s') == len(params)
+    assert params == ('+mac*', 0.5, '+mac*', 0.5, 9, '+mac*', 11)
+
+
+def test_no_limit_or_cursor_returns_everything():
+    assert page_request({}, KEYSET) == (None, None)
+    assert page_request({'limit': '10'}, KEYSET) == (10, None)
+    query, params = apply_page("SELECT * FROM products p WHERE 1", ['x'], KEYSET, None, None)
+    assert 'LIMIT' not in query and params == ('x',)
+    rows = [{'created_at': datetime.datetime(2025, 5, 1), 'product_id': n} for n in range(60)]
+    assert split_page(rows, KEYSET, None) == (rows, None)
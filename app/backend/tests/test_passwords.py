@@ -0,0 +1,148 @@
+# testing bcrypt offload: pool and inline hashing, admission control, rehash, login
+
+import os
+import signal
+import threading
+import time
+
+import bcrypt
+import pytest
+
+from passwords import HasherBusy, PasswordHasher, hash_rounds
+
+
+def test_inline_hash_and_check():
+    hasher = PasswordHasher(rounds=4, workers=0)
+    hashed = hasher.hash_password('Secret1!')
+    assert hashed.startswith('$2b$04$')
+    assert hasher.check_password('Secret1!', hashed)
+    assert not hasher.check_password('Secret2!', hashed)
+    stats = hasher.stats()
+    assert stats['hashes'] == 1 and stats['checks'] == 2 and stats['pending'] == 0
+
+
+def test_pool_hashes_match_bcrypt():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    hashed = hasher.hash_password('Secret1!')
+    assert bcrypt.checkpw(b'Secret1!', hashed.encode('utf-8'))
+    assert hasher.check_password('Secret1!', hashed)
+    assert hasher.stats()['hash_seconds_total'] > 0
+
+
+def test_rejects_when_saturated():
+    hasher = PasswordHasher(rounds=4, workers=0, max_pending=1)
+    entered, release = threading.Event(), threading.Event()
+
+    def slow(*args):
+        entered.set()
+        release.wait(5)
+        return True, 0.0, 0.0
+
+    thread = threading.Thread(target=hasher._run, args=(slow,))
+    thread.start()
+    entered.wait(5)
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.hash_password('Secret1!')
+    finally:
+        release.set()
+        thread.join()
+    assert hasher.stats()['rejected'] == 1
+    # The slot is free again once the first call finishes
+    assert hasher.hash_password('Secret1!')
+
+
+def test_needs_rehash_on_other_work_factor():
+    hasher = PasswordHasher(rounds=5, workers=0)
+    old = bcrypt.hashpw(b'Secret1!', bcrypt.gensalt(4)).decode('utf-8')
+    assert hash_rounds(old) == 4
+    assert hasher.needs_rehash(old)
+    assert not hasher.needs_rehash(hasher.hash_password('Secret1!'))
+    assert hash_rounds('not-a-hash') is None
+
+
+def test_pool_is_replaced_when_its_process_dies():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    hashed = hasher.hash_password('Secret1!')
+    executor = hasher._pool()
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join(5)
+    assert hasher.check_password('Secret1!', hashed)
+    assert hasher._pool() is not executor
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=0.2)
+    hasher._pool().submit(time.sleep, 0).result()  # start the pool process first
+    with pytest.raises(HasherBusy, match='timed out'):
+        hasher._run(time.sleep, 1)
+    assert hasher.stats()['pending'] == 1
+    with pytest.raises(HasherBusy, match='Too many'):
+        hasher.hash_password('Secret1!')
+    time.sleep(1.5)
+    assert hasher.stats()['pending'] == 0
+    assert hasher.hash_password('Secret1!')
+
+
+class LoginCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(' '.join(query.split()))
+
+    def fetchone(self):
+        return {'user_id': 3, 'username': 'ann', 'email': 'ann@sfsu.edu', 'first_name': 'Ann',
+                'last_name': 'Lee', 'user_role': 'user', 'account_status': 'active',
+                'verification_status': 'verified', 'password_hash': self.conn.password_hash}
+
+    def close(self):
+        pass
+
+
+class LoginConn:
+    def __init__(self, password_hash):
+        self.password_hash = password_hash
+        self.executed = []
+        self.commits = 0
+        self.released = 0
+
+    def cursor(self, dictionary=False):
+        return LoginCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+    def release(self):
+        self.released += 1
+
+
+def test_login_hashes_without_holding_a_connection(monkeypatch):
+    import app
+    import auth
+    from flask import g
+
+    conn = LoginConn(bcrypt.hashpw(b'Secret1!', bcrypt.gensalt(4)).decode())
+
+    def get_db_connection():
+        g.db_conn = conn  # request-scoped, like app.get_db_connection
+        return conn
+
+    checked = []
+
+    def check_password(password, hashed):
+        checked.append(('db_conn' in g, conn.released))
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+
+    monkeypatch.setattr(auth, 'get_db_connection', get_db_connection)
+    monkeypatch.setattr(auth.hasher, 'check_password', check_password)
+    monkeypatch.setattr(auth.hasher, 'needs_rehash', lambda hashed: False)
+    with app.app.test_request_context(method='POST', json={'username': 'ann', 'password': 'Secret1!'}):
+        response = app.app.make_response(auth.login())
+    assert response.status_code == 200
+    assert checked == [(False, 1)]
+    assert conn.executed[-1].startswith('UPDATE users SET last_login') and conn.commits == 1
@@ -0,0 +1,113 @@
+# testing query timing per request: Server-Timing, repeated statements, route percentiles
+
+import json
+import logging
+
+from flask import Flask, jsonify
+
+from query_profiler import QueryProfiler, normalize_sql, percentile
+
+
+class FakeCursor:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.rowcount = 1
+
+    def execute(self, query, params=None):
+        if self.fail:
+            raise RuntimeError('boom')
+
+    def fetchall(self):
+        return [(1,)]
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self, dictionary=False, fail=False):
+        return FakeCursor(fail)
+
+    def close(self):
+        self.closed = True
+
+
+def make_app(profiler, repeats=1):
+    flask_app = Flask(__name__)
+    profiler.init_app(flask_app)
+
+    @flask_app.route('/items/<int:item_id>')
+    def get_item(item_id):
+        conn = profiler.wrap(FakeConn())
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM items WHERE item_id = %s", (item_id,))
+        for _ in range(repeats):
+            cursor.execute("""
+                SELECT url FROM images
+                WHERE item_id = %s
+            """, (item_id,))
+        conn.close()
+        return jsonify({'rows': cursor.fetchall(), 'closed': conn.closed})
+
+    @flask_app.route('/broken')
+    def broken():
+        profiler.wrap(FakeConn()).cursor(fail=True).execute("SELECT 1")
+
+    return flask_app.test_client()
+
+
+def test_server_timing_counts_queries():
+    client = make_app(QueryProfiler(), repeats=2)
+    response = client.get('/items/3')
+    assert response.get_json() == {'rows': [[1]], 'closed': True}
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=') and 'desc="3 queries"' in timing and 'app;dur=' in timing
+
+
+def test_repeated_statement_is_logged(caplog):
+    profiler = QueryProfiler(repeat_threshold=5)
+    client = make_app(profiler, repeats=5)
+    with caplog.at_level(logging.WARNING, logger='perf'):
+        client.get('/items/1')
+    event = json.loads(caplog.records[-1].getMessage())
+    assert event['route'] == 'GET /items/<int:item_id>'
+    assert event['queries'] == 6
+    assert event['repeated'] == [{'sql': 'SELECT url FROM images WHERE item_id = %s', 'count': 5}]
+    assert profiler.stats()['routes']['GET /items/<int:item_id>']['repeated_statement_requests'] == 1
+
+
+def test_fast_requests_are_not_logged(caplog):
+    client = make_app(QueryProfiler(repeat_threshold=5), repeats=1)
+    with caplog.at_level(logging.WARNING, logger='perf'):
+        client.get('/items/1')
+    assert not caplog.records
+
+
+def test_failing_statement_is_logged_as_error(caplog):
+    client = make_app(QueryProfiler())
+    with caplog.at_level(logging.WARNING, logger='perf'):
+        assert client.get('/broken').status_code == 500
+    record = caplog.records[-1]
+    assert record.levelno == logging.ERROR
+    assert json.loads(record.getMessage())['errors'] == [{'sql': 'SELECT 1', 'error': 'boom'}]
+
+
+def test_route_percentiles_and_statement_totals():
+    profiler = QueryProfiler(window=10)
+    client = make_app(profiler, repeats=1)
+    for item_id in range(12):
+        client.get(f'/items/{item_id}')
+    stats = profiler.stats()
+    route = stats['routes']['GET /items/<int:item_id>']
+    assert route['requests'] == 12
+    assert route['avg_queries'] == 2 and route['max_queries'] == 2
+    assert route['p50_ms'] <= route['p95_ms'] <= route['p99_ms']
+    assert {s['sql']: s['count'] for s in stats['statements']}['SELECT * FROM items WHERE item_id = %s'] == 12
+    profiler.reset()
+    assert profiler.stats()['routes'] == {}
+
+
+def test_percentile_and_normalization():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 51 and percentile(values, 0.99) == 100 and percentile([], 0.5) == 0.0
+    assert normalize_sql("SELECT *\n  FROM t WHERE id IN (%s, %s,%s)") == 'SELECT * FROM t WHERE id IN (%s, ...)'
@@ -0,0 +1,299 @@
+# testing cached public responses: keys, tags, the byte budget and backends
+
+import fnmatch
+
+from flask import Flask, jsonify
+
+import app  # noqa: F401  (products must be imported through the app, not first)
+import products
+from response_cache import MemoryBackend, RedisBackend, ResponseCache, invalidate_responses, tag_response
+
+
+def make_app(cache, calls):
+    flask_app = Flask(__name__)
+
+    @flask_app.route('/items/<int:item_id>')
+    @cache.cached('item', ttl=60, tags=lambda item_id: [f'item:{item_id}'])
+    def get_item(item_id):
+        calls.append(item_id)
+        tag_response('owner:7')
+        if item_id == 404:
+            return jsonify({'error': 'not found'}), 404
+        return jsonify({'item_id': item_id})
+
+    @flask_app.route('/search')
+    @cache.cached('search', normalize={'term': lambda value: value.lower()})
+    def search():
+        calls.append('search')
+        return jsonify([])
+
+    return flask_app.test_client()
+
+
+def test_second_request_is_a_hit():
+    calls = []
+    cache = ResponseCache(MemoryBackend())
+    client = make_app(cache, calls)
+    first = client.get('/items/1')
+    second = client.get('/items/1')
+    assert calls == [1]
+    assert first.headers['X-Cache'] == 'MISS' and second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == {'item_id': 1}
+    assert second.mimetype == 'application/json'
+    assert cache.stats()['endpoints']['item'] == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+def test_query_args_are_normalized():
+    calls = []
+    client = make_app(ResponseCache(MemoryBackend()), calls)
+    client.get('/search?term=Laptop&limit=20')
+    client.get('/search?limit=20&term=laptop&category=')
+    assert calls == ['search']
+    client.get('/search?term=laptop&limit=10')
+    assert calls == ['search', 'search']
+
+
+def test_errors_are_not_cached():
+    calls = []
+    client = make_app(ResponseCache(MemoryBackend()), calls)
+    client.get('/items/404')
+    client.get('/items/404')
+    assert calls == [404, 404]
+
+
+def test_invalidate_by_base_and_view_tags():
+    calls = []
+    cache = ResponseCache(MemoryBackend())
+    client = make_app(cache, calls)
+    client.get('/items/1')
+    client.get('/items/2')
+    cache.invalidate('item:1')
+    client.get('/items/1')
+    client.get('/items/2')
+    assert calls == [1, 2, 1]
+    cache.invalidate('owner:7')
+    client.get('/items/1')
+    client.get('/items/2')
+    assert calls == [1, 2, 1, 1, 2]
+
+
+def test_memory_budget_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=10)
+    backend.set('a', b'12345', 60, ['t'])
+    backend.set('b', b'12345', 60)
+    assert backend.get('a') == b'12345'  # now b is least recently used
+    backend.set('c', b'12345', 60)
+    assert backend.get('b') is None
+    assert backend.stats()['bytes'] == 10 and backend.evictions == 1
+    backend.set('huge', b'x' * 11, 60)
+    assert backend.get('huge') is None
+    assert backend.invalidate(['t']) == 1
+    assert backend.stats()['entries'] == 1
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.results.append(getattr(self.client, name)(*args, **kwargs))
+        return call
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+
+class FakeRedis:
+    """Just enough of the redis-py client for RedisBackend"""
+
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, px=None):
+        self.values[key] = value
+
+    def sadd(self, key, member):
+        self.sets.setdefault(key, set()).add(member.encode('utf-8'))
+
+    def expire(self, key, seconds):
+        pass
+
+    def smembers(self, key):
+        return set(self.sets.get(key, ()))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in [*self.values, *self.sets] if fnmatch.fnmatch(key, match)]
+
+
+def test_redis_backend_shares_entries_and_tags():
+    redis = FakeRedis()
+    calls = []
+    worker_a = make_app(ResponseCache(RedisBackend(client=redis)), calls)
+    cache_b = ResponseCache(RedisBackend(client=redis))
+    worker_b = make_app(cache_b, calls)
+    worker_a.get('/items/1')
+    assert worker_b.get('/items/1').headers['X-Cache'] == 'HIT'
+    # Invalidation in one worker reaches the other
+    cache_b.invalidate('owner:7')
+    worker_a.get('/items/1')
+    assert calls == [1, 1]
+
+
+def test_backend_errors_fall_through_to_the_view():
+    class Broken:
+        def __getattr__(self, name):
+            raise ConnectionError('cache down')
+
+    calls = []
+    cache = ResponseCache(RedisBackend(client=Broken()))
+    client = make_app(cache, calls)
+    assert client.get('/items/1').get_json() == {'item_id': 1}
+    assert cache.stats()['errors'] == 2
+
+
+class FakeCursor:
+    def __init__(self, product):
+        self.product = product
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return dict(self.product)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, product):
+        self.product = product
+        self.opened = 0
+
+    def cursor(self, dictionary=False):
+        self.opened += 1
+        return FakeCursor(self.product)
+
+    def close(self):
+        pass
+
+
+def test_get_product_is_invalidated_by_listing_writes(monkeypatch):
+    conn = FakeConn({'product_id': 5, 'user_id': 9, 'name': 'Desk'})
+    monkeypatch.setattr(products, 'get_db_connection', lambda: conn)
+    monkeypatch.setattr(products, 'attach_images', lambda cursor, rows: None)
+    monkeypatch.setattr(products, 'attach_seller_ratings', lambda cursor, rows: None)
+    invalidate_responses('product:5')
+
+    for _ in range(2):
+        with app.app.test_request_context('/products/5'):
+            assert products.get_product(product_id=5).get_json()['name'] == 'Desk'
+    assert conn.opened == 1
+
+    products.invalidate_listing(5)
+    with app.app.test_request_context('/products/5'):
+        products.get_product(product_id=5)
+    assert conn.opened == 2
+
+    # A review for the seller also refreshes the page's rating
+    invalidate_responses('seller:9')
+    with app.app.test_request_context('/products/5'):
+        products.get_product(product_id=5)
+    assert conn.opened == 3
+
+
+class SearchCursor:
+    """Serves PRODUCTS newest first, honouring the keyset cursor and LIMIT"""
+
+    PRODUCTS = [{'product_id': i, 'user_id': 9, 'created_at': 100, 'name': f'Item {i}'} for i in (3, 2, 1)]
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.conn.queries += 1
+        rows = self.PRODUCTS
+        if 'p.product_id <' in query:
+            rows = [row for row in rows if row['product_id'] < params[-2]]
+        self.rows = [dict(row) for row in rows[:params[-1]]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class SearchConn:
+    queries = 0
+
+    def cursor(self, dictionary=False):
+        return SearchCursor(self)
+
+    def close(self):
+        pass
+
+
+def test_cached_search_pages_keep_their_next_cursor(monkeypatch):
+    conn = SearchConn()
+    monkeypatch.setattr(products, 'get_db_connection', lambda: conn)
+    monkeypatch.setattr(products, 'attach_images', lambda cursor, rows: None)
+    monkeypatch.setattr(products, 'attach_seller_ratings', lambda cursor, rows: None)
+    invalidate_responses('search')
+
+    def walk():
+        pages, cache_status, cursor = [], [], None
+        while True:
+            path = '/products/search?limit=1' + (f'&cursor={cursor}' if cursor else '')
+            with app.app.test_request_context(path):
+                response = products.search_products()
+            pages.append([row['product_id'] for row in response.get_json()])
+            cache_status.append(response.headers['X-Cache'])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return pages, cache_status
+
+    assert walk() == ([[3], [2], [1]], ['MISS'] * 3)
+    assert walk() == ([[3], [2], [1]], ['HIT'] * 3)
+    assert conn.queries == 3
+
+
+def test_hit_replays_stored_headers():
+    flask_app = Flask(__name__)
+    cache = ResponseCache(MemoryBackend())
+
+    @flask_app.route('/tagged')
+    @cache.cached('tagged')
+    def tagged():
+        response = jsonify([])
+        response.headers['ETag'] = '"abc"'
+        response.headers['Cache-Control'] = 'public, max-age=30'
+        response.set_cookie('session', 'secret')
+        return response
+
+    client = flask_app.test_client()
+    client.get('/tagged')
+    hit = client.get('/tagged')
+    assert hit.headers['X-Cache'] == 'HIT'
+    assert hit.headers['ETag'] == '"abc"' and hit.headers['Cache-Control'] == 'public, max-age=30'
+    assert 'Set-Cookie' not in hit.headers
+    assert hit.headers.getlist('X-Cache') == ['HIT']
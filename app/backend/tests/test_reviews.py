@@ -0,0 +1,52 @@
+# testing that a review and the seller's running totals get the same rating
+
+import pytest
+
+import app  # noqa: F401  (reviews must be imported through the app, not first)
+import reviews
+
+
+@pytest.mark.parametrize('value, expected', [
+    (4, 4), ('5', 5), (3.0, 3), (' 2 ', 2),
+    (4.6, None), ('4.6', None), (0, None), (6, None), (True, None), ('four', None), (None, None),
+])
+def test_parse_rating(value, expected):
+    assert reviews.parse_rating(value) == expected
+
+
+class ReviewConn:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=None):
+        self.executed.append(params)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def post_review(monkeypatch, rating):
+    conn = ReviewConn()
+    monkeypatch.setattr(reviews, 'get_db_connection', lambda: conn)
+    body = {'seller_id': 9, 'rating': rating, 'comment': 'ok'}
+    with app.app.test_request_context(method='POST', json=body):
+        response = app.app.make_response(reviews.create_review.__wrapped__({'user_id': 1}))
+    return conn, response
+
+
+def test_review_and_seller_stats_store_the_same_rating(monkeypatch):
+    conn, response = post_review(monkeypatch, '4')
+    assert response.status_code == 201
+    assert conn.executed == [(9, 4, 'ok'), (9, 4)]
+
+
+def test_fractional_ratings_are_rejected(monkeypatch):
+    conn, response = post_review(monkeypatch, 4.6)
+    assert response.status_code == 400
+    assert conn.executed == []
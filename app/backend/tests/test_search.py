@@ -0,0 +1,17 @@
+# testing how search terms are turned into FULLTEXT boolean queries
+
+import app  # noqa: F401  (products must be imported through the app, not first)
+from products import fulltext_query
+
+
+def test_every_word_is_a_required_prefix():
+    assert fulltext_query('MacBook Pro') == '+macbook* +pro*'
+
+
+def test_boolean_operators_are_stripped():
+    assert fulltext_query('-iphone +"case" (cheap)*') == '+iphone* +case* +cheap*'
+
+
+def test_short_words_are_dropped():
+    assert fulltext_query('tv') == ''
+    assert fulltext_query('4k tv monitor') == '+monitor*'
@@ -0,0 +1,93 @@
+# testing that uploads are streamed to disk with a size cap and atomic rename, and removed with their product
+
+import io
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import app  # noqa: F401  (products must be imported through the app, not first)
+import products
+
+
+def jpeg_upload(name='photo.jpg', padding=0):
+    data = io.BytesIO()
+    Image.new('RGB', (32, 32), (10, 120, 200)).save(data, 'JPEG')
+    data.write(b'\0' * padding)
+    data.seek(0)
+    return FileStorage(stream=data, filename=name)
+
+
+@pytest.fixture()
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(products, 'UPLOAD_FOLDER', str(tmp_path))
+    return tmp_path
+
+
+def test_saved_under_a_unique_name(upload_dir):
+    filename = products.save_upload(jpeg_upload('my photo.jpg'))
+    assert filename.endswith('_my_photo.jpg')
+    assert [p.name for p in upload_dir.iterdir()] == [filename]
+
+
+def test_oversized_files_leave_nothing_behind(upload_dir, monkeypatch):
+    monkeypatch.setattr(products, 'MAX_IMAGE_BYTES', 4096)
+    monkeypatch.setattr(products, 'UPLOAD_CHUNK_SIZE', 1024)
+    with pytest.raises(products.UploadRejected) as rejected:
+        products.save_upload(jpeg_upload(padding=8192))
+    assert rejected.value.status == 413
+    assert list(upload_dir.iterdir()) == []
+
+
+def test_non_images_are_rejected(upload_dir):
+    upload = FileStorage(stream=io.BytesIO(b'#!/bin/sh\necho hi\n'), filename='evil.jpg')
+    with pytest.raises(products.UploadRejected) as rejected:
+        products.save_upload(upload)
+    assert rejected.value.status == 400
+    assert list(upload_dir.iterdir()) == []
+
+
+class DeleteCursor:
+    def __init__(self, filenames):
+        self.filenames = filenames
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self.rowcount = 1 if query.startswith('DELETE') else 0
+
+    def fetchone(self):
+        return (5,)
+
+    def fetchall(self):
+        return [(name,) for name in self.filenames]
+
+    def close(self):
+        pass
+
+
+class DeleteConn:
+    def __init__(self, cursor):
+        self.cursor_ = cursor
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_deleting_a_product_removes_its_files(upload_dir, monkeypatch):
+    filename = products.save_upload(jpeg_upload())
+    stem = filename.rsplit('.', 1)[0]
+    for variant in (f'{stem}.thumb.jpg', f'{stem}.card.webp'):
+        (upload_dir / variant).write_bytes(b'x')
+    (upload_dir / 'other.jpg').write_bytes(b'x')
+    monkeypatch.setattr(products, 'get_db_connection', lambda: DeleteConn(DeleteCursor([filename])))
+
+    with app.app.test_request_context(method='DELETE'):
+        response = app.app.make_response(products.delete_product.__wrapped__({'user_id': 5}, 12))
+    assert response.status_code == 200
+    assert [p.name for p in upload_dir.iterdir()] == ['other.jpg']
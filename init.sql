@@ -39,15 +39,18 @@ CREATE TABLE IF NOT EXISTS products (
     status ENUM('active', 'sold', 'deleted') DEFAULT 'active',
     approval_status ENUM('pending', 'approved', 'rejected') DEFAULT 'pending',
     FOREIGN KEY (user_id) REFERENCES users(user_id),
-    FOREIGN KEY (category_id) REFERENCES categories(category_id)
+    FOREIGN KEY (category_id) REFERENCES categories(category_id),
+    FULLTEXT KEY ft_products_name_description (name, description)
 );
 
 CREATE TABLE IF NOT EXISTS product_images (
     image_id INT AUTO_INCREMENT PRIMARY KEY,
     product_id INT NOT NULL,
     image_url VARCHAR(255) NOT NULL,
+    filename VARCHAR(255) NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE
+    FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_product_images_filename (filename)
 );
 
 CREATE TABLE IF NOT EXISTS reviews (
@@ -59,6 +62,23 @@ CREATE TABLE IF NOT EXISTS reviews (
     FOREIGN KEY (seller_id) REFERENCES users(user_id)
 );
 
+-- Running rating totals per seller, kept in step with reviews by
+-- reviews.create_review and rebuilt with `flask reviews rebuild-seller-stats`
+CREATE TABLE IF NOT EXISTS seller_stats (
+    seller_id INT PRIMARY KEY,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (seller_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Approved, active listings per category, kept in step with products by the
+-- listing handlers and rebuilt with `flask products rebuild-category-stats`
+CREATE TABLE IF NOT EXISTS category_stats (
+    category_id INT PRIMARY KEY,
+    active_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (category_id) REFERENCES categories(category_id) ON DELETE CASCADE
+);
+
 CREATE TABLE IF NOT EXISTS conversations (
     conversation_id INT AUTO_INCREMENT PRIMARY KEY,
     product_id INT NOT NULL,
@@ -67,6 +87,10 @@ CREATE TABLE IF NOT EXISTS conversations (
     last_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     status ENUM('active', 'archived', 'completed') DEFAULT 'active',
     meeting_details TEXT NULL,
+    -- Inbox summary maintained by messaging.record_message
+    last_message_id INT NULL,
+    last_message_at TIMESTAMP NULL,
+    message_count INT NOT NULL DEFAULT 0,
     FOREIGN KEY (product_id) REFERENCES products(product_id)
 );
 
@@ -76,6 +100,7 @@ CREATE TABLE IF NOT EXISTS conversation_participants (
     user_id INT NOT NULL,
     role ENUM('buyer', 'seller') NOT NULL,
     last_read_at TIMESTAMP NULL,
+    unread_count INT NOT NULL DEFAULT 0,
     FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id),
     FOREIGN KEY (user_id) REFERENCES users(user_id),
     UNIQUE KEY unique_participant (conversation_id, user_id)
@@ -90,7 +115,8 @@ CREATE TABLE IF NOT EXISTS messages (
     attachment_url VARCHAR(255) NULL,
     message_type ENUM('text', 'reminder_proposal', 'reminder_update', 'system') DEFAULT 'text',
     FOREIGN KEY (conversation_id) REFERENCES conversations(conversation_id),
-    FOREIGN KEY (sender_id) REFERENCES users(user_id)
+    FOREIGN KEY (sender_id) REFERENCES users(user_id),
+    KEY idx_messages_conversation (conversation_id, message_id)
 );
 
 CREATE TABLE IF NOT EXISTS wishlist_tracking (
@@ -117,6 +143,20 @@ CREATE TABLE IF NOT EXISTS user_reports (
     FOREIGN KEY (reported_user_id) REFERENCES users(user_id)
 );
 
+CREATE TABLE IF NOT EXISTS background_jobs (
+    job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(64) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('queued', 'running', 'succeeded', 'failed') DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_error VARCHAR(1000) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    KEY idx_background_jobs_due (status, run_after)
+);
+
 CREATE USER IF NOT EXISTS 'csc648user'@'%' IDENTIFIED BY 'Csc648_P@ss!';
 GRANT ALL PRIVILEGES ON gator_market.* TO 'csc648user'@'%';
 FLUSH PRIVILEGES;
@@ -185,6 +225,16 @@ INSERT INTO reviews (seller_id, rating, comment, created_at) VALUES
 (1, 5, 'Product exactly as described. Thank you!', NOW()),
 (1, 3, 'Item was fine, but shipping was delayed.', NOW());
 
+INSERT INTO seller_stats (seller_id, rating_sum, rating_count)
+SELECT seller_id, SUM(rating), COUNT(*) FROM reviews GROUP BY seller_id;
+
+INSERT INTO category_stats (category_id, active_count)
+SELECT c.category_id, COUNT(p.product_id)
+FROM categories c
+LEFT JOIN products p ON p.category_id = c.category_id
+    AND p.approval_status = 'approved' AND p.status = 'active'
+GROUP BY c.category_id;
+
 INSERT INTO conversations (product_id, subject, status)
 SELECT 1, 'Interested in your product', 'active' FROM products WHERE product_id = 1 LIMIT 1;
 
@@ -197,4 +247,14 @@ FROM conversations WHERE conversation_id = 1 LIMIT 1;
 
 INSERT INTO messages (conversation_id, sender_id, message_text)
 SELECT 1, (SELECT user_id FROM users WHERE user_id != 1 LIMIT 1), 'Hi, I am interested in your product. Is it still available?'
-FROM conversations WHERE conversation_id = 1 LIMIT 1;
\ No newline at end of file
+FROM conversations WHERE conversation_id = 1 LIMIT 1;
+
+UPDATE conversations c
+JOIN messages m ON m.conversation_id = c.conversation_id
+SET c.last_message_id = m.message_id, c.last_message_at = m.sent_at, c.message_count = 1
+WHERE c.conversation_id = 1;
+
+UPDATE conversation_participants cp
+JOIN messages m ON m.conversation_id = cp.conversation_id AND m.sender_id != cp.user_id
+SET cp.unread_count = 1
+WHERE cp.conversation_id = 1;
\ No newline at end of file